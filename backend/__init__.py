@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Se carga antes que cualquier submódulo: varios leen su configuración del entorno al importarse.
+load_dotenv()
@@ -0,0 +1,252 @@
+"""
+Control de admisión por tenant (access_id, poc_id): cuota de concurrencia, reparto justo ponderado entre
+tenants y rechazo temprano cuando el costo estimado supera los créditos que le quedan.
+
+Un batch grande de un usuario ya no ocupa todos los slots: cada tenant tiene como máximo
+``ADMISSION_TENANT_CONCURRENCY`` trabajos en curso y los slots libres se asignan por weighted fair queuing
+(tag de fin virtual = inicio + costo / peso, al estilo SCFQ), así que las solicitudes de otros tenants pasan
+delante de la cola del batch.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from math import ceil
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from . import document_store, services, telemetry
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Trabajos en curso en total (OCR + OpenAI) y por tenant.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+ADMISSION_TENANT_CONCURRENCY = int(os.getenv("ADMISSION_TENANT_CONCURRENCY", "2"))
+# Pesos por access_id (JSON, p. ej. {"Usuario_IDP": 2}); el resto pesa 1.
+ADMISSION_TENANT_WEIGHTS: Dict[str, float] = {
+    k: float(v) for k, v in json.loads(os.getenv("ADMISSION_TENANT_WEIGHTS", "{}")).items()
+}
+# Segundos que se confía en el saldo leído de la base de auth antes de volver a consultarlo.
+ADMISSION_BALANCE_TTL_SECONDS = float(os.getenv("ADMISSION_BALANCE_TTL_SECONDS", "30"))
+# Sin identidad se rechaza (401) o se agrupa en un tenant anónimo, con la cuota de un tenant y sin chequeo de saldo.
+ADMISSION_REQUIRE_IDENTITY = os.getenv("ADMISSION_REQUIRE_IDENTITY", "false").lower() in ("1", "true", "yes")
+# Páginas supuestas por byte cuando el archivo no es un PDF legible.
+ADMISSION_BYTES_PER_PAGE = int(os.getenv("ADMISSION_BYTES_PER_PAGE", str(100 * 1024)))
+
+ADMITTED = telemetry.counter("idp_admission_admitted_total", "Trabajos admitidos por operación.")
+REJECTED = telemetry.counter("idp_admission_rejected_total", "Solicitudes rechazadas por operación y motivo.")
+WAIT_SECONDS = telemetry.histogram("idp_admission_wait_seconds", "Espera en la cola de admisión por operación.")
+QUEUED = telemetry.gauge("idp_admission_queued", "Trabajos esperando un slot.")
+RUNNING = telemetry.gauge("idp_admission_running", "Trabajos con slot asignado.")
+
+
+@dataclass(frozen=True)
+class Tenant:
+    access_id: str
+    poc_id: int = 1
+
+    @property
+    def anonymous(self) -> bool:
+        return not self.access_id
+
+    @property
+    def key(self) -> str:
+        """Separa datos guardados por tenant (p. ej. el índice de similitud); vacío para el anónimo."""
+        return f"{self.access_id}:{self.poc_id}" if self.access_id else ""
+
+
+ANONYMOUS = Tenant("", 0)
+
+
+def tenant_from_request(request: Request) -> Tenant:
+    """Identidad del llamador desde los headers ``X-Access-Id`` / ``X-Poc-Id`` que envía el frontend."""
+    access_id = (request.headers.get("x-access-id") or "").strip()
+    if not access_id:
+        if ADMISSION_REQUIRE_IDENTITY:
+            raise HTTPException(status_code=401, detail="Falta el header X-Access-Id")
+        return ANONYMOUS
+    try:
+        poc_id = int(request.headers.get("x-poc-id") or 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Poc-Id debe ser un entero")
+    return Tenant(access_id, poc_id)
+
+
+def document_credits(file: BinaryIO, size: int, file_type: Optional[str], system_prompt: str) -> int:
+    """Créditos estimados de /api/process antes del OCR, a partir de la cantidad de páginas."""
+    pages = 1
+    if file_type == "application/pdf":
+        pages = document_store.pdf_page_count(file) or max(1, ceil(size / ADMISSION_BYTES_PER_PAGE))
+    return services.estimate_document_credits(pages, system_prompt)
+
+
+@dataclass
+class _Waiter:
+    tenant: Tenant
+    future: "asyncio.Future[None]"
+
+
+class FairScheduler:
+    """
+    Slots de ejecución con cuota por tenant. Cada solicitud recibe un tag de fin virtual; al liberarse un
+    slot se despacha el menor tag entre los tenants que no llegaron a su cuota. Vive en el event loop.
+    """
+
+    def __init__(self, capacity: int, tenant_limit: int, weights: Optional[Dict[str, float]] = None) -> None:
+        self.capacity = max(1, capacity)
+        self.tenant_limit = max(1, tenant_limit)
+        self.weights = weights or {}
+        self._running: Dict[Tenant, int] = {}
+        self._active = 0
+        self._queue: List[Tuple[float, int, _Waiter]] = []
+        self._last_finish: Dict[Tenant, float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+
+    def _limit(self, tenant: Tenant) -> int:
+        # Los anónimos comparten un tenant con la cuota normal: un batch sin headers no toma todos los slots.
+        return self.tenant_limit
+
+    async def acquire(self, tenant: Tenant, cost: float) -> None:
+        weight = self.weights.get(tenant.access_id, 1.0)
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        tag = start + max(cost, 1.0) / weight
+        self._last_finish[tenant] = tag
+        waiter = _Waiter(tenant, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (tag, next(self._seq), waiter))
+        QUEUED.inc()
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(tenant)  # el slot llegó justo cuando se canceló la espera
+            else:
+                waiter.future.cancel()
+                QUEUED.dec()
+            raise
+
+    def release(self, tenant: Tenant) -> None:
+        self._active -= 1
+        self._running[tenant] -= 1
+        if not self._running[tenant]:
+            del self._running[tenant]
+        RUNNING.dec()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        blocked: List[Tuple[float, int, _Waiter]] = []
+        while self._queue and self._active < self.capacity:
+            entry = heapq.heappop(self._queue)
+            tag, _, waiter = entry
+            if waiter.future.done():
+                continue
+            if self._running.get(waiter.tenant, 0) >= self._limit(waiter.tenant):
+                blocked.append(entry)
+                continue
+            self._active += 1
+            self._running[waiter.tenant] = self._running.get(waiter.tenant, 0) + 1
+            self._virtual_time = max(self._virtual_time, tag)
+            QUEUED.dec()
+            RUNNING.inc()
+            waiter.future.set_result(None)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    @asynccontextmanager
+    async def slot(self, tenant: Tenant, cost: float, operation: str) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        await self.acquire(tenant, cost)
+        WAIT_SECONDS.observe(time.perf_counter() - start, operation=operation)
+        ADMITTED.inc(operation=operation)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+
+class BalanceLedger:
+    """
+    Saldo de créditos por tenant (cacheado ``ADMISSION_BALANCE_TTL_SECONDS``) menos lo reservado por
+    trabajos en curso. El consumo real lo sigue registrando /api/auth/consume.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._balances: Dict[Tenant, Tuple[float, int]] = {}
+        self._reserved: Dict[Tenant, int] = {}
+
+    def update(self, tenant: Tenant, remaining: int) -> None:
+        self._balances[tenant] = (time.monotonic(), int(remaining))
+
+    async def _remaining(self, tenant: Tenant) -> int:
+        cached = self._balances.get(tenant)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        info = await run_in_threadpool(services.validate_login, tenant.access_id, tenant.poc_id)
+        self.update(tenant, info["tokens_remaining"] or 0)
+        return self._balances[tenant][1]
+
+    @asynccontextmanager
+    async def reserve(self, tenant: Tenant, credits: int, operation: str) -> AsyncIterator[None]:
+        if tenant.anonymous:
+            yield
+            return
+        available = await self._remaining(tenant) - self._reserved.get(tenant, 0)
+        if credits > available:
+            REJECTED.inc(operation=operation, reason="balance")
+            raise HTTPException(
+                status_code=402,
+                detail=f"Créditos insuficientes: la operación requiere ~{credits} y hay {max(0, available)} disponibles",
+            )
+        self._reserved[tenant] = self._reserved.get(tenant, 0) + credits
+        try:
+            yield
+        finally:
+            self._reserved[tenant] -= credits
+            if not self._reserved[tenant]:
+                del self._reserved[tenant]
+
+
+_scheduler = FairScheduler(ADMISSION_MAX_CONCURRENCY, ADMISSION_TENANT_CONCURRENCY, ADMISSION_TENANT_WEIGHTS)
+_ledger = BalanceLedger(ADMISSION_BALANCE_TTL_SECONDS)
+
+
+def update_balance(tenant: Tenant, remaining: int) -> None:
+    """Refresca el saldo cacheado después de un login o un consumo."""
+    if not tenant.anonymous:
+        _ledger.update(tenant, remaining)
+
+
+@asynccontextmanager
+async def reserve(tenant: Tenant, credits: int, operation: str) -> AsyncIterator[None]:
+    """Chequeo previo de saldo: 402 si ``credits`` supera lo disponible, antes de gastar OCR u OpenAI."""
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    async with _ledger.reserve(tenant, credits, operation):
+        yield
+
+
+async def run(operation: str, tenant: Tenant, cost: float, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Ejecuta ``func`` cuando el scheduler le da un slot al tenant (sin admisión, de inmediato). Corre en el
+    threadpool (las corrutinas, en un loop propio): ``process_document`` hace llamadas bloqueantes y en el loop
+    principal frenaría a los demás.
+    """
+    if not ADMISSION_ENABLED:
+        return await _in_threadpool(func, *args, **kwargs)
+    async with _scheduler.slot(tenant, cost, operation):
+        return await _in_threadpool(func, *args, **kwargs)
+
+
+async def _in_threadpool(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    if asyncio.iscoroutinefunction(func):
+        return await run_in_threadpool(lambda: asyncio.run(func(*args, **kwargs)))
+    return await run_in_threadpool(func, *args, **kwargs)
@@ -0,0 +1,113 @@
+"""Respuestas locales (sin LLM) para resultados SQL escalares, de una fila o tablas chicas."""
+
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional
+
+from . import telemetry
+
+LOCAL_ANSWER_ENABLED = os.getenv("LOCAL_ANSWER_ENABLED", "true").lower() in ("1", "true", "yes")
+LOCAL_ANSWER_MAX_ROWS = int(os.getenv("LOCAL_ANSWER_MAX_ROWS", "15"))
+LOCAL_ANSWER_MAX_COLUMNS = int(os.getenv("LOCAL_ANSWER_MAX_COLUMNS", "6"))
+
+LOCAL_ANSWERS = telemetry.counter(
+    "idp_sql_local_answers_total", "Respuestas de chat con base de datos por origen (local/llm) y forma del resultado."
+)
+
+# Preguntas que piden interpretación en lugar de datos: se derivan siempre al LLM.
+_NEEDS_REASONING = re.compile(
+    r"\b(por ?qu[eé]|explica|explain|why|compar|resum|summar|tendencia|trend|analiz|analy|recomiend|recommend"
+    r"|porque|explique|tend[eê]ncia|an[aá]lise)",
+    re.IGNORECASE,
+)
+
+_LANGUAGE_HINTS = {
+    "en": {"what", "how", "many", "which", "the", "is", "are", "of", "show", "list", "total", "average", "who"},
+    "pt": {"quantos", "quantas", "qual", "quais", "são", "não", "contratos", "média", "mostre", "liste", "do", "da"},
+    "es": {"cuántos", "cuantos", "cuál", "cual", "cuáles", "cuales", "qué", "que", "los", "las", "del", "promedio"},
+}
+
+_LANGUAGE_NAMES = {"english": "en", "spanish": "es", "español": "es", "portuguese": "pt", "português": "pt"}
+
+TEMPLATES = {
+    "es": {
+        "empty": "No se encontraron registros para la consulta.",
+        "scalar": "El resultado es **{value}** ({column}).",
+        "row": "Se encontró un registro:",
+        "table": "Se encontraron {count} registros:",
+    },
+    "en": {
+        "empty": "No records matched the query.",
+        "scalar": "The result is **{value}** ({column}).",
+        "row": "One record was found:",
+        "table": "{count} records were found:",
+    },
+    "pt": {
+        "empty": "Nenhum registro encontrado para a consulta.",
+        "scalar": "O resultado é **{value}** ({column}).",
+        "row": "Foi encontrado um registro:",
+        "table": "Foram encontrados {count} registros:",
+    },
+}
+
+
+def detect_language(question: str, default: str = "es") -> str:
+    """Heurística por palabras frecuentes; alcanza para elegir la plantilla de la respuesta."""
+    words = set(re.findall(r"[a-záéíóúâêôãõç]+", question.lower()))
+    scores = {language: len(words & hints) for language, hints in _LANGUAGE_HINTS.items()}
+    best = max(scores, key=lambda language: scores[language])
+    return best if scores[best] > scores.get(default, 0) else default
+
+
+def _format_value(value: Any) -> str:
+    if hasattr(value, "item") and not isinstance(value, (datetime, date)):
+        value = value.item()  # escalares de numpy
+    if value is None or value != value:  # NaN / NaT
+        return "—"
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, Decimal)) and value == int(value):
+        return f"{int(value):,}"
+    if isinstance(value, (float, Decimal)):
+        return f"{float(value):,.2f}"
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat(" ", "minutes")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def format_locally(
+    columns: List[str], rows: List[List[Any]], question: str, language: Optional[str] = None
+) -> Optional[str]:
+    """
+    Redacta la respuesta sin LLM cuando el resultado es vacío, escalar, una fila o una tabla chica.
+    Devuelve None si el resultado es grande o la pregunta pide interpretación.
+    """
+    if not LOCAL_ANSWER_ENABLED or _NEEDS_REASONING.search(question):
+        return None
+    # Una sola fila se lista campo por campo; el límite de columnas solo aplica a tablas.
+    if len(rows) > LOCAL_ANSWER_MAX_ROWS or (len(rows) > 1 and len(columns) > LOCAL_ANSWER_MAX_COLUMNS):
+        return None
+    language = _LANGUAGE_NAMES.get((language or "").lower(), language)
+    templates = TEMPLATES[language if language in TEMPLATES else detect_language(question)]
+
+    if not rows:
+        return templates["empty"]
+    if len(rows) == 1 and len(columns) == 1:
+        return templates["scalar"].format(value=_format_value(rows[0][0]), column=columns[0])
+    if len(rows) == 1:
+        lines = [f"- **{column}**: {_format_value(value)}" for column, value in zip(columns, rows[0])]
+        return "\n".join([templates["row"], *lines])
+    lines = [f"- {' · '.join(_format_value(value) for value in row)}" for row in rows]
+    return "\n".join([templates["table"].format(count=len(rows)), f"({' · '.join(columns)})", *lines])
+
+
+def result_shape(row_count: int, column_count: int) -> str:
+    if row_count == 0:
+        return "empty"
+    if row_count == 1:
+        return "scalar" if column_count == 1 else "row"
+    return "table" if row_count <= LOCAL_ANSWER_MAX_ROWS else "large"
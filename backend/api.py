@@ -1,10 +1,14 @@
+import json
+import time
 from typing import Any, Dict, List, Optional
 
-from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from . import services
+from . import admission, payloads, profiling, services, singleflight, tabular, telemetry, validation
+from .uploads import RequestSizeLimitMiddleware, spool_upload
 from pydantic import BaseModel
 
 app = FastAPI(title="IDP Streamlit Migration API", version="1.0.0")
@@ -15,13 +19,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
+app.add_middleware(RequestSizeLimitMiddleware)
+app.add_middleware(payloads.CompressionMiddleware)
 
 
-async def _read_uploaded_file(upload_file: UploadFile) -> bytes:
-    contents = await upload_file.read()
-    upload_file.file.seek(0)
-    return contents
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    token = telemetry.begin_request()
+    telemetry.HTTP_INFLIGHT.inc()
+    profile = profiling.start(request.headers) if profiling.PROFILING_ENABLED else None
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+    finally:
+        telemetry.HTTP_INFLIGHT.dec()
+        timings = telemetry.end_request(token)
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        if profiling.PROFILING_ENABLED:
+            status = response.status_code if response is not None else 500
+            if profile is not None:
+                # Detener el muestreo y escribir el .folded bloquea: fuera del event loop.
+                await run_in_threadpool(profiling.finish, profile, request.method, route, status, elapsed, timings)
+            else:
+                profiling.finish(profile, request.method, route, status, elapsed, timings)
+    telemetry.HTTP_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    response.headers["Server-Timing"] = telemetry.server_timing_header(timings, total=elapsed)
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    return response
 
 
 @app.get("/api/status")
@@ -30,37 +59,94 @@ async def status() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/debug/requests")
+async def debug_requests(request: Request) -> Dict[str, Any]:
+    """Solicitudes lentas y perfiladas recientes por etapa (requiere PROFILING_ENABLED y PROFILING_TOKEN)."""
+    if not profiling.PROFILING_ENABLED or not profiling.PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Se requiere el header X-Profile")
+    return {
+        "slow_request_seconds": profiling.PROFILING_SLOW_REQUEST_SECONDS,
+        "requests": profiling.recent_requests(),
+    }
+
+
 @app.get("/api/warmup")
 @app.get("/warmup", include_in_schema=False)
 async def warmup() -> Dict[str, Any]:
     """Endpoint para despertar las bases de datos proactivamente."""
-    return services.warmup_databases()
+    # Cuando varios usuarios abren la app a la vez, todos esperan el mismo warmup.
+    return await singleflight.run("warmup", "databases", services.warmup_databases)
 
 
 @app.post("/api/process")
 @app.post("/process", include_in_schema=False)
 async def process_document(
+    request: Request,
     file: UploadFile = File(...),
     custom_prompt: Optional[str] = Form(default=None),
     language: str = Form(default="English"),
+    reuse_near_duplicates: bool = Form(default=False),
+    batch_id: Optional[str] = Form(default=None),
+    text_format: str = Form(default=payloads.TEXT_FORMAT_LINES),
 ) -> Dict[str, Any]:
-    file_bytes = await _read_uploaded_file(file)
+    if text_format not in payloads.TEXT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"text_format debe ser uno de: {', '.join(payloads.TEXT_FORMATS)}")
+    tenant = admission.tenant_from_request(request)
+    upload = await spool_upload(file)
+    # Doble clic o varios revisores subiendo el mismo archivo: una sola pasada de OCR y extracción.
+    key = singleflight.content_key(
+        upload.sha256, file.content_type, custom_prompt, language, reuse_near_duplicates, batch_id, tenant.key
+    )
+    system_prompt = custom_prompt or services.SYSTEM_PROMPTS.get(language, services.SYSTEM_PROMPT_DEFAULT)
 
+    # Una vez en singleflight, el spool lo cierra ``cleanup``; antes de eso (p. ej. un 429), se cierra acá.
+    handed_off = False
     try:
-        openai_response, metrics, extracted_text = await services.process_document(
-            file_bytes=file_bytes,
-            file_type=file.content_type,
-            file_name=file.filename,
-            custom_prompt=custom_prompt,
-            language=language,
+        # Contar las páginas parsea el PDF (hasta el tamaño máximo de subida): fuera del event loop.
+        credits = await run_in_threadpool(
+            admission.document_credits, upload.file, upload.size, file.content_type, system_prompt
         )
+        async with admission.reserve(tenant, credits, "process"):
+            handed_off = True
+            openai_response, metrics, extracted_text = await singleflight.run(
+                "process",
+                key,
+                admission.run,
+                "process",
+                tenant,
+                credits,
+                services.process_document,
+                file_bytes=upload.file,
+                file_type=file.content_type,
+                file_name=file.filename,
+                custom_prompt=custom_prompt,
+                language=language,
+                content_hash=upload.sha256,
+                reuse_near_duplicates=reuse_near_duplicates,
+                batch_id=batch_id,
+                tenant_key=tenant.key,
+                cleanup=upload.close,
+            )
+    except HTTPException:
+        raise
     except Exception as exc:  # pragma: no cover - external service
         raise HTTPException(status_code=500, detail=str(exc))
+    finally:
+        if not handed_off:
+            upload.close()
 
     return {
         "openai_response": openai_response,
         "metrics": metrics,
-        "extracted_text": extracted_text,
+        "extracted_text": payloads.encode_text(extracted_text, text_format),
         "file_name": file.filename,
         "language": language,
     }
@@ -68,14 +154,23 @@ async def process_document(
 
 @app.post("/api/chat/document")
 @app.post("/chat/document", include_in_schema=False)
-async def chat_document(payload: Dict[str, Any]) -> Dict[str, str]:
-    extracted_text = payload.get("extracted_text")
+async def chat_document(request: Request, payload: Dict[str, Any]) -> Dict[str, str]:
     question = payload.get("question")
+    try:
+        extracted_text = payloads.expand_lines(payload.get("extracted_text"))
+    except (KeyError, TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=f"extracted_text inválido: {exc}")
     if not extracted_text or not question:
         raise HTTPException(status_code=400, detail="extracted_text and question are required")
 
+    tenant = admission.tenant_from_request(request)
     try:
-        answer = services.chat_with_document(extracted_text, question)
+        async with admission.reserve(tenant, 1, "chat_document"):
+            answer = await admission.run(
+                "chat_document", tenant, 1, services.chat_with_document, extracted_text, question
+            )
+    except HTTPException:
+        raise
     except Exception as exc:  # pragma: no cover - external service
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -84,13 +179,26 @@ async def chat_document(payload: Dict[str, Any]) -> Dict[str, str]:
 
 @app.post("/api/chat/database")
 @app.post("/chat/database", include_in_schema=False)
-async def chat_database(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def chat_database(request: Request, payload: Dict[str, Any]) -> Dict[str, Any]:
     question = payload.get("question")
     if not question:
         raise HTTPException(status_code=400, detail="question is required")
 
+    language = payload.get("language")
+    tenant = admission.tenant_from_request(request)
     try:
-        result = services.chat_with_database_sql(question)
+        async with admission.reserve(tenant, 1, "chat_database"):
+            result = await singleflight.run(
+                "chat_database",
+                singleflight.content_key(" ".join(question.split()), language),
+                admission.run,
+                "chat_database",
+                tenant,
+                1,
+                services.chat_with_database_sql,
+                question,
+                language=language,
+            )
     except HTTPException:
         raise
     except Exception as exc:  # pragma: no cover - external service
@@ -99,6 +207,48 @@ async def chat_database(payload: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
+@app.post("/api/chat/spreadsheet")
+@app.post("/chat/spreadsheet", include_in_schema=False)
+async def chat_spreadsheet(
+    request: Request,
+    question: str = Form(...),
+    file: Optional[UploadFile] = File(default=None),
+    table_id: Optional[str] = Form(default=None),
+    language: Optional[str] = Form(default=None),
+) -> Dict[str, Any]:
+    """
+    Pregunta sobre una planilla CSV/Excel. La primera vez se sube el archivo; la respuesta trae ``table.table_id``
+    (el hash del contenido) para preguntar de nuevo sin subirlo mientras siga en el caché.
+    """
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="question is required")
+    if file is not None:
+        upload = await spool_upload(file)
+        try:
+            table = await run_in_threadpool(services.spreadsheet_table, upload)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        finally:
+            upload.close()
+    elif table_id:
+        table = tabular.cached(table_id)
+        if table is None:
+            raise HTTPException(status_code=404, detail="La planilla ya no está en caché; súbela de nuevo.")
+    else:
+        raise HTTPException(status_code=400, detail="file o table_id es requerido")
+
+    tenant = admission.tenant_from_request(request)
+    try:
+        async with admission.reserve(tenant, 1, "chat_spreadsheet"):
+            return await admission.run(
+                "chat_spreadsheet", tenant, 1, services.chat_with_spreadsheet, table, question, language=language
+            )
+    except HTTPException:
+        raise
+    except Exception as exc:  # pragma: no cover - external service
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
 @app.post("/api/auth/login")
 @app.post("/auth/login", include_in_schema=False)
 async def auth_login(payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -106,7 +256,9 @@ async def auth_login(payload: Dict[str, Any]) -> Dict[str, Any]:
     poc_id = payload.get("poc_id", 1)
     if not access_id:
         raise HTTPException(status_code=400, detail="access_id is required")
-    return services.validate_login(access_id, poc_id)
+    result = services.validate_login(access_id, poc_id)
+    admission.update_balance(admission.Tenant(access_id, int(poc_id)), result["tokens_remaining"])
+    return result
 
 
 @app.post("/api/auth/consume")
@@ -117,7 +269,9 @@ async def auth_consume(payload: Dict[str, Any]) -> Dict[str, Any]:
     tokens = payload.get("tokens", 1)
     if not access_id:
         raise HTTPException(status_code=400, detail="access_id is required")
-    return services.consume_tokens(access_id, poc_id, tokens)
+    result = services.consume_tokens(access_id, poc_id, tokens)
+    admission.update_balance(admission.Tenant(access_id, int(poc_id)), result["tokens_remaining"])
+    return result
 
 
 class TokenRequest(BaseModel):
@@ -150,7 +304,16 @@ async def request_specialist(payload: SpecialistRequest) -> Dict[str, str]:
 
 @app.post("/api/charts")
 @app.post("/charts", include_in_schema=False)
-async def generate_chart(payload: Dict[str, str]) -> Dict[str, Any]:
+async def generate_chart(payload: Dict[str, Any]) -> Dict[str, Any]:
+    chart = payload.get("chart")
+    if isinstance(chart, dict):
+        # Especificación ya estructurada (p. ej. de /api/compare): se dibuja localmente, sin modelo.
+        try:
+            encoded = await run_in_threadpool(services.render_chart_spec, chart)
+        except (ValueError, TypeError, KeyError) as exc:
+            raise HTTPException(status_code=400, detail=f"chart inválido: {exc}")
+        return {"image": encoded, "description": chart.get("title") or "Chart generated successfully."}
+
     prompt = payload.get("prompt", "")
     if not prompt:
         raise HTTPException(status_code=400, detail="prompt is required")
@@ -164,6 +327,48 @@ async def generate_chart(payload: Dict[str, str]) -> Dict[str, Any]:
     return {"image": encoded, "description": description}
 
 
+@app.post("/api/compare")
+@app.post("/compare", include_in_schema=False)
+async def compare_documents(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Compara localmente los contratos de varios resultados de /api/process (diferencias, vigencias, pagos)."""
+    documents = payload.get("documents")
+    if not isinstance(documents, list) or len(documents) < 2:
+        raise HTTPException(status_code=400, detail="documents debe ser una lista de al menos dos resultados")
+    keys = payload.get("keys") or validation.DEFAULT_KEYS
+    if not isinstance(keys, (list, tuple)) or not all(isinstance(key, str) and key for key in keys):
+        raise HTTPException(status_code=400, detail="keys debe ser una lista de nombres de campo")
+    group_by = payload.get("group_by") or "Customer"
+    try:
+        return await run_in_threadpool(services.compare_documents, documents, tuple(keys), group_by)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.post("/api/validate")
+@app.post("/validate", include_in_schema=False)
+async def validate_results(
+    expected: UploadFile = File(...),
+    results: str = Form(...),
+    keys: Optional[str] = Form(default=None),
+) -> Dict[str, Any]:
+    """Cruza resultados extraídos (JSON) con el maestro de valores esperados y devuelve la matriz por campo."""
+    try:
+        rows = json.loads(results)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="results debe ser un JSON válido")
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(status_code=400, detail="results debe ser una lista de objetos")
+    key_columns = tuple(k.strip() for k in (keys or "").split(",") if k.strip()) or validation.DEFAULT_KEYS
+
+    upload = await spool_upload(expected)
+    try:
+        return await run_in_threadpool(services.validate_results, rows, upload, key_columns)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        upload.close()
+
+
 @app.post("/api/upload/db")
 @app.post("/upload/db", include_in_schema=False)
 async def upload_db_records(payload: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
@@ -0,0 +1,498 @@
+"""
+Extracción masiva fuera de línea con la Batch API de OpenAI, para backfills de contratos archivados.
+
+Toma el OCR de ``process_document`` (con ``extract=False``) o respuestas ya guardadas de /api/process,
+arma los JSONL de la Batch API con los mismos ``SYSTEM_PROMPTS`` y mensajes que la extracción interactiva,
+los sube, consulta su estado y vuelve a asociar cada resultado a su documento. Todo el estado vive en
+``BULK_STATE_DIR/<job>/``, así que un job interrumpido se retoma con ``run``.
+
+Uso:
+    python -m backend.bulk add --job backfill-2024 --input ./archivo --language English
+    python -m backend.bulk run --job backfill-2024 --wait
+    python -m backend.bulk status --job backfill-2024
+    python -m backend.bulk export --job backfill-2024 --output resultados.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import document_store, extraction_schema, routing, services, telemetry
+from .prompts import SYSTEM_PROMPTS, SYSTEM_PROMPT_DEFAULT
+
+BULK_STATE_DIR = os.getenv("BULK_STATE_DIR", "bulk_jobs")
+BULK_COMPLETION_WINDOW = os.getenv("BULK_COMPLETION_WINDOW", "24h")
+BULK_POLL_SECONDS = float(os.getenv("BULK_POLL_SECONDS", "60"))
+# Límites de un archivo de entrada de la Batch API (50.000 solicitudes, 200 MB).
+BULK_MAX_REQUESTS_PER_BATCH = int(os.getenv("BULK_MAX_REQUESTS_PER_BATCH", "50000"))
+BULK_MAX_BATCH_BYTES = int(os.getenv("BULK_MAX_BATCH_BYTES", str(190 * 1024 * 1024)))
+# Intentos por documento antes de darlo por fallido (solicitudes con error o batches vencidos).
+BULK_MAX_ATTEMPTS = int(os.getenv("BULK_MAX_ATTEMPTS", "3"))
+BULK_OCR_CONCURRENCY = int(os.getenv("BULK_OCR_CONCURRENCY", "4"))
+# OpenAI expone /v1/chat/completions; Azure OpenAI (deployments Global-Batch), /chat/completions.
+BATCH_ENDPOINT = "/v1/chat/completions" if os.getenv("OPENAI_API_KEY") else "/chat/completions"
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+_SUPPORTED_FILES = {".pdf": "application/pdf", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+BULK_DOCUMENTS = telemetry.counter("idp_bulk_documents_total", "Documentos del modo bulk por resultado.")
+BULK_TOKENS = telemetry.counter("idp_bulk_tokens_total", "Tokens consumidos por la Batch API por tipo.")
+BULK_COST = telemetry.counter("idp_bulk_cost_usd_total", "Costo estimado (USD) de la Batch API por modelo.")
+
+
+@dataclass
+class BulkDocument:
+    custom_id: str
+    document_id: str
+    file_name: str
+    prompt_key: str
+    model: str
+    validate: bool
+    status: str = "pending"  # pending -> queued -> submitted -> completed | failed
+    batch: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class BulkBatch:
+    index: int
+    model: str
+    input_file: str
+    custom_ids: List[str]
+    status: str = "written"  # written, luego el estado que informa la Batch API
+    file_id: Optional[str] = None
+    batch_id: Optional[str] = None
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    submitted: Optional[float] = None
+    finished: Optional[float] = None
+    collected: bool = False
+
+
+@dataclass
+class BulkJob:
+    """Estado de un job: ``job.json`` más ``requests.jsonl`` (cuerpos), ``batch-NNN.jsonl`` y ``results/``."""
+
+    job_id: str
+    directory: str
+    created: float = field(default_factory=time.time)
+    documents: Dict[str, BulkDocument] = field(default_factory=dict)
+    batches: List[BulkBatch] = field(default_factory=list)
+    # Archivos de entrada que no se pudieron leer u OCR-ear, con el error; se reintentan en el próximo add.
+    input_errors: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def open(cls, job_id: str, base_dir: str = BULK_STATE_DIR) -> "BulkJob":
+        directory = os.path.join(base_dir, job_id)
+        path = os.path.join(directory, "job.json")
+        if not os.path.exists(path):
+            os.makedirs(os.path.join(directory, "results"), exist_ok=True)
+            return cls(job_id, directory)
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(
+            job_id,
+            directory,
+            created=data["created"],
+            documents={key: BulkDocument(**doc) for key, doc in data["documents"].items()},
+            batches=[BulkBatch(**batch) for batch in data["batches"]],
+            input_errors=data.get("input_errors", {}),
+        )
+
+    def save(self) -> None:
+        path = os.path.join(self.directory, "job.json")
+        data = {
+            "job_id": self.job_id,
+            "created": self.created,
+            "documents": {key: asdict(doc) for key, doc in self.documents.items()},
+            "batches": [asdict(batch) for batch in self.batches],
+            "input_errors": self.input_errors,
+        }
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def add_document(
+        self,
+        document_id: str,
+        file_name: str,
+        extracted_text: List[Dict[str, Any]],
+        language: str = "English",
+        custom_prompt: Optional[str] = None,
+    ) -> Optional[BulkDocument]:
+        """Encola un documento ya procesado por OCR. Devuelve None si ya estaba en el job con el mismo prompt."""
+        system_prompt = custom_prompt or SYSTEM_PROMPTS.get(language, SYSTEM_PROMPT_DEFAULT)
+        prompt_key = document_store.prompt_key(system_prompt)
+        custom_id = f"{document_id[:32]}-{prompt_key}"
+        if custom_id in self.documents:
+            return None
+        route = routing.choose("bulk_extraction", services._estimate_tokens_fallback(extracted_text, system_prompt, {}))
+        body = {
+            "model": route.model,
+            "messages": services.extraction_messages(extracted_text, system_prompt),
+            "response_format": {"type": "json_object"},
+        }
+        line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+        with open(os.path.join(self.directory, "requests.jsonl"), "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(line, ensure_ascii=False) + "\n")
+        document = BulkDocument(
+            custom_id=custom_id,
+            document_id=document_id,
+            file_name=file_name,
+            prompt_key=prompt_key,
+            model=route.model,
+            validate=custom_prompt is None and extraction_schema.uses_schema(system_prompt),
+        )
+        self.documents[custom_id] = document
+        return document
+
+    def _request_lines(self) -> Dict[str, str]:
+        lines: Dict[str, str] = {}
+        path = os.path.join(self.directory, "requests.jsonl")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for raw in fh:
+                    if raw.strip():
+                        lines[json.loads(raw)["custom_id"]] = raw if raw.endswith("\n") else raw + "\n"
+        return lines
+
+    def write_batches(self) -> List[BulkBatch]:
+        """Agrupa los documentos pendientes en archivos de entrada (un modelo por archivo, dentro de los límites)."""
+        pending = [doc for doc in self.documents.values() if doc.status == "pending"]
+        if not pending:
+            return []
+        lines = self._request_lines()
+        by_model: Dict[str, List[BulkDocument]] = {}
+        for doc in pending:
+            by_model.setdefault(doc.model, []).append(doc)
+        written: List[BulkBatch] = []
+        for model, docs in by_model.items():
+            chunk: List[BulkDocument] = []
+            size = 0
+            for doc in docs:
+                line_size = len(lines[doc.custom_id].encode("utf-8"))
+                if chunk and (len(chunk) >= BULK_MAX_REQUESTS_PER_BATCH or size + line_size > BULK_MAX_BATCH_BYTES):
+                    written.append(self._write_batch(model, chunk, lines))
+                    chunk, size = [], 0
+                chunk.append(doc)
+                size += line_size
+            if chunk:
+                written.append(self._write_batch(model, chunk, lines))
+        self.save()
+        return written
+
+    def _write_batch(self, model: str, docs: List[BulkDocument], lines: Dict[str, str]) -> BulkBatch:
+        index = len(self.batches)
+        input_file = os.path.join(self.directory, f"batch-{index:03d}.jsonl")
+        with open(input_file, "w", encoding="utf-8") as fh:
+            fh.writelines(lines[doc.custom_id] for doc in docs)
+        batch = BulkBatch(index, model, input_file, [doc.custom_id for doc in docs])
+        self.batches.append(batch)
+        for doc in docs:
+            doc.status, doc.batch = "queued", index
+        return batch
+
+    def submit(self, client: Any) -> int:
+        """Sube y crea los batches escritos que todavía no se enviaron."""
+        submitted = 0
+        for batch in self.batches:
+            if batch.batch_id is not None:
+                continue
+            if batch.file_id is None:
+                with open(batch.input_file, "rb") as fh:
+                    batch.file_id = client.files.create(file=fh, purpose="batch").id
+                self.save()
+            created = client.batches.create(
+                input_file_id=batch.file_id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BULK_COMPLETION_WINDOW,
+                metadata={"bulk_job": self.job_id, "batch": str(batch.index)},
+            )
+            batch.batch_id, batch.status, batch.submitted = created.id, created.status, time.time()
+            for custom_id in batch.custom_ids:
+                doc = self.documents[custom_id]
+                doc.status = "submitted"
+                doc.attempts += 1
+            self.save()
+            submitted += 1
+        return submitted
+
+    def poll(self, client: Any) -> int:
+        """Actualiza el estado de los batches en curso; devuelve cuántos siguen sin terminar."""
+        running = 0
+        for batch in self.batches:
+            if batch.batch_id is None or batch.status in TERMINAL_STATUSES:
+                continue
+            remote = client.batches.retrieve(batch.batch_id)
+            batch.status = remote.status
+            batch.output_file_id = getattr(remote, "output_file_id", None)
+            batch.error_file_id = getattr(remote, "error_file_id", None)
+            if batch.status in TERMINAL_STATUSES:
+                batch.finished = time.time()
+            else:
+                running += 1
+        self.save()
+        return running
+
+    def collect(self, client: Any) -> int:
+        """Descarga los resultados de los batches terminados y los asocia a sus documentos."""
+        collected = 0
+        for batch in self.batches:
+            if batch.status not in TERMINAL_STATUSES or batch.collected:
+                continue
+            seen = set()
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for raw in client.files.content(file_id).text.splitlines():
+                    if raw.strip():
+                        item = json.loads(raw)
+                        seen.add(item["custom_id"])
+                        collected += self._store_result(item)
+            # Solicitudes sin respuesta (batch vencido o cancelado) vuelven a la cola.
+            for custom_id in batch.custom_ids:
+                if custom_id not in seen:
+                    self._retry_or_fail(self.documents[custom_id], f"batch {batch.status}")
+            batch.collected = True
+            self.save()
+        return collected
+
+    def _store_result(self, item: Dict[str, Any]) -> int:
+        doc = self.documents.get(item["custom_id"])
+        if doc is None or doc.status == "completed":
+            return 0
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            self._retry_or_fail(doc, json.dumps(item.get("error") or response.get("body"), ensure_ascii=False)[:500])
+            return 0
+        body = response["body"]
+        try:
+            payload = json.loads(body["choices"][0]["message"]["content"])
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            self._retry_or_fail(doc, f"respuesta inválida: {exc}")
+            return 0
+
+        usage = body.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        cost = routing.estimate_cost(doc.model, prompt_tokens, completion_tokens, cached_tokens, batch=True)
+        BULK_TOKENS.inc(prompt_tokens, kind="prompt")
+        BULK_TOKENS.inc(completion_tokens, kind="completion")
+        if cost:
+            BULK_COST.inc(cost, model=doc.model)
+
+        validation: Optional[Dict[str, Any]] = None
+        if doc.validate:
+            # Sin re-preguntas: solo la normalización local; los campos que sigan inválidos quedan reportados.
+            errors = extraction_schema.validate_extraction(payload)
+            if not any(error.contract_index is None for error in errors):
+                errors = extraction_schema.normalize_locally(payload, errors)
+            validation = {
+                "errors_initial": len(errors),
+                "errors_remaining": [error.as_dict() for error in errors],
+                "repair_passes": 0,
+                "repair_tokens": 0,
+                "repaired_fields": [],
+            }
+        result = {
+            "custom_id": doc.custom_id,
+            "document_id": doc.document_id,
+            "file_name": doc.file_name,
+            "model": doc.model,
+            "openai_response": payload,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cached_tokens": cached_tokens,
+            },
+            "cost_usd": cost,
+            "extraction_validation": validation,
+        }
+        with open(self._result_path(doc.custom_id), "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False)
+        if document_store.INCREMENTAL_REPROCESS_ENABLED:
+            # Una subida interactiva posterior del mismo archivo reutiliza esta extracción.
+            document_store.get_store().add_extraction(
+                doc.document_id,
+                doc.prompt_key,
+                {"response": payload, "tokens": prompt_tokens + completion_tokens, "validation": validation},
+            )
+        doc.status, doc.error = "completed", None
+        BULK_DOCUMENTS.inc(result="completed")
+        return 1
+
+    def _retry_or_fail(self, doc: BulkDocument, error: str) -> None:
+        doc.error = error
+        if doc.attempts < BULK_MAX_ATTEMPTS:
+            doc.status = "pending"
+        else:
+            doc.status = "failed"
+            BULK_DOCUMENTS.inc(result="failed")
+
+    def _result_path(self, custom_id: str) -> str:
+        return os.path.join(self.directory, "results", f"{custom_id}.json")
+
+    def results(self) -> List[Dict[str, Any]]:
+        output = []
+        for doc in self.documents.values():
+            if doc.status == "completed":
+                with open(self._result_path(doc.custom_id), encoding="utf-8") as fh:
+                    output.append(json.load(fh))
+        return output
+
+    def summary(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for doc in self.documents.values():
+            counts[doc.status] = counts.get(doc.status, 0) + 1
+        results = self.results()
+        finished = [batch.finished for batch in self.batches if batch.finished]
+        elapsed = (max(finished) - self.created) if finished and len(finished) == len(self.batches) else None
+        tokens = sum(r["usage"]["total_tokens"] for r in results)
+        cost = sum(r["cost_usd"] for r in results)
+        return {
+            "job_id": self.job_id,
+            "documents": len(self.documents),
+            "status": counts,
+            "batches": {batch.index: batch.status for batch in self.batches},
+            "input_errors": self.input_errors,
+            "tokens": tokens,
+            "cost_usd": round(cost, 6),
+            "cost_usd_per_document": round(cost / len(results), 6) if results else None,
+            "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+            "documents_per_hour": round(len(results) / elapsed * 3600, 1) if elapsed else None,
+        }
+
+    def done(self) -> bool:
+        return all(doc.status in ("completed", "failed") for doc in self.documents.values())
+
+
+def run(
+    job: BulkJob, client: Any = None, wait: bool = False, poll_seconds: float = BULK_POLL_SECONDS
+) -> Dict[str, Any]:
+    """Avanza el job: escribe y envía lo pendiente, consulta los batches y recoge resultados (reanudable)."""
+    client = client or services.get_openai_client()
+    while True:
+        job.write_batches()
+        job.submit(client)
+        running = job.poll(client)
+        job.collect(client)
+        if job.done() or not wait:
+            return job.summary()
+        if running:
+            time.sleep(poll_seconds)
+
+
+def _ocr(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as fh:
+        data = fh.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    _, metrics, extracted_text = asyncio.run(
+        services.process_document(
+            data, _SUPPORTED_FILES[os.path.splitext(path)[1].lower()], os.path.basename(path), content_hash=sha256,
+            extract=False,
+        )
+    )
+    return {"document_id": sha256, "file_name": os.path.basename(path), "extracted_text": extracted_text}
+
+
+def _load_processed(path: str) -> Dict[str, Any]:
+    """Respuesta guardada de /api/process (``extracted_text``, ``file_name`` y ``metrics.content_sha256``)."""
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    text = data["extracted_text"]
+    document_id = (data.get("metrics") or {}).get("content_sha256") or hashlib.sha256(
+        json.dumps(text, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return {"document_id": document_id, "file_name": data.get("file_name") or os.path.basename(path), "extracted_text": text}
+
+
+def add_inputs(
+    job: BulkJob,
+    paths: List[str],
+    language: str = "English",
+    custom_prompt: Optional[str] = None,
+    concurrency: int = BULK_OCR_CONCURRENCY,
+) -> int:
+    """
+    OCR de PDFs e imágenes (sin extracción) y carga de respuestas JSON de /api/process. Un archivo que falla
+    queda en ``job.input_errors`` sin frenar a los demás, y el job se guarda aunque el add se interrumpa: las
+    páginas ya OCR-eadas no se vuelven a pagar.
+    """
+    processed = [p for p in paths if p.lower().endswith(".json")]
+    scans = [p for p in paths if os.path.splitext(p)[1].lower() in _SUPPORTED_FILES]
+    added = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            # Perezoso: cada archivo se agrega apenas está listo, no al final de todo el OCR.
+            loaded = chain(((p, _attempt(_load_processed, p)) for p in processed), zip(scans, executor.map(_attempt_ocr, scans)))
+            for path, (item, error) in loaded:
+                if error is not None:
+                    job.input_errors[path] = error
+                    continue
+                job.input_errors.pop(path, None)
+                if job.add_document(item["document_id"], item["file_name"], item["extracted_text"], language, custom_prompt):
+                    added += 1
+    finally:
+        job.save()
+    return added
+
+
+def _attempt(load: Any, path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        return load(path), None
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"[:500]
+
+
+def _attempt_ocr(path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    return _attempt(_ocr, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("add", "run", "status", "export"))
+    parser.add_argument("--job", required=True)
+    parser.add_argument("--input", help="Directorio con PDFs/imágenes o respuestas JSON de /api/process.")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--custom-prompt")
+    parser.add_argument("--wait", action="store_true", help="Esperar hasta que terminen todos los batches.")
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    job = BulkJob.open(args.job)
+    if args.command == "add":
+        if not args.input:
+            parser.error("--input es obligatorio para add")
+        paths = sorted(os.path.join(args.input, name) for name in os.listdir(args.input))
+        print(f"{add_inputs(job, paths, args.language, args.custom_prompt)} documentos agregados a {args.job}")
+        for path, error in job.input_errors.items():
+            print(f"  no se pudo agregar {path}: {error}")
+        return 1 if job.input_errors else 0
+    if args.command == "run":
+        report = run(job, wait=args.wait)
+    elif args.command == "status":
+        report = job.summary()
+    else:
+        report = job.results()
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
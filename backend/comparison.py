@@ -0,0 +1,677 @@
+"""
+Comparación local entre documentos procesados (los arreglos ``contracts`` de varias respuestas de /api/process).
+
+Todo se calcula con pandas y NumPy, sin llamadas al modelo: diferencias campo a campo de un mismo contrato entre
+documentos, vigencias superpuestas de contratos distintos de un mismo cliente, distribución de ``Payment Value``
+por cliente (o región, categoría, tipo de pago) y un reporte de términos en conflicto. Los valores se comparan
+con las normalizaciones de ``validation``: mayúsculas, puntuación o formato de fecha no cuentan como diferencia.
+Los gráficos salen como especificaciones (``type``, ``categories``, ``series``) que /api/charts dibuja sin modelo.
+"""
+
+import os
+import re
+from itertools import groupby
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from . import telemetry, validation
+
+if TYPE_CHECKING:  # pragma: no cover - solo para anotaciones
+    import numpy as np
+    import pandas as pd
+
+DOCUMENT = "document"
+COMPARE_FIELDS = (
+    "Contract Type",
+    "Customer",
+    "Region",
+    "Effective Date",
+    "Expiration Date",
+    "Product Category",
+    "Payment Type",
+    "Payment Value",
+    "Currency",
+    "Payment Structure",
+)
+# Una diferencia en estos campos entre dos versiones del mismo contrato es un conflicto de términos.
+TERM_FIELDS = ("Effective Date", "Expiration Date", "Payment Type", "Payment Value", "Currency")
+# Un contrato trae una fila por tipo de pago: estos campos se comparan entre filas del mismo tipo.
+PAYMENT_FIELDS = ("Payment Value", "Currency", "Payment Structure")
+GROUP_FIELDS = ("Customer", "Region", "Product Category", "Payment Type", "Contract Type")
+LIST_FIELDS = ("Product Category", "Promo Tactic", "Incentives Details", "Legal Aspects", "Penalties")
+LIST_SEPARATOR = "; "
+COMPARISON_MAX_DOCUMENTS = int(os.getenv("COMPARISON_MAX_DOCUMENTS", "1000"))
+# Filas por sección del reporte; los totales del resumen cuentan todas.
+COMPARISON_MAX_ROWS = int(os.getenv("COMPARISON_MAX_ROWS", "500"))
+# Grupos o contratos que entran en cada gráfico (los de más datos).
+COMPARISON_CHART_ITEMS = int(os.getenv("COMPARISON_CHART_ITEMS", "15"))
+
+COMPARED_CONTRACTS = telemetry.counter("idp_compared_contracts_total", "Contratos recibidos en /api/compare.")
+
+_AMOUNT = re.compile(r"-?\d[\d.,]*")
+_THOUSANDS = re.compile(r"^-?\d{1,3}(,\d{3})+$")
+_MISSING = ""
+DIFFERENCE_COLUMNS = ("key", "group", "contract", "field", "payment_type", DOCUMENT, "value")
+
+# Columnas como arreglos de NumPy del mismo largo (más livianas que un DataFrame para estas operaciones).
+Columns = Dict[str, "np.ndarray"]
+
+
+def contract_frame(documents: Sequence[Any]) -> "pd.DataFrame":
+    """
+    Una fila por contrato con la columna ``document``. Cada documento puede ser la respuesta de /api/process
+    (``openai_response.contracts`` y ``file_name``), un objeto con ``contracts`` o directamente la lista.
+    """
+    import pandas as pd
+
+    if len(documents) > COMPARISON_MAX_DOCUMENTS:
+        raise ValueError(f"Se pueden comparar hasta {COMPARISON_MAX_DOCUMENTS} documentos por solicitud")
+    rows: List[Dict[str, Any]] = []
+    labels: Dict[str, int] = {}
+    for position, item in enumerate(documents, start=1):
+        contracts, name = (item, None) if isinstance(item, list) else (None, None)
+        if isinstance(item, dict):
+            response = item.get("openai_response") if isinstance(item.get("openai_response"), dict) else item
+            contracts, name = response.get("contracts"), item.get("file_name")
+        if not isinstance(contracts, list):
+            raise ValueError(f"El documento {position} no tiene una lista de contratos")
+        label = str(name or f"documento {position}")
+        labels[label] = labels.get(label, 0) + 1
+        if labels[label] > 1:  # el mismo archivo subido dos veces sigue siendo otro documento
+            label = f"{label} ({labels[label]})"
+        rows.extend({**contract, DOCUMENT: label} for contract in contracts if isinstance(contract, dict))
+    return pd.DataFrame(rows)
+
+
+def _object_column(frame: "pd.DataFrame", name: str) -> "np.ndarray":
+    """Columna como arreglo de objetos (None si falta) con las listas unidas por ``LIST_SEPARATOR``."""
+    import numpy as np
+    import pandas as pd
+
+    if name not in frame:
+        return np.full(len(frame), None, dtype=object)
+    values = frame[name].to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    types = set(map(type, values))
+    if list in types or dict in types:
+        values = np.array(
+            [LIST_SEPARATOR.join(map(str, v)) if isinstance(v, list) else str(v) if isinstance(v, dict) else v for v in values]
+            + [None],
+            dtype=object,
+        )[:-1]
+    return values
+
+
+def _normalize(*columns: "np.ndarray") -> List["np.ndarray"]:
+    """``normalize_strings`` de varias columnas en una pasada (cada valor distinto una vez); vacíos como ``""``."""
+    import numpy as np
+    import pandas as pd
+
+    joined = validation.normalize_strings(pd.Series(np.concatenate(columns), dtype=object))
+    joined[pd.isna(joined)] = _MISSING
+    return np.split(joined, np.cumsum([len(column) for column in columns])[:-1])
+
+
+def parse_amounts(values: "pd.Series") -> Tuple["np.ndarray", "np.ndarray"]:
+    """``Payment Value`` como número (``"4,5 %"`` -> 4.5, ``"$1,200"`` -> 1200) y si venía como porcentaje."""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+    if not len(uniques):
+        return np.full(len(codes), np.nan), np.zeros(len(codes), dtype=bool)
+    amounts = np.full(len(uniques), np.nan)
+    percent = np.zeros(len(uniques), dtype=bool)
+    for index, value in enumerate(uniques):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            amounts[index] = value
+            continue
+        text = str(value)
+        match = _AMOUNT.search(text)
+        if match is None:
+            continue
+        number = match.group().rstrip(".,")
+        if "," in number and "." in number:  # el último separador es el decimal
+            if number.rfind(".") > number.rfind(","):
+                number = number.replace(",", "")
+            else:
+                number = number.replace(".", "").replace(",", ".")
+        elif "," in number:
+            number = number.replace(",", "") if _THOUSANDS.match(number) else number.replace(",", ".")
+        elif number.count(".") > 1:
+            number = number.replace(".", "")
+        try:
+            amounts[index] = float(number)
+        except ValueError:
+            continue
+        percent[index] = "%" in text
+    valid = codes >= 0
+    return np.where(valid, amounts[np.maximum(codes, 0)], np.nan), percent[np.maximum(codes, 0)] & valid
+
+
+def parse_date_values(values: "pd.Series") -> "np.ndarray":
+    """Fecha de cada fila con el primer formato de ``DATE_FORMATS`` que la reconoce (NaT si ninguno)."""
+    import numpy as np
+
+    parsed = validation.parse_dates(values)
+    first = (~np.isnat(parsed)).argmax(axis=1)
+    return parsed[np.arange(len(parsed)), first]
+
+
+def _category_set(value: Any) -> Dict[str, str]:
+    """Categorías de un contrato: normalizada -> como vino."""
+    if not value:
+        return {}
+    parts = [part.strip() for part in str(value).split(LIST_SEPARATOR.strip())]
+    return {" ".join(validation.NON_ALNUM.sub("", part).split()).lower(): part for part in parts if part}
+
+
+def _iso_dates(values: "np.ndarray") -> "np.ndarray":
+    """datetime64 -> ``YYYY-MM-DD`` como objetos, None para NaT."""
+    import numpy as np
+
+    text = np.datetime_as_string(values, unit="D").astype(object)
+    text[np.isnat(values)] = None
+    return text
+
+
+def _prepare(frame: "pd.DataFrame", keys: Sequence[str]) -> Tuple[Columns, Dict[str, Tuple["np.ndarray", "np.ndarray"]]]:
+    """
+    Columnas derivadas por fila de contrato (clave normalizada, vigencia, monto y unidad) y, por campo comparado,
+    el valor original y el normalizado con el que se decide si dos documentos difieren.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = len(frame)
+    raw = {name: _object_column(frame, name) for name in dict.fromkeys((*COMPARE_FIELDS, *keys))}
+    normalized = dict(zip(COMPARE_FIELDS, _normalize(*(raw[name] for name in COMPARE_FIELDS))))
+    dates = parse_date_values(pd.Series(np.concatenate([raw["Effective Date"], raw["Expiration Date"]]), dtype=object))
+    start, end = dates[:rows], dates[rows:]
+    amount, percent = parse_amounts(pd.Series(raw["Payment Value"], dtype=object))
+    unit = np.where(percent, "%", _objects([c.upper() for c in normalized["Currency"]]))
+    key = validation.join_keys(frame, keys)
+    memo: Dict[Any, Dict[str, str]] = {}
+    categories = _objects([memo[v] if v in memo else memo.setdefault(v, _category_set(v)) for v in raw["Product Category"]])
+    prepared = {
+        DOCUMENT: frame[DOCUMENT].to_numpy(dtype=object),
+        "contract": _objects([" / ".join("" if v is None else str(v) for v in parts) for parts in zip(*(raw[k] for k in keys))]),
+        "key": key,
+        # Sin clave cada fila es un contrato propio: cuenta para vigencias pero no para diferencias.
+        "contract_id": np.where(pd.isna(key), _objects([f"\x00{i}" for i in range(rows)]), key),
+        "customer": raw["Customer"],
+        "customer_norm": normalized["Customer"],
+        "start": start,
+        "end": end,
+        "payment_type": raw["Payment Type"],
+        "payment_type_norm": normalized["Payment Type"],
+        "payment_value": raw["Payment Value"],
+        "amount": amount,
+        "unit": unit,
+        "categories": raw["Product Category"],
+        "category_set": categories,
+    }
+
+    fields: Dict[str, Tuple["np.ndarray", "np.ndarray"]] = {}
+    for name in COMPARE_FIELDS:
+        if name not in frame:
+            continue
+        norm = normalized[name]
+        if name in validation.DATE_FIELDS:
+            parsed = start if name == "Effective Date" else end
+            norm = np.where(np.isnat(parsed), norm, np.datetime_as_string(parsed, unit="D").astype(object))
+        elif name == "Payment Value":
+            norm = _objects([f"{a:g}{u}" if a == a else n for a, u, n in zip(amount, unit, norm)])
+        fields[name] = (raw[name], norm)
+    return prepared, fields
+
+
+def _objects(values: List[Any]) -> "np.ndarray":
+    """Arreglo 1-D de objetos aunque los elementos sean listas o dicts."""
+    import numpy as np
+
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def _documents_per_key(prepared: Columns) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Códigos de clave (-1 sin clave) y de documento por fila, y en cuántos documentos aparece cada clave."""
+    import numpy as np
+    import pandas as pd
+
+    key_codes = pd.factorize(prepared["key"], use_na_sentinel=True)[0].astype(np.int64)
+    doc_codes = pd.factorize(prepared[DOCUMENT])[0].astype(np.int64)
+    docs = int(doc_codes.max()) + 1 if len(doc_codes) else 1
+    has_key = key_codes >= 0
+    key_doc = np.unique(key_codes[has_key] * docs + doc_codes[has_key])
+    # Sin ninguna fila con clave el conteo queda vacío (``key_codes.max()`` sería -1 o no existiría).
+    keys = int(key_codes.max()) + 1 if has_key.any() else 0
+    return key_codes, doc_codes, np.bincount(key_doc // docs, minlength=keys)
+
+
+def _empty_differences() -> Columns:
+    import numpy as np
+
+    return {name: np.empty(0, dtype=object) for name in DIFFERENCE_COLUMNS}
+
+
+def _rows_in_several_documents(prepared: Columns) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Códigos de clave y de documento por fila, y las filas cuyo contrato aparece en dos o más documentos."""
+    import numpy as np
+
+    key_codes, doc_codes, documents_per_key = _documents_per_key(prepared)
+    if not (key_codes >= 0).any():
+        return key_codes, doc_codes, np.empty(0, dtype=np.int64)
+    rows = np.flatnonzero((key_codes >= 0) & (documents_per_key[np.maximum(key_codes, 0)] > 1))
+    return key_codes, doc_codes, rows
+
+
+def _comparison_groups(
+    prepared: Columns, key_codes: "np.ndarray", rows: "np.ndarray", names: List[str]
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Una posición por fila y campo comparado (``row_index``, ``field_index``) y el grupo en el que se compara: el
+    contrato y, para los campos de ``PAYMENT_FIELDS`` (``by_payment``), también el tipo de pago.
+    """
+    import numpy as np
+    import pandas as pd
+
+    payment_codes = pd.factorize(prepared["payment_type_norm"])[0].astype(np.int64)
+    field_index = np.repeat(np.arange(len(names)), len(rows))
+    row_index = np.tile(rows, len(names))
+    by_payment = np.isin(field_index, [i for i, name in enumerate(names) if name in PAYMENT_FIELDS])
+    payment = np.where(by_payment, payment_codes[row_index] + 1, 0)
+    group = key_codes[row_index] * (int(payment_codes.max()) + 2) + payment
+    return row_index, field_index, by_payment, group
+
+
+def _differing_values(
+    group_field: "np.ndarray", documents: "np.ndarray", norm_codes: "np.ndarray", docs: int
+) -> "np.ndarray":
+    """
+    Posiciones de los valores (la primera aparición de cada documento y valor) de los grupos-campo en los que
+    algún documento no tiene todos los valores de la unión. Los conjuntos se cuentan con ``np.unique``.
+    """
+    import numpy as np
+
+    distinct_values = int(norm_codes.max()) + 1
+    distinct, first = np.unique((group_field * docs + documents) * distinct_values + norm_codes, return_index=True)
+    per_document, per_document_size = np.unique(distinct // distinct_values, return_counts=True)
+    union = np.unique(group_field[first] * distinct_values + norm_codes[first]) // distinct_values
+    union_keys, union_size = np.unique(union, return_counts=True)
+    per_document_group = per_document // docs
+    smaller = per_document_size < union_size[np.searchsorted(union_keys, per_document_group)]
+    return first[np.isin(group_field[first], per_document_group[smaller])]
+
+
+def _report_order(
+    prepared: Columns, groups: "np.ndarray", fields_of: "np.ndarray", source: "np.ndarray"
+) -> Tuple[List[int], Dict[int, Any]]:
+    """
+    Orden de las diferencias (contrato como vino en su primera aparición, campo en el orden de COMPARE_FIELDS,
+    documento) y el nombre del contrato de cada grupo.
+    """
+    group_list, field_list = groups.tolist(), fields_of.tolist()
+    group_contract = dict(zip(group_list[::-1], prepared["contract"][source][::-1].tolist()))
+    documents = prepared[DOCUMENT][source].tolist()
+    order = sorted(
+        range(len(group_list)),
+        key=lambda i: (group_contract[group_list[i]], field_list[i], group_list[i], documents[i]),
+    )
+    return order, group_contract
+
+
+def field_differences(prepared: Columns, fields: Dict[str, Tuple["np.ndarray", "np.ndarray"]]) -> Columns:
+    """
+    Filas (contrato, campo, documento, valor) de los campos en los que un contrato presente en dos o más
+    documentos no tiene los mismos valores en todos. Un documento puede traer varias filas del mismo contrato (una
+    por tipo de pago): se compara el conjunto de valores de cada documento contra el de la unión, y los campos de
+    ``PAYMENT_FIELDS`` solo entre filas del mismo tipo de pago (``payment_type`` en el resultado). Todo se reduce
+    a enteros (códigos de grupo, campo, documento y valor) y a ``np.unique``.
+    """
+    import numpy as np
+    import pandas as pd
+
+    key_codes, doc_codes, rows = _rows_in_several_documents(prepared)
+    names = list(fields)
+    if not len(rows) or not names:
+        return _empty_differences()
+
+    row_index, field_index, by_payment, group = _comparison_groups(prepared, key_codes, rows, names)
+    values = np.concatenate([fields[name][0][rows] for name in names])
+    norm_codes = pd.factorize(np.concatenate([fields[name][1][rows] for name in names]))[0].astype(np.int64)
+    selected = _differing_values(
+        group * len(names) + field_index, doc_codes[row_index], norm_codes, int(doc_codes.max()) + 1
+    )
+
+    order, group_contract = _report_order(prepared, group[selected], field_index[selected], row_index[selected])
+    selected = selected[order]
+    source = row_index[selected]
+    return {
+        "key": prepared["key"][source],
+        "group": group[selected],
+        "contract": _objects([group_contract[g] for g in group[selected].tolist()]),
+        "field": _objects([names[i] for i in field_index[selected].tolist()]),
+        "payment_type": np.where(by_payment[selected], prepared["payment_type"][source], None),
+        DOCUMENT: prepared[DOCUMENT][source],
+        "value": values[selected],
+    }
+
+
+def difference_entries(differences: Columns, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Una entrada por contrato y campo (y tipo de pago) con el valor de cada documento."""
+    entries: List[Dict[str, Any]] = []
+    rows = zip(*(differences[name].tolist() for name in ("group", "contract", "field", "payment_type", DOCUMENT, "value")))
+    for (_, name), items in groupby(rows, key=lambda row: (row[0], row[2])):
+        if limit is not None and len(entries) == limit:
+            break
+        items = list(items)
+        entry: Dict[str, Any] = {"contract": items[0][1], "field": name}
+        if name in PAYMENT_FIELDS:
+            entry["payment_type"] = items[0][3]
+        entry["values"] = [{DOCUMENT: item[4], "value": item[5]} for item in items]
+        entries.append(entry)
+    return entries
+
+
+def _subset(columns: Columns, mask: "np.ndarray") -> Columns:
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def overlapping_pairs(prepared: Columns) -> Columns:
+    """
+    Pares de contratos distintos del mismo cliente cuyas vigencias se cruzan (sin vencimiento = abierta). Los
+    pares se arman solo dentro de cada cliente y se filtran con comparaciones de NumPy.
+    """
+    import numpy as np
+    import pandas as pd
+
+    start, end = prepared["start"], prepared["end"]
+    dated = ~np.isnat(start) & (prepared["customer_norm"] != _MISSING)
+    # La misma versión del contrato en varios documentos (o repetida) se empareja una vez por tipo de pago y valor.
+    # Fechas como enteros y NaN como None: NaT != NaT y nan != nan no servirían como clave.
+    amounts = np.where(np.isnan(prepared["amount"]), None, prepared["amount"].astype(object))
+    signatures = zip(prepared["contract_id"], start.view("i8").tolist(), end.view("i8").tolist(),
+                     prepared["payment_type_norm"], amounts, prepared["unit"], prepared["categories"])
+    versions: Dict[Tuple[Any, ...], int] = {}
+    for i, signature in enumerate(signatures):
+        versions.setdefault(signature, i)
+    rows = np.array(sorted(versions.values()), dtype=np.int64)
+    rows = rows[dated[rows]]
+    customer_codes = pd.factorize(prepared["customer_norm"][rows])[0]
+    order = np.argsort(customer_codes, kind="stable")
+    rows, customer_codes = rows[order], customer_codes[order]
+    bounds = np.flatnonzero(np.diff(customer_codes)) + 1
+    left: List["np.ndarray"] = [np.empty(0, dtype=np.int64)]
+    right: List["np.ndarray"] = [np.empty(0, dtype=np.int64)]
+    for low, high in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(rows)].tolist()):
+        if high - low > 1:
+            i, j = np.triu_indices(high - low, 1)
+            left.append(rows[low + i])
+            right.append(rows[low + j])
+    a, b = np.concatenate(left), np.concatenate(right)
+
+    contract_id = prepared["contract_id"]
+    far = np.datetime64(pd.Timestamp.max.floor("D").to_datetime64(), "ns")
+    open_end = np.where(np.isnat(end), far, end)
+    keep = (contract_id[a] != contract_id[b]) & (start[a] <= open_end[b]) & (start[b] <= open_end[a])
+    a, b = a[keep], b[keep]
+    swap = contract_id[a] > contract_id[b]
+    a, b = np.where(swap, b, a), np.where(swap, a, b)
+    overlap_start = np.maximum(start[a], start[b])
+    overlap_end = np.minimum(open_end[a], open_end[b])
+    unbounded = overlap_end == far
+    days = ((overlap_end - overlap_start) // np.timedelta64(1, "D")).astype(float) + 1
+    days[unbounded] = np.nan
+    overlap_end[unbounded] = np.datetime64("NaT")
+
+    pairs = {"customer": prepared["customer"][a]}
+    for name in ("contract_id", "contract", DOCUMENT, "start", "end", "payment_type", "payment_type_norm",
+                 "payment_value", "amount", "unit", "category_set"):
+        pairs[f"{name}_a"] = prepared[name][a]
+        pairs[f"{name}_b"] = prepared[name][b]
+    pairs.update(overlap_start=overlap_start, overlap_end=overlap_end, overlap_days=days)
+    return pairs
+
+
+def conflicting_terms(differences: Columns, pairs: Columns) -> List[Dict[str, Any]]:
+    """
+    Conflictos: el mismo contrato con distintos términos según el documento, y contratos distintos del mismo
+    cliente, vigentes a la vez, para el mismo tipo de pago y categorías en común pero con otro valor o moneda.
+    Un contrato sin categorías cubre todas. Como en las vigencias cruzadas, cada par de contratos cuenta una vez
+    (por tipo de pago) aunque sus versiones aparezcan en varios documentos.
+    """
+    import numpy as np
+
+    terms = _subset(differences, np.isin(differences["field"], TERM_FIELDS))
+    conflicts = [dict(kind="same_contract", **entry) for entry in difference_entries(terms)]
+
+    amount_a, amount_b = pairs["amount_a"], pairs["amount_b"]
+    candidates = np.flatnonzero(
+        (pairs["payment_type_norm_a"] != _MISSING)
+        & (pairs["payment_type_norm_a"] == pairs["payment_type_norm_b"])
+        & ~np.isnan(amount_a)
+        & ~np.isnan(amount_b)
+        & ((amount_a != amount_b) | (pairs["unit_a"] != pairs["unit_b"]))
+    )
+    overlap_start, overlap_end = _iso_dates(pairs["overlap_start"][candidates]), _iso_dates(pairs["overlap_end"][candidates])
+    seen = set()
+    for position, i in enumerate(candidates.tolist()):
+        left, right = pairs["category_set_a"][i], pairs["category_set_b"][i]
+        if left and right and not left.keys() & right.keys():
+            continue
+        pair = (pairs["contract_id_a"][i], pairs["contract_id_b"][i], pairs["payment_type_norm_a"][i])
+        if pair in seen:
+            continue
+        seen.add(pair)
+        shared = [left[name] for name in left if name in right] if left and right else list((left or right).values())
+        conflicts.append(
+            {
+                "kind": "overlapping_terms",
+                "customer": pairs["customer"][i],
+                "payment_type": pairs["payment_type_a"][i],
+                "categories": shared,
+                "contract_a": pairs["contract_a"][i],
+                "document_a": pairs["document_a"][i],
+                "value_a": pairs["payment_value_a"][i],
+                "contract_b": pairs["contract_b"][i],
+                "document_b": pairs["document_b"][i],
+                "value_b": pairs["payment_value_b"][i],
+                "overlap_start": overlap_start[position],
+                "overlap_end": overlap_end[position],
+            }
+        )
+    return conflicts
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    """Cuantil con interpolación lineal (el de pandas/NumPy por defecto) sobre valores ya ordenados."""
+    position = q * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def payment_distribution(prepared: Columns, frame: "pd.DataFrame", group_by: str) -> List[Dict[str, Any]]:
+    """
+    Estadísticos de ``Payment Value`` por grupo y unidad (% o moneda), de mayor a menor cantidad, con los valores
+    de cada grupo para el gráfico; las categorías de un contrato se abren en una fila por categoría.
+    """
+    import numpy as np
+    import pandas as pd
+
+    amount = prepared["amount"]
+    rows = np.flatnonzero(~np.isnan(amount))
+    norm: Optional["np.ndarray"] = None
+    if group_by in LIST_FIELDS:
+        sets = prepared["category_set"] if group_by == "Product Category" else [_category_set(v) for v in _object_column(frame, group_by)]
+        expanded = [(i, name) for i in rows.tolist() for name in (list(sets[i].values()) or [None])]
+        rows = np.array([i for i, _ in expanded], dtype=np.int64)
+        display = _objects([name for _, name in expanded])
+    else:
+        display = _object_column(frame, group_by)[rows]
+        normalized = {"Customer": "customer_norm", "Payment Type": "payment_type_norm"}.get(group_by)
+        norm = prepared[normalized][rows] if normalized else None
+    if not len(rows):
+        return []
+    display = np.where(pd.isna(display), "(sin dato)", display)
+    if norm is None:
+        norm = _normalize(display)[0]
+    unit = prepared["unit"][rows]
+    codes, _ = pd.factorize(norm + "\x1f" + unit)
+    values = amount[rows]
+    documents = prepared[DOCUMENT][rows]
+    order = np.lexsort((values, codes))
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    first_seen = np.unique(codes, return_index=True)[1]
+    records: List[Dict[str, Any]] = []
+    for low, high in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(order)].tolist()):
+        members = order[low:high]
+        sample = values[members].tolist()
+        first = first_seen[codes[members[0]]]
+        records.append(
+            {
+                "group": display[first],
+                "unit": unit[first],
+                "count": len(sample),
+                "documents": len(set(documents[members].tolist())),
+                "min": sample[0],
+                "q1": _quantile(sample, 0.25),
+                "median": _quantile(sample, 0.5),
+                "q3": _quantile(sample, 0.75),
+                "max": sample[-1],
+                "mean": round(sum(sample) / len(sample), 4),
+                "values": sample,
+            }
+        )
+    records.sort(key=lambda record: (-record["count"], str(record["group"])))
+    return records
+
+
+def _charts(group_by: str, differences: Columns, pairs: Columns, distribution: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Especificaciones para /api/charts (``chart``): distribución de pagos, vigencias cruzadas y diferencias."""
+    charts: List[Dict[str, Any]] = []
+    if distribution:
+        totals: Dict[str, int] = {}
+        for record in distribution:
+            totals[record["unit"]] = totals.get(record["unit"], 0) + record["count"]
+        unit = max(totals, key=totals.get)
+        top = [record for record in distribution if record["unit"] == unit][:COMPARISON_CHART_ITEMS]
+        charts.append(
+            {
+                "type": "box",
+                "title": f"Payment Value por {group_by}" + (f" ({unit})" if unit else ""),
+                "x_label": group_by,
+                "y_label": unit or "Payment Value",
+                "categories": [record["group"] for record in top],
+                "series": [{"name": unit or "Payment Value", "values": [record["values"] for record in top]}],
+            }
+        )
+    if len(pairs["customer"]):
+        shown: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        for side in ("a", "b"):
+            columns = (pairs[f"contract_{side}"], _iso_dates(pairs[f"start_{side}"]), _iso_dates(pairs[f"end_{side}"]))
+            for contract, start, end, customer in zip(*(c[:COMPARISON_CHART_ITEMS] for c in columns), pairs["customer"]):
+                if len(shown) < COMPARISON_CHART_ITEMS:
+                    shown.setdefault((contract, start, end), (str(customer), start, contract, end))
+        ordered = sorted(shown.values())
+        charts.append(
+            {
+                "type": "timeline",
+                "title": "Vigencias superpuestas por cliente",
+                "x_label": "Vigencia",
+                "y_label": "Contrato",
+                "categories": [f"{contract} ({customer})" for customer, _, contract, _ in ordered],
+                "series": [{"name": "Vigencia", "values": [[start, end] for _, start, _, end in ordered]}],
+            }
+        )
+    if len(differences["field"]):
+        counts: Dict[str, int] = {}
+        for _, name in dict.fromkeys(zip(differences["group"].tolist(), differences["field"].tolist())):
+            counts[name] = counts.get(name, 0) + 1
+        ranked = sorted(counts.items(), key=lambda item: -item[1])
+        charts.append(
+            {
+                "type": "bar",
+                "title": "Contratos con diferencias entre documentos, por campo",
+                "x_label": "Campo",
+                "y_label": "Contratos",
+                "categories": [name for name, _ in ranked],
+                "series": [{"name": "Contratos", "values": [count for _, count in ranked]}],
+            }
+        )
+    return charts
+
+
+def _records(columns: Columns, index: Sequence[int]) -> List[Dict[str, Any]]:
+    """Registros JSON de las filas ``index``: NaN/NaT como None y fechas ISO (YYYY-MM-DD)."""
+    import numpy as np
+    import pandas as pd
+
+    out: Dict[str, List[Any]] = {}
+    for name, values in columns.items():
+        values = values[np.asarray(index, dtype=np.int64)]
+        if values.dtype.kind == "M":
+            values = _iso_dates(values)
+        else:
+            values = values.astype(object)
+            values[pd.isna(values)] = None
+        out[name] = values.tolist()
+    return [dict(zip(out, row)) for row in zip(*out.values())]
+
+
+def compare(
+    documents: Sequence[Any],
+    keys: Sequence[str] = validation.DEFAULT_KEYS,
+    group_by: str = "Customer",
+    charts: bool = True,
+) -> Dict[str, Any]:
+    """Reporte comparativo de los contratos de ``documents`` (ver el docstring del módulo)."""
+    if group_by not in GROUP_FIELDS:
+        raise ValueError(f"group_by debe ser uno de: {', '.join(GROUP_FIELDS)}")
+    if not keys:
+        raise ValueError("keys no puede estar vacío")
+    frame = contract_frame(documents)
+    COMPARED_CONTRACTS.inc(len(frame))
+    if frame.empty:
+        raise ValueError("Los documentos no traen contratos para comparar")
+    prepared, fields = _prepare(frame, keys)
+    differences = field_differences(prepared, fields)
+    pairs = overlapping_pairs(prepared)
+    distribution = payment_distribution(prepared, frame, group_by)
+    conflicts = conflicting_terms(differences, pairs)
+
+    # Un par por contratos (no por versión), por cliente y fecha de inicio del cruce.
+    first_pair: Dict[Tuple[Any, Any], int] = {}
+    for i, pair in enumerate(zip(pairs["contract_id_a"].tolist(), pairs["contract_id_b"].tolist())):
+        first_pair.setdefault(pair, i)
+    customers = [str(c) for c in pairs["customer"].tolist()]
+    starts = pairs["overlap_start"].view("i8").tolist()
+    overlap_index = sorted(first_pair.values(), key=lambda i: (customers[i], starts[i]))
+    overlap_columns = ("customer", "contract_a", "document_a", "start_a", "end_a", "contract_b", "document_b", "start_b",
+                       "end_b", "overlap_start", "overlap_end", "overlap_days")
+    documents_per_key = _documents_per_key(prepared)[2]
+
+    report: Dict[str, Any] = {
+        "summary": {
+            "documents": len(set(prepared[DOCUMENT].tolist())),
+            "contracts": len(set(prepared["contract_id"].tolist())),
+            "rows": len(frame),
+            "keys": list(keys),
+            "group_by": group_by,
+            "contracts_in_several_documents": int((documents_per_key > 1).sum()),
+            "differences": len(set(zip(differences["group"].tolist(), differences["field"].tolist()))),
+            "overlaps": len(first_pair),
+            "conflicts": len(conflicts),
+            "max_rows": COMPARISON_MAX_ROWS,
+        },
+        "differences": difference_entries(differences, COMPARISON_MAX_ROWS),
+        "overlaps": _records({name: pairs[name] for name in overlap_columns}, overlap_index[:COMPARISON_MAX_ROWS]),
+        "distribution": [
+            {name: value for name, value in record.items() if name != "values"} for record in distribution[:COMPARISON_MAX_ROWS]
+        ],
+        "conflicts": conflicts[:COMPARISON_MAX_ROWS],
+    }
+    if charts:
+        report["charts"] = _charts(group_by, differences, pairs, distribution)
+    return report
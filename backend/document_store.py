@@ -0,0 +1,266 @@
+"""Huellas por página de los documentos procesados, para re-procesar solo las páginas que cambian entre versiones."""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from . import telemetry
+
+# Desactivado por defecto: guarda en disco el texto OCR y las extracciones de cada documento, sin separar por
+# tenant (ver README).
+INCREMENTAL_REPROCESS_ENABLED = os.getenv("INCREMENTAL_REPROCESS_ENABLED", "false").lower() in ("1", "true", "yes")
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "document_store")
+DOCUMENT_STORE_MAX_DOCUMENTS = int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENTS", "1000"))
+# Fracción mínima de páginas compartidas para tratar un documento como versión de otro.
+INCREMENTAL_MIN_SHARED_RATIO = float(os.getenv("INCREMENTAL_MIN_SHARED_RATIO", "0.3"))
+# Por encima de esta fracción de páginas cambiadas se re-extrae el documento completo.
+INCREMENTAL_MAX_CHANGED_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGED_RATIO", "0.5"))
+
+PAGES_REUSED = telemetry.counter("idp_incremental_pages_reused_total", "Páginas reutilizadas de una versión anterior.")
+OCR_SECONDS_SAVED = telemetry.counter(
+    "idp_incremental_ocr_seconds_saved_total", "Segundos de OCR estimados como ahorrados por páginas reutilizadas."
+)
+TOKENS_SAVED = telemetry.counter(
+    "idp_incremental_tokens_saved_total", "Tokens de extracción estimados como ahorrados por reutilización."
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class StoredDocument:
+    sha256: str
+    file_name: str
+    # Huellas previas al OCR (capa de texto o imágenes del PDF); vacías si no se pudieron calcular.
+    page_fingerprints: List[str]
+    # Huellas del texto reconocido por página, y las líneas de cada una indexadas por esa huella.
+    text_fingerprints: List[str]
+    pages: Dict[str, List[Dict[str, Any]]]
+    page_count: int
+    ocr_seconds_per_page: float
+    # Resultado de extracción por hash del prompt de sistema.
+    extractions: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+
+    def lines_for(self, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        if fingerprint in self.pages:
+            return self.pages[fingerprint]
+        for page_fp, text_fp in zip(self.page_fingerprints, self.text_fingerprints):
+            if page_fp == fingerprint:
+                return self.pages.get(text_fp)
+        return None
+
+
+def prompt_key(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def pdf_page_fingerprints(document: Union[bytes, BinaryIO]) -> Optional[List[str]]:
+    """
+    Huella de cada página antes del OCR: el stream de contenido (la capa de texto y dibujo) más los
+    datos de las imágenes que usa la página. No extrae texto, así que cuesta milisegundos por página.
+    None si pypdf no está instalado o el PDF no se puede leer.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+
+    from io import BytesIO
+
+    stream = BytesIO(document) if isinstance(document, (bytes, bytearray)) else document
+    try:
+        # Sin marcador de fin pypdf intenta reconstruir el archivo, lo que es lento; esos casos van directo al OCR.
+        if not _has_eof_marker(stream):
+            return None
+        reader = PdfReader(stream)
+        fingerprints = []
+        for page in reader.pages:
+            digest = hashlib.sha256()
+            contents = page.get_contents()
+            digest.update(contents.get_data() if contents is not None else b"")
+            xobjects = (page.get("/Resources") or {}).get("/XObject") or {}
+            for name in sorted(xobjects):
+                digest.update(b"\0" + xobjects[name].get_object().get_data())
+            fingerprints.append(digest.hexdigest())
+        return fingerprints
+    except Exception as exc:
+        print(f"No se pudieron calcular huellas de página del PDF: {exc}")
+        return None
+    finally:
+        if stream is not document:
+            stream.close()
+        else:
+            stream.seek(0)
+
+
+def pdf_page_count(document: BinaryIO) -> Optional[int]:
+    """Cantidad de páginas leyendo solo la estructura del PDF. None si no se puede leer."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    try:
+        return len(PdfReader(document).pages) if _has_eof_marker(document) else None
+    except Exception:
+        return None
+    finally:
+        document.seek(0)
+
+
+def _has_eof_marker(stream: BinaryIO) -> bool:
+    """Busca ``%%EOF`` en los últimos 2 KB y deja el stream al inicio."""
+    stream.seek(0, os.SEEK_END)
+    stream.seek(max(0, stream.tell() - 2048))
+    found = b"%%EOF" in stream.read()
+    stream.seek(0)
+    return found
+
+
+def text_fingerprints(text_items: List[Dict[str, Any]], page_count: int) -> List[str]:
+    """Huella del texto reconocido de cada página (1..page_count)."""
+    by_page: Dict[int, List[str]] = {page: [] for page in range(1, page_count + 1)}
+    for item in text_items:
+        by_page.setdefault(item.get("page", 1), []).append(item["text"])
+    return [
+        hashlib.sha256(_WHITESPACE.sub(" ", "\n".join(lines)).strip().encode("utf-8")).hexdigest()
+        for _, lines in sorted(by_page.items())
+    ]
+
+
+def page_ranges(pages: List[int]) -> str:
+    """[1, 2, 3, 7] -> "1-3,7" (formato del parámetro ``pages`` de Document Intelligence)."""
+    ranges: List[str] = []
+    for page in sorted(pages):
+        if ranges and page == int(ranges[-1].split("-")[-1]) + 1:
+            ranges[-1] = f"{ranges[-1].split('-')[0]}-{page}"
+        else:
+            ranges.append(str(page))
+    return ",".join(ranges)
+
+
+class DocumentStore:
+    """Documentos procesados en disco (un JSON por documento) con un índice en memoria huella -> documentos."""
+
+    def __init__(self, directory: str = DOCUMENT_STORE_DIR, max_documents: int = DOCUMENT_STORE_MAX_DOCUMENTS):
+        self.directory = directory
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._documents: Dict[str, StoredDocument] = {}
+        self._index: Dict[str, set] = {}
+        self._load()
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.json")
+
+    def _load(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as fh:
+                    self._add(StoredDocument(**json.load(fh)))
+            except (OSError, TypeError, ValueError) as exc:
+                print(f"Se ignora {name} del almacén de documentos: {exc}")
+
+    def _add(self, document: StoredDocument) -> None:
+        self._documents[document.sha256] = document
+        for fingerprint in {*document.page_fingerprints, *document.text_fingerprints}:
+            self._index.setdefault(fingerprint, set()).add(document.sha256)
+
+    def _remove(self, sha256: str) -> None:
+        document = self._documents.pop(sha256, None)
+        if document is None:
+            return
+        for fingerprint in {*document.page_fingerprints, *document.text_fingerprints}:
+            owners = self._index.get(fingerprint)
+            if owners:
+                owners.discard(sha256)
+                if not owners:
+                    del self._index[fingerprint]
+
+    def find_base(self, fingerprints: List[str], exclude: Optional[str] = None) -> Optional[StoredDocument]:
+        """Versión anterior con más páginas en común, si comparte al menos INCREMENTAL_MIN_SHARED_RATIO."""
+        if not fingerprints:
+            return None
+        with self._lock:
+            shared: Dict[str, int] = {}
+            for fingerprint in set(fingerprints):
+                for sha256 in self._index.get(fingerprint, ()):
+                    if sha256 != exclude:
+                        shared[sha256] = shared.get(sha256, 0) + 1
+            if not shared:
+                return None
+            best = max(shared, key=lambda sha: (shared[sha], self._documents[sha].created))
+            if shared[best] / len(set(fingerprints)) < INCREMENTAL_MIN_SHARED_RATIO:
+                return None
+            return self._documents[best]
+
+    def get(self, sha256: str) -> Optional[StoredDocument]:
+        with self._lock:
+            return self._documents.get(sha256)
+
+    def save(self, document: StoredDocument) -> None:
+        with self._lock:
+            previous = self._documents.get(document.sha256)
+            if previous is not None:
+                document.extractions = {**previous.extractions, **document.extractions}
+                self._remove(document.sha256)
+            self._add(document)
+            evicted = []
+            while len(self._documents) > self.max_documents:
+                oldest = min(self._documents.values(), key=lambda d: d.created)
+                self._remove(oldest.sha256)
+                evicted.append(oldest.sha256)
+        self._write(document)
+        for sha256 in evicted:
+            try:
+                os.remove(self._path(sha256))
+            except OSError:
+                pass
+
+    def add_extraction(self, sha256: str, key: str, extraction: Dict[str, Any]) -> bool:
+        """Agrega una extracción hecha fuera de ``process_document`` (p. ej. en bulk) a un documento guardado."""
+        with self._lock:
+            document = self._documents.get(sha256)
+            if document is None:
+                return False
+            document.extractions[key] = extraction
+        self._write(document)
+        return True
+
+    def _write(self, document: StoredDocument) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(document.sha256)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(asdict(document), fh, ensure_ascii=False)
+        os.replace(tmp_path, self._path(document.sha256))
+
+
+_store: Optional[DocumentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> DocumentStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DocumentStore()
+    return _store
+
+
+def record_savings(pages_reused: int, ocr_seconds: float, tokens: int) -> None:
+    if pages_reused:
+        PAGES_REUSED.inc(pages_reused)
+    if ocr_seconds > 0:
+        OCR_SECONDS_SAVED.inc(ocr_seconds)
+    if tokens > 0:
+        TOKENS_SAVED.inc(tokens)
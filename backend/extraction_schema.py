@@ -0,0 +1,183 @@
+"""Contrato de salida de la extracción estándar (JSON Schema) y validación local de campos."""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .prompts import SYSTEM_PROMPT_ENGLISH
+
+_DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
+# Salida esperada de SYSTEM_PROMPT_ENGLISH. Solo se usa el subconjunto de JSON Schema que valida
+# ``validate_extraction`` (type, required, properties, items, minLength, pattern).
+CONTRACT_SCHEMA: Dict[str, Any] = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["contracts"],
+    "properties": {
+        "contracts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": [
+                    "Contract", "Contract Number", "Contract Type", "Customer", "Region",
+                    "Effective Date", "Expiration Date", "Payment Type", "Payment Value", "Currency",
+                ],
+                "properties": {
+                    "Contract": {"type": "string"},
+                    "Contract Number": {"type": "string", "minLength": 1},
+                    "Contract Type": {"type": "string"},
+                    "Customer": {"type": "string", "minLength": 1},
+                    "Region": {"type": "string"},
+                    "Effective Date": {"type": "string", "minLength": 1, "pattern": _DATE_PATTERN},
+                    "Expiration Date": {"type": ["string", "null"], "pattern": _DATE_PATTERN},
+                    "Contract Terms": {"type": "string"},
+                    "Promo Tactic": {"type": "array", "items": {"type": "string"}},
+                    "Product Category": {"type": "array", "items": {"type": "string"}},
+                    "Payment Type": {"type": "string"},
+                    "Payment Value": {"type": ["string", "number"]},
+                    "Currency": {"type": "string"},
+                    "Incentives Details": {"type": "array", "items": {"type": "string"}},
+                    "Promotion Display": {"type": "string"},
+                    "Payment Structure": {"type": "string"},
+                    "Penalties": {"type": ["string", "array"]},
+                    "Legal Aspects": {"type": "array", "items": {"type": "string"}},
+                },
+            },
+        }
+    },
+}
+
+# Prompts cuya salida sigue CONTRACT_SCHEMA (los demás idiomas devuelven una tabla con otros nombres de campo).
+SCHEMA_PROMPTS = (SYSTEM_PROMPT_ENGLISH,)
+
+# Palabras clave (multi-idioma) para ubicar las páginas relevantes de cada campo al re-preguntar.
+FIELD_HINTS: Dict[str, List[str]] = {
+    "Contract Number": ["contract no", "contract number", "número", "numero", "nº", "n°", "no.", "№", "договор"],
+    "Customer": ["customer", "client", "cliente", "razón social", "клиент", "between", "entre"],
+    "Effective Date": ["effective", "vigencia", "vigor", "inicio", "início", "start", "вступ", "desde"],
+    "Expiration Date": ["expir", "termina", "vencimiento", "término", "hasta", "until", "окончан"],
+    "Payment Value": ["%", "payment", "pago", "descuento", "discount", "rebate", "valor"],
+    "Payment Type": ["payment", "pago", "descuento", "discount", "rebate", "incentiv"],
+    "Currency": ["currency", "moneda", "usd", "cop", "brl", "eur", "валют"],
+    "Region": ["region", "región", "territorio", "territory", "zona"],
+}
+
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+_LOOSE_DATE = re.compile(r"^\s*(\d{4})[./-](\d{1,2})[./-](\d{1,2})\s*$")
+
+
+@dataclass
+class FieldError:
+    contract_index: Optional[int]
+    field: str
+    reason: str
+    value: Any = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"contract_index": self.contract_index, "field": self.field, "reason": self.reason}
+
+
+def _check_value(value: Any, rules: Dict[str, Any]) -> Optional[str]:
+    types = rules.get("type")
+    if types:
+        allowed = types if isinstance(types, list) else [types]
+        if not any(_TYPE_CHECKS[t](value) for t in allowed):
+            return f"tipo inválido (se esperaba {'/'.join(allowed)})"
+    if isinstance(value, str):
+        if len(value.strip()) < rules.get("minLength", 0):
+            return "vacío"
+        pattern = rules.get("pattern")
+        if pattern and value and not re.match(pattern, value):
+            return "formato inválido"
+        if pattern == _DATE_PATTERN and value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return "fecha inexistente"
+    if isinstance(value, list) and "items" in rules:
+        if any(_check_value(item, rules["items"]) for item in value):
+            return "elementos inválidos"
+    return None
+
+
+def uses_schema(system_prompt: str) -> bool:
+    return system_prompt in SCHEMA_PROMPTS
+
+
+def validate_extraction(payload: Any, schema: Dict[str, Any] = CONTRACT_SCHEMA) -> List[FieldError]:
+    """Valida la respuesta contra el esquema y devuelve un error por campo inválido o faltante."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("contracts"), list):
+        return [FieldError(None, "contracts", "falta la lista de contratos")]
+    item_schema = schema["properties"]["contracts"]["items"]
+    properties = item_schema["properties"]
+    errors: List[FieldError] = []
+    for index, contract in enumerate(payload["contracts"]):
+        if not isinstance(contract, dict):
+            errors.append(FieldError(None, "contracts", f"el contrato {index} no es un objeto"))
+            continue
+        for field in item_schema["required"]:
+            if field not in contract:
+                errors.append(FieldError(index, field, "faltante"))
+        for field, rules in properties.items():
+            if field in contract:
+                reason = _check_value(contract[field], rules)
+                if reason:
+                    errors.append(FieldError(index, field, reason, contract[field]))
+    return errors
+
+
+def normalize_locally(payload: Dict[str, Any], errors: List[FieldError]) -> List[FieldError]:
+    """
+    Corrige sin LLM los errores triviales (fechas año-mes-día con otro separador o sin ceros)
+    y devuelve los errores que siguen pendientes.
+    """
+    pending: List[FieldError] = []
+    for error in errors:
+        if error.contract_index is not None and error.field.endswith("Date") and isinstance(error.value, str):
+            match = _LOOSE_DATE.match(error.value)
+            if match:
+                try:
+                    fixed = datetime(*(int(part) for part in match.groups())).strftime("%Y-%m-%d")
+                except ValueError:
+                    fixed = None
+                if fixed:
+                    payload["contracts"][error.contract_index][error.field] = fixed
+                    continue
+        pending.append(error)
+    return pending
+
+
+def select_excerpt(
+    text_items: List[Dict[str, Any]],
+    fields: List[str],
+    anchors: List[str],
+    max_pages: int = 2,
+    max_chars: int = 6000,
+) -> str:
+    """
+    Elige las páginas con más coincidencias de palabras clave de los campos (y de valores ya extraídos,
+    p. ej. el cliente) y devuelve su texto, acotado a ``max_chars``.
+    """
+    pages: Dict[int, List[str]] = {}
+    for item in text_items:
+        pages.setdefault(item.get("page", 1), []).append(item.get("text", ""))
+    keywords = [k.lower() for field in fields for k in FIELD_HINTS.get(field, [])]
+    keywords += [a.lower() for a in anchors if a]
+
+    def score(page_lines: List[str]) -> int:
+        text = "\n".join(page_lines).lower()
+        return sum(text.count(keyword) for keyword in keywords)
+
+    ranked = sorted(pages.items(), key=lambda kv: (-score(kv[1]), kv[0]))
+    chosen = sorted(ranked[:max_pages], key=lambda kv: kv[0])
+    excerpt = "\n".join(f"[Page {page}] {line}" for page, lines in chosen for line in lines)
+    return excerpt[:max_chars]
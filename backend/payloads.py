@@ -0,0 +1,178 @@
+"""Respuestas más livianas: texto OCR en formato columnar (opcional) y compresión gzip/br negociada."""
+
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Union
+
+from starlette.datastructures import Headers, MutableHeaders
+
+PAYLOAD_COMPRESSION_ENABLED = os.getenv("PAYLOAD_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Por debajo de este tamaño comprimir no ahorra lo que cuesta.
+PAYLOAD_COMPRESS_MIN_BYTES = int(os.getenv("PAYLOAD_COMPRESS_MIN_BYTES", "1024"))
+PAYLOAD_GZIP_LEVEL = int(os.getenv("PAYLOAD_GZIP_LEVEL", "6"))
+# Calidad baja a propósito: cada respuesta se comprime al vuelo; las calidades altas son para contenido estático.
+PAYLOAD_BROTLI_QUALITY = int(os.getenv("PAYLOAD_BROTLI_QUALITY", "4"))
+
+TEXT_FORMAT_LINES = "lines"
+TEXT_FORMAT_COLUMNAR = "columnar"
+TEXT_FORMATS = (TEXT_FORMAT_LINES, TEXT_FORMAT_COLUMNAR)
+
+try:  # br es opcional: sin el paquete brotli solo se negocia gzip
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+
+def compact_lines(lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    ``extracted_text`` columnar: los textos en un arreglo, ``page_offsets[i]:page_offsets[i+1]`` son las líneas
+    de ``pages[i]`` y ``confidence`` es un solo número si es igual en todas las líneas (el caso normal).
+    """
+    pages: List[int] = []
+    offsets: List[int] = []
+    texts: List[str] = []
+    confidences: List[Any] = []
+    for index, line in enumerate(lines):
+        page = line.get("page", 1)
+        if not pages or pages[-1] != page:
+            pages.append(page)
+            offsets.append(index)
+        texts.append(line["text"])
+        confidences.append(line.get("confidence"))
+    offsets.append(len(lines))
+    constant = bool(confidences) and confidences.count(confidences[0]) == len(confidences)
+    return {
+        "format": TEXT_FORMAT_COLUMNAR,
+        "pages": pages,
+        "page_offsets": offsets,
+        "text": texts,
+        "confidence": confidences[0] if constant else confidences,
+    }
+
+
+def expand_lines(value: Union[List[Dict[str, Any]], Dict[str, Any], None]) -> List[Dict[str, Any]]:
+    """Vuelve al formato de una línea por dict; acepta ambos formatos (p. ej. en /api/chat/document)."""
+    if not isinstance(value, dict):
+        return value or []
+    if value.get("format") != TEXT_FORMAT_COLUMNAR:
+        raise ValueError(f"Formato de extracted_text desconocido: {value.get('format')}")
+    texts = value["text"]
+    confidence = value.get("confidence")
+    per_line = confidence if isinstance(confidence, list) else None
+    offsets = value["page_offsets"]
+    lines: List[Dict[str, Any]] = []
+    for page, start, end in zip(value["pages"], offsets, offsets[1:]):
+        for index in range(start, end):
+            lines.append(
+                {"text": texts[index], "confidence": per_line[index] if per_line is not None else confidence, "page": page}
+            )
+    return lines
+
+
+def encode_text(lines: List[Dict[str, Any]], text_format: str) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    return compact_lines(lines) if text_format == TEXT_FORMAT_COLUMNAR else lines
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """``br`` o ``gzip`` según Accept-Encoding (con q-values); ante empate gana br. None si no acepta ninguno."""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    def accepted(name: str) -> float:
+        return weights.get(name, weights.get("*", 0.0))
+
+    best = max(supported, key=accepted)  # max devuelve el primero entre iguales
+    return best if accepted(best) > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str) -> None:
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=PAYLOAD_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(PAYLOAD_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + self._brotli.finish() if final else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush() if final else out
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime las respuestas JSON (``application/json``) con br o gzip según el
+    Accept-Encoding del cliente. Respuestas de un solo bloque se comprimen enteras con Content-Length;
+    las que llegan en partes (StreamingResponse) se comprimen a medida que salen.
+    """
+
+    def __init__(self, app, minimum_size: int = PAYLOAD_COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PAYLOAD_COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Dict[str, Any]] = None
+        compressor: Optional[_Compressor] = None
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=start["headers"])
+                compressible = (
+                    headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if not compressible:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    body = compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                del headers["Content-Length"]
+                await send(start)
+            if compressor is None:
+                await send(message)
+                return
+            await send(
+                {"type": "http.response.body", "body": compressor.compress(body, final=not more_body), "more_body": more_body}
+            )
+
+        await self.app(scope, receive, compressing_send)
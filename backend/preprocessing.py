@@ -0,0 +1,143 @@
+"""Pre-procesamiento opcional de imágenes antes del OCR para reducir el payload enviado a Document Intelligence."""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from . import telemetry
+
+OCR_PREPROCESS_ENABLED = os.getenv("OCR_PREPROCESS_ENABLED", "false").lower() in ("1", "true", "yes")
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_SIDE_PX = int(os.getenv("OCR_MAX_SIDE_PX", "3500"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_PREPROCESS_WORKERS = int(os.getenv("OCR_PREPROCESS_WORKERS", "2"))
+# Ángulos fuera de este rango suelen ser rotaciones de 90° o falsos positivos; no se corrigen.
+MAX_DESKEW_DEGREES = 15.0
+MIN_DESKEW_DEGREES = 0.3
+
+IMAGE_CONTENT_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/tiff", "image/bmp", "image/webp"}
+
+PREPROCESS_BYTES_SAVED = telemetry.counter(
+    "idp_preprocess_bytes_saved_total", "Bytes ahorrados en el payload de OCR por el pre-procesamiento."
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _read_dpi(data: bytes) -> Optional[float]:
+    from io import BytesIO
+
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            dpi = img.info.get("dpi")
+    except Exception:
+        return None
+    if not dpi:
+        return None
+    value = float(dpi[0] if isinstance(dpi, tuple) else dpi)
+    # Muchas cámaras reportan 72 dpi sin significado real; en ese caso manda el tamaño máximo.
+    return value if value > 96 else None
+
+
+def _page_count(data: bytes) -> int:
+    from io import BytesIO
+
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            return getattr(img, "n_frames", 1)
+    except Exception:
+        return 1
+
+
+def _deskew_angle(gray) -> float:
+    import cv2
+    import numpy as np
+
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    coords = np.column_stack(np.where(thresh > 0))
+    if len(coords) < 100:
+        return 0.0
+    angle = cv2.minAreaRect(coords[:, ::-1].astype(np.float32))[-1]
+    # El rango que devuelve minAreaRect cambió entre versiones de OpenCV; se normaliza a [-45, 45].
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return float(angle)
+
+
+def preprocess_image(data: bytes) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Normaliza DPI/tamaño, convierte a escala de grises, corrige la inclinación y re-codifica en JPEG.
+    Devuelve los bytes originales si el resultado no es más chico, o si la imagen tiene varias páginas (un TIFF
+    escaneado): ``imdecode`` solo lee la primera y el resto se perdería. Se ejecuta en un proceso del pool.
+    """
+    import cv2
+    import numpy as np
+
+    start = time.perf_counter()
+    if _page_count(data) > 1:
+        return data, {"applied": False, "reason": "multi_page"}
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return data, {"applied": False, "reason": "decode_failed"}
+
+    height, width = gray.shape[:2]
+    scale = 1.0
+    dpi = _read_dpi(data)
+    if dpi and dpi > OCR_TARGET_DPI:
+        scale = OCR_TARGET_DPI / dpi
+    scale = min(scale, OCR_MAX_SIDE_PX / max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    angle = _deskew_angle(gray)
+    if MIN_DESKEW_DEGREES <= abs(angle) <= MAX_DESKEW_DEGREES:
+        h, w = gray.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        gray = cv2.warpAffine(gray, matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    else:
+        angle = 0.0
+
+    ok, encoded = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, OCR_JPEG_QUALITY])
+    info: Dict[str, Any] = {
+        "scale": round(scale, 4),
+        "deskew_degrees": round(angle, 2),
+        "duration": time.perf_counter() - start,
+    }
+    if not ok or len(encoded) >= len(data):
+        return data, dict(info, applied=False, reason="not_smaller")
+    return encoded.tobytes(), dict(info, applied=True, content_type="image/jpeg")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=OCR_PREPROCESS_WORKERS)
+    return _pool
+
+
+def should_preprocess(file_type: Optional[str]) -> bool:
+    return OCR_PREPROCESS_ENABLED and (file_type or "").lower() in IMAGE_CONTENT_TYPES
+
+
+async def preprocess_for_ocr(data: bytes) -> Tuple[bytes, Dict[str, Any]]:
+    """Ejecuta ``preprocess_image`` en el pool de procesos y reporta los bytes ahorrados."""
+    loop = asyncio.get_running_loop()
+    with telemetry.track("ocr_preprocess"):
+        processed, info = await loop.run_in_executor(_get_pool(), preprocess_image, data)
+    saved = len(data) - len(processed)
+    info.update({"original_bytes": len(data), "processed_bytes": len(processed), "bytes_saved": saved})
+    if saved > 0:
+        PREPROCESS_BYTES_SAVED.inc(saved)
+    return processed, info
@@ -0,0 +1,175 @@
+"""
+Perfilado bajo demanda de solicitudes en vivo y registro de las solicitudes lentas.
+
+Con ``PROFILING_ENABLED`` una solicitud se perfila si trae ``X-Profile: <PROFILING_TOKEN>`` o si sale sorteada
+con ``PROFILING_SAMPLE_RATE``. El perfil es estadístico: un hilo toma las pilas de todos los hilos cada
+``PROFILING_INTERVAL_MS`` mientras dura la solicitud (el trabajo pasa por el event loop y el threadpool) y las
+guarda en formato colapsado (``flamegraph.pl``, speedscope) en ``PROFILING_DIR``. Si hay otras solicitudes en
+curso sus pilas también aparecen; se perfila una solicitud a la vez. Desactivado no se ejecuta nada de este módulo.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from . import telemetry
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+# Corta el muestreo de solicitudes que no terminan (streams largos, clientes colgados).
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "120"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_SLOW_REQUEST_SECONDS = float(os.getenv("PROFILING_SLOW_REQUEST_SECONDS", "2"))
+PROFILING_SLOW_REQUESTS = int(os.getenv("PROFILING_SLOW_REQUESTS", "50"))
+
+PROFILES = telemetry.counter("idp_profiles_total", "Solicitudes perfiladas por disparador (header/sample).")
+SLOW_REQUESTS = telemetry.counter("idp_slow_requests_total", "Solicitudes más lentas que el umbral, por ruta.")
+
+# Pilas cuyo último frame es una espera: hilos ociosos del threadpool o el event loop sin trabajo.
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+class Sampler(threading.Thread):
+    """Muestrea ``sys._current_frames()`` a intervalo fijo y cuenta las pilas colapsadas."""
+
+    def __init__(self, interval: float, max_seconds: float) -> None:
+        super().__init__(name="idp-profiler", daemon=True)
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._labels: Dict[Any, str] = {}
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stack = self._collapse(frame)
+                    if stack:
+                        self.stacks[stack] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def _collapse(self, frame: Any) -> Optional[str]:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+            return None
+        labels: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _short_path(filename: str) -> str:
+    """Ruta relativa al paquete (``backend/services.py``, ``pandas/io/sql.py``) para que las etiquetas sean legibles."""
+    parts = filename.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            return "/".join(parts[parts.index(marker) + 1 :])
+    return "/".join(parts[-2:])
+
+
+class Profile:
+    def __init__(self, trigger: str) -> None:
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.trigger = trigger
+        self.sampler = Sampler(PROFILING_INTERVAL_MS / 1000, PROFILING_MAX_SECONDS)
+        self.path: Optional[str] = None
+
+
+_active_lock = threading.Lock()
+_active: Optional[Profile] = None
+_slow: Deque[Dict[str, Any]] = deque(maxlen=PROFILING_SLOW_REQUESTS)
+
+
+def _trigger(headers: Any) -> Optional[str]:
+    if PROFILING_TOKEN and headers.get("x-profile") == PROFILING_TOKEN:
+        return "header"
+    if PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def start(headers: Any) -> Optional[Profile]:
+    """Arranca el muestreo si la solicitud lo pide (o sale sorteada) y no hay otro perfil en curso."""
+    global _active
+    trigger = _trigger(headers)
+    if trigger is None:
+        return None
+    with _active_lock:
+        if _active is not None:
+            return None
+        _active = profile = Profile(trigger)
+    profile.sampler.start()
+    PROFILES.inc(trigger=trigger)
+    return profile
+
+
+def finish(
+    profile: Optional[Profile],
+    method: str,
+    route: str,
+    status: int,
+    elapsed: float,
+    timings: List[Tuple[str, float]],
+) -> None:
+    """
+    Detiene el perfil (si hay) y lo guarda; registra la solicitud si superó el umbral de lentitud.
+    Con perfil espera al hilo de muestreo y escribe a disco: llamarla fuera del event loop.
+    """
+    global _active
+    if profile is not None:
+        profile.sampler.stop()
+        with _active_lock:
+            _active = None
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        profile.path = os.path.join(PROFILING_DIR, f"{profile.id}.folded")
+        with open(profile.path, "w", encoding="utf-8") as fh:
+            fh.write(profile.sampler.folded())
+    if elapsed >= PROFILING_SLOW_REQUEST_SECONDS or profile is not None:
+        if elapsed >= PROFILING_SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc(route=route)
+        _slow.append(
+            {
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "method": method,
+                "route": route,
+                "status": status,
+                "total_ms": round(elapsed * 1000, 1),
+                "stages_ms": {stage: round(s * 1000, 1) for stage, s in telemetry.stage_totals(timings).items()},
+                "profile": profile.path if profile is not None else None,
+                "profile_samples": profile.sampler.samples if profile is not None else None,
+            }
+        )
+
+
+def recent_requests() -> List[Dict[str, Any]]:
+    """Solicitudes lentas (y perfiladas) recientes, la más nueva primero."""
+    return list(reversed(_slow))
+
+
+def authorized(headers: Any) -> bool:
+    """Sin ``PROFILING_TOKEN`` configurado nadie está autorizado."""
+    return bool(PROFILING_TOKEN) and headers.get("x-profile") == PROFILING_TOKEN
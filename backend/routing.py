@@ -0,0 +1,117 @@
+"""Selección de modelo (o deployment de Azure) por punto de llamada, con escalamiento al tier grande."""
+
+import json
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import telemetry
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+
+# Con OPENAI_API_KEY se usan nombres de modelo; con AzureOpenAI, nombres de deployment.
+_PROVIDER_PREFIX = "OPENAI_MODEL" if os.getenv("OPENAI_API_KEY") else "AZURE_OPENAI_DEPLOYMENT"
+MODELS: Dict[str, str] = {
+    TIER_SMALL: os.getenv(f"{_PROVIDER_PREFIX}_SMALL", "gpt-4o-mini"),
+    TIER_LARGE: os.getenv(f"{_PROVIDER_PREFIX}_LARGE", "gpt-4o"),
+}
+# Entradas más grandes que esto van directo al tier grande, si está configurado (0 desactiva la regla).
+LARGE_ABOVE_TOKENS = int(os.getenv("OPENAI_ROUTE_LARGE_ABOVE_TOKENS", "100000"))
+# El tier grande se usa por tamaño o al escalar solo si está configurado explícitamente (el nombre por defecto
+# puede no existir como deployment de Azure).
+_LARGE_CONFIGURED = bool(os.getenv(f"{_PROVIDER_PREFIX}_LARGE"))
+ESCALATION_ENABLED = os.getenv("OPENAI_ROUTE_ESCALATION", str(_LARGE_CONFIGURED)).lower() in ("1", "true", "yes")
+
+# USD por millón de tokens (entrada, salida). Se puede sobrescribir con OPENAI_MODEL_PRICES (JSON).
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("OPENAI_MODEL_PRICES", "{}")).items()})
+# Fracción del precio de entrada que se cobra por los tokens servidos desde el caché de prompts.
+CACHED_PROMPT_PRICE_FACTOR = float(os.getenv("OPENAI_CACHED_PROMPT_PRICE_FACTOR", "0.5"))
+# Fracción del precio que se cobra por las solicitudes de la Batch API.
+BATCH_PRICE_FACTOR = float(os.getenv("OPENAI_BATCH_PRICE_FACTOR", "0.5"))
+
+ROUTE_DECISIONS = telemetry.counter("idp_model_route_decisions_total", "Decisiones de ruteo por punto de llamada, tier y motivo.")
+ROUTE_SECONDS = telemetry.histogram("idp_model_route_duration_seconds", "Latencia de llamadas al modelo por tier.")
+ROUTE_TOKENS = telemetry.counter("idp_model_route_tokens_total", "Tokens por tier y tipo.")
+ROUTE_COST = telemetry.counter("idp_model_route_cost_usd_total", "Costo estimado (USD) por tier.")
+
+
+@dataclass(frozen=True)
+class Route:
+    call_site: str
+    tier: str
+    model: str
+    reason: str
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"call_site": self.call_site, "tier": self.tier, "model": self.model, "reason": self.reason}
+
+
+def _site_setting(call_site: str, name: str) -> Optional[str]:
+    return os.getenv(f"OPENAI_ROUTE_{call_site.upper()}_{name}")
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Aproxima 1 token ~= 4 caracteres, igual que ``_estimate_tokens_fallback``."""
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+
+def choose(call_site: str, estimated_tokens: int = 0) -> Route:
+    """
+    Elige el tier inicial: OPENAI_ROUTE_<SITE>_TIER fuerza un tier; si no, las entradas por encima de
+    OPENAI_ROUTE_<SITE>_LARGE_ABOVE_TOKENS (o el umbral global) van al tier grande, si hay uno configurado
+    (global o del punto de llamada), y el resto al chico.
+    """
+    forced = _site_setting(call_site, "TIER")
+    threshold = int(_site_setting(call_site, "LARGE_ABOVE_TOKENS") or LARGE_ABOVE_TOKENS)
+    large_configured = _LARGE_CONFIGURED or bool(_site_setting(call_site, "MODEL_LARGE"))
+    if forced in (TIER_SMALL, TIER_LARGE):
+        tier, reason = forced, "configured"
+    elif threshold and estimated_tokens > threshold and large_configured:
+        tier, reason = TIER_LARGE, "input_size"
+    else:
+        tier, reason = TIER_SMALL, "default"
+    model = _site_setting(call_site, f"MODEL_{tier.upper()}") or MODELS[tier]
+    ROUTE_DECISIONS.inc(call_site=call_site, tier=tier, reason=reason)
+    return Route(call_site, tier, model, reason)
+
+
+def escalate(route: Route, reason: str) -> Optional[Route]:
+    """Devuelve la ruta al tier grande tras un fallo de validación, o None si no hay a dónde escalar."""
+    if not ESCALATION_ENABLED or route.tier == TIER_LARGE:
+        return None
+    model = _site_setting(route.call_site, "MODEL_LARGE") or MODELS[TIER_LARGE]
+    ROUTE_DECISIONS.inc(call_site=route.call_site, tier=TIER_LARGE, reason=reason)
+    return replace(route, tier=TIER_LARGE, model=model, reason=reason)
+
+
+def estimate_cost(
+    model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, batch: bool = False
+) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    billed_in = prompt_tokens - cached_tokens + cached_tokens * CACHED_PROMPT_PRICE_FACTOR
+    cost = (billed_in * price_in + completion_tokens * price_out) / 1_000_000
+    return cost * BATCH_PRICE_FACTOR if batch else cost
+
+
+def record(route: Route, elapsed: float, usage: Any) -> None:
+    """Registra latencia, tokens y costo estimado de una llamada ya realizada."""
+    ROUTE_SECONDS.observe(elapsed, call_site=route.call_site, tier=route.tier)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    if prompt_tokens:
+        ROUTE_TOKENS.inc(prompt_tokens, tier=route.tier, kind="prompt")
+    if completion_tokens:
+        ROUTE_TOKENS.inc(completion_tokens, tier=route.tier, kind="completion")
+    cached_tokens = telemetry.cached_prompt_tokens(usage)
+    if cached_tokens:
+        ROUTE_TOKENS.inc(cached_tokens, tier=route.tier, kind="cached_prompt")
+    cost = estimate_cost(route.model, prompt_tokens, completion_tokens, cached_tokens)
+    if cost:
+        ROUTE_COST.inc(cost, tier=route.tier, model=route.model)
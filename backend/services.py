@@ -1,25 +1,41 @@
 import base64
+import copy
+import hashlib
 import io
 import json
+import logging
 from math import ceil
 import os
 import re
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
-
-import pandas as pd
-import pyodbc
-import requests
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
 from fastapi import HTTPException, UploadFile
-from openai import AzureOpenAI, OpenAI
 
+from . import (
+    answers,
+    comparison,
+    document_store,
+    extraction_schema,
+    preprocessing,
+    routing,
+    similarity,
+    sql_templates,
+    tabular,
+    telemetry,
+    validation,
+)
 from .prompts import SYSTEM_PROMPTS, SYSTEM_PROMPT_DEFAULT
 
-load_dotenv()
+if TYPE_CHECKING:  # pragma: no cover - solo para anotaciones
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
 AZURE_KEY = os.getenv("AZURE_KEY")
@@ -42,26 +58,151 @@ GRAPH_CLIENT_ID = os.getenv("AZURE_AD_CLIENT_ID")
 GRAPH_CLIENT_SECRET = os.getenv("AZURE_AD_CLIENT_SECRET")
 GRAPH_TENANT_ID = os.getenv("AZURE_AD_TENANT_ID")
 MAIL_SENDER = os.getenv("MAIL_SENDER") or SMTP_FROM
+SQL_COLUMNS_CACHE_TTL = float(os.getenv("SQL_COLUMNS_CACHE_TTL_SECONDS", "600"))
+SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", "200"))
+# Supuestos de la estimación previa al OCR (admisión): texto y líneas por página, tamaño de la respuesta.
+PREFLIGHT_CHARS_PER_PAGE = int(os.getenv("PREFLIGHT_CHARS_PER_PAGE", "2500"))
+PREFLIGHT_LINES_PER_PAGE = int(os.getenv("PREFLIGHT_LINES_PER_PAGE", "40"))
+PREFLIGHT_RESPONSE_CHARS = int(os.getenv("PREFLIGHT_RESPONSE_CHARS", "1500"))
 
 IMAGES_DIR = "processed_images"
-os.makedirs(IMAGES_DIR, exist_ok=True)
 
-document_client = DocumentAnalysisClient(
-    endpoint=AZURE_ENDPOINT,
-    credential=AzureKeyCredential(AZURE_KEY),
-)
+# Los SDK (Azure, OpenAI), pandas, pyodbc y requests se importan recién cuando un endpoint los necesita,
+# para que el arranque en frío de cada worker no pague ese costo antes de responder /api/status.
+_clients_lock = threading.Lock()
+_document_client = None
+_openai_client = None
+_odbc_module = None
+_http_module = None
+_background_pool: Optional[ThreadPoolExecutor] = None
+
+_columns_lock = threading.Lock()
+_columns_cache: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+_columns_refreshing: set = set()
+
+
+def get_document_client():
+    """Devuelve el DocumentAnalysisClient del proceso, creándolo en el primer uso."""
+    global _document_client
+    if _document_client is None:
+        with _clients_lock:
+            if _document_client is None:
+                from azure.ai.formrecognizer import DocumentAnalysisClient
+                from azure.core.credentials import AzureKeyCredential
+
+                os.makedirs(IMAGES_DIR, exist_ok=True)
+                _document_client = DocumentAnalysisClient(
+                    endpoint=AZURE_ENDPOINT,
+                    credential=AzureKeyCredential(AZURE_KEY),
+                )
+    return _document_client
+
+
+def get_openai_client():
+    """Devuelve el cliente OpenAI (o AzureOpenAI si no hay OPENAI_API_KEY), creándolo en el primer uso."""
+    global _openai_client
+    if _openai_client is None:
+        with _clients_lock:
+            if _openai_client is None:
+                if OPENAI_API_KEY:
+                    from openai import OpenAI
+
+                    _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+                else:
+                    from openai import AzureOpenAI
+
+                    _openai_client = AzureOpenAI(
+                        api_key=AZURE_OPENAI_API_KEY,
+                        api_version="2025-01-01-preview",
+                        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                    )
+    return _openai_client
+
+
+def _odbc():
+    global _odbc_module
+    if _odbc_module is None:
+        import pyodbc
+
+        _odbc_module = pyodbc
+    return _odbc_module
+
+
+def _http():
+    global _http_module
+    if _http_module is None:
+        import requests
+
+        _http_module = requests
+    return _http_module
+
+
+def configure_clients(document_client=None, openai_client=None, odbc=None, http=None) -> None:
+    """Inyecta clientes alternativos (p. ej. fakes de benchmarks) en lugar de los reales."""
+    global _document_client, _openai_client, _odbc_module, _http_module
+    with _clients_lock:
+        if document_client is not None:
+            _document_client = document_client
+        if openai_client is not None:
+            _openai_client = openai_client
+        if odbc is not None:
+            _odbc_module = odbc
+        if http is not None:
+            _http_module = http
+
+
+def _background() -> ThreadPoolExecutor:
+    """Pool chico para trabajo de E/S que se solapa con la solicitud (warmup de SQL, refresco de cachés)."""
+    global _background_pool
+    if _background_pool is None:
+        with _clients_lock:
+            if _background_pool is None:
+                _background_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="idp-background")
+    return _background_pool
+
+
+def _chat_completion(
+    call_site: str,
+    messages: List[Dict[str, Any]],
+    route: Optional[routing.Route] = None,
+    **kwargs: Any,
+):
+    """Llama a chat.completions con el modelo elegido por el ruteo y registra latencia, tokens y costo."""
+    route = route or routing.choose(call_site, routing.estimate_tokens(messages))
+    start = time.perf_counter()
+    with telemetry.track("openai", call_site=call_site):
+        response = get_openai_client().chat.completions.create(model=route.model, messages=messages, **kwargs)
+    usage = getattr(response, "usage", None)
+    telemetry.record_openai_usage(call_site, usage)
+    routing.record(route, time.perf_counter() - start, usage)
+    return response
+
+
+def _document_messages(system_prompt: str, document_block: str, question: str) -> List[Dict[str, str]]:
+    """
+    Arma los mensajes con un prefijo estable (instrucciones y documento) y la pregunta al final,
+    para que el caché automático de prompts del proveedor reutilice el prefijo entre preguntas.
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": document_block},
+        {"role": "user", "content": question},
+    ]
 
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-else:
-    openai_client = AzureOpenAI(
-        api_key=AZURE_OPENAI_API_KEY,
-        api_version="2025-01-01-preview",
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    )
 
-# Default model for chart generation (works for both OpenAI and AzureOpenAI if deployed)
-CHART_MODEL = "gpt-4o-mini"
+class SqlExecutionError(HTTPException):
+    """Error de la base al ejecutar una consulta generada (a diferencia de errores de configuración)."""
+
+
+EXTRACTION_REPAIR_MAX_PASSES = int(os.getenv("EXTRACTION_REPAIR_MAX_PASSES", "1"))
+EXTRACTION_REPAIR_PASSES = telemetry.counter(
+    "idp_extraction_repair_passes_total", "Re-preguntas dirigidas para corregir campos inválidos de la extracción."
+)
+EXTRACTION_REPAIR_SYSTEM_PROMPT = (
+    "You correct specific fields of a contract data extraction. Use only the document excerpt provided. "
+    'Return a JSON object {"contracts": [{"index": <contract index>, "<field>": <value>}]} containing only '
+    "the requested fields. Dates must use YYYY-MM-DD. Use null when the value is not in the excerpt."
+)
 
 
 def _warmup_sql_connection(conn_str: str, context: str, retries: int = DEFAULT_DB_RETRIES, backoff: float = DEFAULT_DB_WAIT) -> None:
@@ -72,11 +213,12 @@ def _warmup_sql_connection(conn_str: str, context: str, retries: int = DEFAULT_D
     last_exc: Optional[Exception] = None
     for attempt in range(1, retries + 1):
         try:
-            with pyodbc.connect(conn_str, timeout=5) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1")
-                cursor.fetchone()
-                cursor.close()
+            with telemetry.track("sql_connect", db=context):
+                with _odbc().connect(conn_str, timeout=5) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                    cursor.close()
             return
         except Exception as exc:  # pragma: no cover - external
             last_exc = exc
@@ -104,7 +246,8 @@ def send_token_request_email(full_name: str, email: str) -> None:
             "scope": "https://graph.microsoft.com/.default",
         }
         try:
-            resp = requests.post(token_url, data=data, timeout=10)
+            with telemetry.track("graph", op="token"):
+                resp = _http().post(token_url, data=data, timeout=10)
             resp.raise_for_status()
             access_token = resp.json().get("access_token")
         except Exception as exc:
@@ -121,7 +264,8 @@ def send_token_request_email(full_name: str, email: str) -> None:
         }
         headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
         try:
-            r = requests.post(url, headers=headers, json=payload, timeout=10)
+            with telemetry.track("graph", op="send_mail"):
+                r = _http().post(url, headers=headers, json=payload, timeout=10)
             if r.status_code >= 400:
                 raise HTTPException(
                     status_code=500,
@@ -150,7 +294,7 @@ def send_token_request_email(full_name: str, email: str) -> None:
     msg.set_content(body)
 
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
+        with telemetry.track("smtp"), smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
             server.starttls()
             server.login(SMTP_USER, SMTP_PASS)
             server.send_message(msg)
@@ -182,7 +326,8 @@ def send_specialist_request_email(full_name: str, email: str, company: str = "",
             "scope": "https://graph.microsoft.com/.default",
         }
         try:
-            resp = requests.post(token_url, data=data, timeout=10)
+            with telemetry.track("graph", op="token"):
+                resp = _http().post(token_url, data=data, timeout=10)
             resp.raise_for_status()
             access_token = resp.json().get("access_token")
         except Exception as exc:
@@ -199,7 +344,8 @@ def send_specialist_request_email(full_name: str, email: str, company: str = "",
         }
         headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
         try:
-            r = requests.post(url, headers=headers, json=payload, timeout=10)
+            with telemetry.track("graph", op="send_mail"):
+                r = _http().post(url, headers=headers, json=payload, timeout=10)
             if r.status_code >= 400:
                 raise HTTPException(
                     status_code=500,
@@ -229,7 +375,7 @@ def send_specialist_request_email(full_name: str, email: str, company: str = "",
     msg.set_content(html_body, subtype="html")
 
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
+        with telemetry.track("smtp"), smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
             server.starttls()
             server.login(SMTP_USER, SMTP_PASS)
             server.send_message(msg)
@@ -241,7 +387,7 @@ def preprocess_string(s: Any) -> str:
     if isinstance(s, (int, float)):
         return str(s)
     s = str(s)
-    s = re.sub(r"[^a-zA-Z0-9\s]", "", s)
+    s = validation.NON_ALNUM.sub("", s)
     s = " ".join(s.split())
     return s.lower()
 
@@ -251,8 +397,7 @@ def flexible_string_match(s1: Any, s2: Any) -> bool:
 
 
 def compare_dates(date1: str, date2: str) -> bool:
-    formats = ["%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y"]
-    for fmt in formats:
+    for fmt in validation.DATE_FORMATS:
         try:
             d1 = datetime.strptime(date1, fmt)
             d2 = datetime.strptime(date2, fmt)
@@ -262,38 +407,152 @@ def compare_dates(date1: str, date2: str) -> bool:
     return False
 
 
-def process_with_openai(text: List[Dict[str, Any]], system_prompt: str) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+def extraction_messages(text: List[Dict[str, Any]], system_prompt: str) -> List[Dict[str, str]]:
+    """Mensajes de la extracción completa (también los usa el modo bulk de ``backend.bulk``)."""
     formatted_text = "\n".join(
         [
             f"[Page {item.get('page', 1)}] {item['text']} (Confidence: {item['confidence']:.2f})"
             for item in text
         ]
     )
+    return _document_messages(
+        system_prompt,
+        f"Portuguese contract text. Each line is followed by its confidence score:\n\n{formatted_text}",
+        "Process the contract text above following the system instructions and return the data in JSON format.",
+    )
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {
-                "role": "user",
-                "content": (
-                    "Process the following Portuguese contract text following "
-                    "the system instructions and return the data in JSON format. "
-                    f"Each line is followed by its confidence score:\n\n{formatted_text}"
-                ),
-            },
-        ],
-        response_format={"type": "json_object"},
+
+def process_with_openai(
+    text: List[Dict[str, Any]], system_prompt: str, route: Optional[routing.Route] = None
+) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+    return _extraction_call(extraction_messages(text, system_prompt), route)
+
+
+def process_with_openai_delta(
+    previous_response: Dict[str, Any],
+    changed_text: List[Dict[str, Any]],
+    removed_text: List[str],
+    system_prompt: str,
+    route: Optional[routing.Route] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+    """
+    Actualiza la extracción de una versión anterior enviando solo las páginas que cambiaron,
+    en lugar del documento completo.
+    """
+    changed = "\n".join(
+        f"[Page {item.get('page', 1)}] {item['text']} (Confidence: {item['confidence']:.2f})" for item in changed_text
+    )
+    removed = "\n".join(removed_text) or "(none)"
+    return _extraction_call(
+        _document_messages(
+            system_prompt,
+            (
+                "Extraction of the previous version of this contract:\n"
+                f"{json.dumps(previous_response, ensure_ascii=False)}\n\n"
+                f"Pages that changed in the new version, with confidence scores:\n{changed}\n\n"
+                f"Text of the previous version that is no longer present:\n{removed}"
+            ),
+            (
+                "Update the previous extraction so it reflects the new version. Keep every value that comes from "
+                "unchanged pages and return the complete data in the same JSON format."
+            ),
+        ),
+        route,
     )
+
+
+def _extraction_call(
+    messages: List[Dict[str, str]], route: Optional[routing.Route]
+) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+    response = _chat_completion("extraction", messages, route=route, response_format={"type": "json_object"})
     usage = getattr(response, "usage", None)
     usage_dict: Dict[str, Optional[int]] = {
         "prompt_tokens": getattr(usage, "prompt_tokens", None) if usage else None,
         "completion_tokens": getattr(usage, "completion_tokens", None) if usage else None,
         "total_tokens": getattr(usage, "total_tokens", None) if usage else None,
+        "cached_tokens": telemetry.cached_prompt_tokens(usage) if usage else None,
     }
     return json.loads(response.choices[0].message.content), usage_dict
 
 
+def repair_extraction(
+    payload: Dict[str, Any],
+    text_items: List[Dict[str, Any]],
+    max_passes: int = EXTRACTION_REPAIR_MAX_PASSES,
+) -> Dict[str, Any]:
+    """
+    Valida la extracción contra CONTRACT_SCHEMA y re-pregunta solo por los campos inválidos,
+    enviando las páginas relevantes en lugar del documento completo. Modifica ``payload`` in situ.
+    """
+    errors = extraction_schema.validate_extraction(payload)
+    report: Dict[str, Any] = {
+        "errors_initial": len(errors),
+        "repair_passes": 0,
+        "repair_tokens": 0,
+        "repaired_fields": [],
+    }
+    if any(error.contract_index is None for error in errors):
+        # Sin lista de contratos no hay campos puntuales que corregir.
+        report["errors_remaining"] = [error.as_dict() for error in errors]
+        return report
+
+    errors = extraction_schema.normalize_locally(payload, errors)
+    for _ in range(max_passes):
+        if not errors:
+            break
+        by_contract: Dict[int, List[str]] = {}
+        for error in errors:
+            by_contract.setdefault(error.contract_index, []).append(error.field)
+        contracts = payload["contracts"]
+        fields = sorted({field for names in by_contract.values() for field in names})
+        anchors = [str(contracts[i].get(key) or "") for i in by_contract for key in ("Customer", "Contract Number")]
+        excerpt = extraction_schema.select_excerpt(text_items, fields, anchors)
+        request = [
+            {"index": index, "fields": names, "current": {name: contracts[index].get(name) for name in names}}
+            for index, names in by_contract.items()
+        ]
+
+        response = _chat_completion(
+            "extraction_repair",
+            [
+                {"role": "system", "content": EXTRACTION_REPAIR_SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Document excerpt:\n{excerpt}\n\n"
+                        f"Fields to fix:\n{json.dumps(request, ensure_ascii=False)}"
+                    ),
+                },
+            ],
+            response_format={"type": "json_object"},
+            temperature=0,
+        )
+        usage = getattr(response, "usage", None)
+        EXTRACTION_REPAIR_PASSES.inc()
+        report["repair_passes"] += 1
+        report["repair_tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+        try:
+            fixes = json.loads(response.choices[0].message.content or "{}").get("contracts", [])
+        except (ValueError, AttributeError):
+            fixes = []
+        for fix in fixes if isinstance(fixes, list) else []:
+            index = fix.get("index") if isinstance(fix, dict) else None
+            for name in by_contract.get(index, []):
+                if name in fix:
+                    contracts[index][name] = fix[name]
+
+        failing_before = {(error.contract_index, error.field) for error in errors}
+        errors = extraction_schema.normalize_locally(payload, extraction_schema.validate_extraction(payload))
+        failing_after = {(error.contract_index, error.field) for error in errors}
+        report["repaired_fields"].extend(
+            {"contract_index": index, "field": name} for index, name in sorted(failing_before - failing_after)
+        )
+
+    report["errors_remaining"] = [error.as_dict() for error in errors]
+    return report
+
+
 def _estimate_tokens_fallback(text_items: List[Dict[str, Any]], system_prompt: str, response_obj: Dict[str, Any]) -> int:
     """
     Estima tokens cuando la API no devuelve usage o parece subestimado.
@@ -306,131 +565,347 @@ def _estimate_tokens_fallback(text_items: List[Dict[str, Any]], system_prompt: s
     return ceil(total_chars / 4)
 
 
+def tokens_to_credits(tokens: int) -> int:
+    """Créditos de la PoC que descuenta una operación: uno cada 1000 tokens, mínimo uno."""
+    return max(1, ceil(tokens / 1000))
+
+
+def estimate_document_credits(page_count: int, system_prompt: str) -> int:
+    """
+    Créditos estimados antes del OCR, con la misma regla que ``_estimate_tokens_fallback``: por página se suponen
+    ``PREFLIGHT_LINES_PER_PAGE`` líneas con ``PREFLIGHT_CHARS_PER_PAGE`` caracteres en total, más una respuesta
+    de ``PREFLIGHT_RESPONSE_CHARS``.
+    """
+    text_items = [{"text": ""}] * (page_count * PREFLIGHT_LINES_PER_PAGE)
+    tokens = _estimate_tokens_fallback(text_items, system_prompt, {})
+    tokens += ceil((page_count * PREFLIGHT_CHARS_PER_PAGE + PREFLIGHT_RESPONSE_CHARS) / 4)
+    return tokens_to_credits(tokens)
+
+
 async def process_document(
-    file_bytes: bytes,
+    file_bytes: Union[bytes, BinaryIO],
     file_type: str,
     file_name: str,
     custom_prompt: Optional[str] = None,
     language: str = "English",
+    content_hash: Optional[str] = None,
+    reuse_near_duplicates: bool = False,
+    batch_id: Optional[str] = None,
+    extract: bool = True,
+    tenant_key: str = "",
 ) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Ejecuta OCR (Document Intelligence) y extracción con OpenAI.
+    ``file_bytes`` puede ser el contenido completo o un archivo abierto (p. ej. el spool de la subida),
+    que se envía a Document Intelligence como stream sin cargarlo entero en memoria.
+    Los casi-duplicados (del mismo ``batch_id`` o del historial) se informan en las métricas; con
+    ``reuse_near_duplicates`` se reutiliza su extracción en lugar de llamar a OpenAI. Solo se buscan entre los
+    documentos de ``tenant_key`` (``admission.Tenant.key``); sin él (solicitudes anónimas) no se usa el índice.
+    Con ``extract=False`` solo se hace el OCR (la extracción queda para el modo bulk).
+    """
+    is_pdf = file_type == "application/pdf"
+    store = document_store.get_store() if document_store.INCREMENTAL_REPROCESS_ENABLED else None
+    # Huellas previas al OCR: por página en PDFs, el hash del archivo en imágenes.
+    page_fingerprints: List[str] = []
+    if store is not None:
+        if is_pdf:
+            page_fingerprints = document_store.pdf_page_fingerprints(file_bytes) or []
+        elif content_hash:
+            page_fingerprints = [content_hash]
+    base = store.find_base(page_fingerprints) if page_fingerprints else None
+    page_lines: Dict[int, List[Dict[str, Any]]] = {}
+    if base is not None:
+        for number, fingerprint in enumerate(page_fingerprints, start=1):
+            lines = base.lines_for(fingerprint)
+            if lines is not None:
+                page_lines[number] = lines
+    pages_reused = len(page_lines)
+    pending_pages = [n for n in range(1, len(page_fingerprints) + 1) if n not in page_lines]
+
+    preprocess_info: Dict[str, Any] = {"applied": False}
+    if (not page_fingerprints or pending_pages) and preprocessing.should_preprocess(file_type):
+        raw = file_bytes if isinstance(file_bytes, (bytes, bytearray)) else file_bytes.read()
+        file_bytes, preprocess_info = await preprocessing.preprocess_for_ocr(raw)
+    # Después del pre-procesamiento: textract_duration es solo Document Intelligence (el resto va en ocr_preprocess).
     textract_start_time = time.time()
-    all_extracted_text: List[Dict[str, Any]] = []
+    ocr_page_count = 0
     image_paths: List[str] = []
+    if not page_fingerprints or pending_pages:
+        labels = {} if is_pdf else {"preprocessed": "yes" if preprocess_info.get("applied") else "no"}
+        # Solo las páginas que no se pudieron reutilizar de la versión anterior.
+        options = {"pages": document_store.page_ranges(pending_pages)} if is_pdf and page_lines else {}
+        with telemetry.track("document_intelligence", **labels):
+            poller = get_document_client().begin_analyze_document(
+                model_id="prebuilt-read", document=file_bytes, **options
+            )
+            result = poller.result()
+        ocr_page_count = len(result.pages)
 
-    if file_type == "application/pdf":
-        poller = document_client.begin_analyze_document(
-            model_id="prebuilt-read", document=file_bytes
-        )
-        result = poller.result()
-
-        for page_num, page in enumerate(result.pages, start=1):
-            for line in page.lines:
-                all_extracted_text.append(
-                    {"text": line.content, "confidence": 0.98, "page": page_num}
-                )
-    else:
-        poller = document_client.begin_analyze_document(
-            model_id="prebuilt-read", document=file_bytes
-        )
-        result = poller.result()
-
-        for page in result.pages:
+        for index, page in enumerate(result.pages, start=1):
+            page_num = (getattr(page, "page_number", None) or index) if is_pdf else 1
             for line in page.lines:
-                all_extracted_text.append(
-                    {"text": line.content, "confidence": 0.97, "page": 1}
+                page_lines.setdefault(page_num, []).append(
+                    {"text": line.content, "confidence": 0.98 if is_pdf else 0.97}
                 )
 
     textract_duration = time.time() - textract_start_time
+    all_extracted_text: List[Dict[str, Any]] = [
+        dict(line, page=page_num) for page_num in sorted(page_lines) for line in page_lines[page_num]
+    ]
+    if is_pdf and page_fingerprints:
+        page_count = len(page_fingerprints)
+    else:
+        page_count = ocr_page_count or (base.page_count if base is not None else 1)
+    text_fps = document_store.text_fingerprints(all_extracted_text, max(page_lines or [1]))
+    if base is None and store is not None:
+        base = store.find_base(text_fps)
+    document_id = content_hash or hashlib.sha256("".join(text_fps).encode("utf-8")).hexdigest()
+
+    # Re-escaneos y copias firmadas tienen otros bytes y otras páginas: se comparan por MinHash del texto.
+    signature = None
+    near_duplicates: List[similarity.Match] = []
+    if similarity.SIMILARITY_ENABLED and tenant_key:
+        index = similarity.get_index()
+        signature = index.signature(similarity.shingles(all_extracted_text))
+        if signature is not None:
+            near_duplicates = index.query(signature, tenant_key, exclude=document_id, batch_id=batch_id)
 
     system_prompt = custom_prompt or SYSTEM_PROMPTS.get(language, SYSTEM_PROMPT_DEFAULT)
+    prompt_key = document_store.prompt_key(system_prompt)
+    duplicate_source: Optional[similarity.Match] = None
+    duplicate_extraction: Optional[Dict[str, Any]] = None
+    if reuse_near_duplicates and store is not None:
+        for match in near_duplicates:
+            stored = store.get(match.document) if match.similarity >= similarity.REUSE_THRESHOLD else None
+            if stored is not None and prompt_key in stored.extractions:
+                duplicate_source, duplicate_extraction = match, stored.extractions[prompt_key]
+                break
+    prior = base.extractions.get(prompt_key) if base is not None else None
+    previous_fps = set(base.text_fingerprints) if base is not None else set()
+    changed_pages = [n for n, fp in enumerate(text_fps, start=1) if fp not in previous_fps]
+    removed_fps = [fp for fp in (base.text_fingerprints if base is not None else []) if fp not in set(text_fps)]
+
     openai_start_time = time.time()
-    openai_response, usage = process_with_openai(all_extracted_text, system_prompt)
+    route: Optional[routing.Route] = None
+    validation_report: Optional[Dict[str, Any]] = None
+    escalated = False
+    if not extract:
+        extraction_mode = "skipped"
+        extraction_items: List[Dict[str, Any]] = []
+        openai_response: Dict[str, Any] = {}
+        usage: Dict[str, Optional[int]] = dict.fromkeys(
+            ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"), 0
+        )
+    elif prior is not None and not changed_pages and not removed_fps:
+        extraction_mode = "reused"
+        extraction_items = []
+        openai_response = copy.deepcopy(prior["response"])
+        usage = dict.fromkeys(("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"), 0)
+        validation_report = prior.get("validation")
+    elif prior is not None and len(changed_pages) <= document_store.INCREMENTAL_MAX_CHANGED_RATIO * len(text_fps):
+        extraction_mode = "delta"
+        extraction_items = [item for item in all_extracted_text if item["page"] in set(changed_pages)]
+        removed_text = [line["text"] for fp in removed_fps for line in base.pages.get(fp, [])]
+        route = routing.choose("extraction", _estimate_tokens_fallback(extraction_items, system_prompt, prior["response"]))
+        openai_response, usage = process_with_openai_delta(
+            prior["response"], extraction_items, removed_text, system_prompt, route=route
+        )
+    elif duplicate_extraction is not None:
+        extraction_mode = "near_duplicate"
+        extraction_items = []
+        openai_response = copy.deepcopy(duplicate_extraction["response"])
+        usage = dict.fromkeys(("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"), 0)
+        validation_report = duplicate_extraction.get("validation")
+    else:
+        extraction_mode = "full"
+        extraction_items = all_extracted_text
+        route = routing.choose("extraction", _estimate_tokens_fallback(all_extracted_text, system_prompt, {}))
+        openai_response, usage = process_with_openai(all_extracted_text, system_prompt, route=route)
+    reported_tokens = usage.get("total_tokens") or 0
+    if route is not None and custom_prompt is None and extraction_schema.uses_schema(system_prompt):
+        validation_report = repair_extraction(openai_response, all_extracted_text)
+        reported_tokens += validation_report["repair_tokens"]
+        larger_route = routing.escalate(route, "validation_failed") if validation_report["errors_remaining"] else None
+        if larger_route:
+            # La pasada barata (más las re-preguntas) no alcanzó: se repite la extracción con el tier grande.
+            # Si esa llamada falla se devuelve el resultado barato, como si no se hubiera escalado.
+            try:
+                retry_response, retry_usage = process_with_openai(all_extracted_text, system_prompt, route=larger_route)
+                retry_report = repair_extraction(retry_response, all_extracted_text)
+            except Exception as exc:  # pragma: no cover - external service
+                logger.warning("No se pudo escalar la extracción a %s: %s", larger_route.model, exc)
+            else:
+                reported_tokens += (retry_usage.get("total_tokens") or 0) + retry_report["repair_tokens"]
+                escalated = True
+                if len(retry_report["errors_remaining"]) < len(validation_report["errors_remaining"]):
+                    openai_response, usage, validation_report, route = retry_response, retry_usage, retry_report, larger_route
     openai_duration = time.time() - openai_start_time
 
-    reported_tokens = usage.get("total_tokens") or 0
-    estimated_tokens = _estimate_tokens_fallback(all_extracted_text, system_prompt, openai_response)
+    estimated_tokens = (
+        _estimate_tokens_fallback(extraction_items, system_prompt, openai_response) if route is not None else 0
+    )
     effective_tokens = max(reported_tokens, estimated_tokens)
-    tokens_to_consume = max(1, ceil(effective_tokens / 1000))
+    tokens_to_consume = tokens_to_credits(effective_tokens)
+
+    incremental: Optional[Dict[str, Any]] = None
+    if store is not None:
+        ocr_seconds_per_page = textract_duration / ocr_page_count if ocr_page_count else (
+            base.ocr_seconds_per_page if base is not None else 0.0
+        )
+        if base is not None:
+            ocr_seconds_saved = pages_reused * base.ocr_seconds_per_page
+            tokens_saved = 0
+            if extraction_mode != "full":
+                full_estimate = _estimate_tokens_fallback(all_extracted_text, system_prompt, openai_response)
+                tokens_saved = max(0, full_estimate - effective_tokens)
+            document_store.record_savings(pages_reused, ocr_seconds_saved, tokens_saved)
+            incremental = {
+                "base_document": base.sha256,
+                "base_file_name": base.file_name,
+                "pages_total": len(text_fps),
+                "pages_reused": pages_reused,
+                "pages_ocr": ocr_page_count,
+                "pages_changed": len(changed_pages),
+                "extraction": extraction_mode,
+                "ocr_seconds_saved": round(ocr_seconds_saved, 3),
+                "tokens_saved": tokens_saved,
+            }
+        store.save(
+            document_store.StoredDocument(
+                sha256=document_id,
+                file_name=file_name,
+                page_fingerprints=page_fingerprints,
+                text_fingerprints=text_fps,
+                pages={
+                    fp: page_lines.get(number, []) for number, fp in enumerate(text_fps, start=1)
+                },
+                page_count=page_count,
+                ocr_seconds_per_page=ocr_seconds_per_page,
+                extractions={
+                    prompt_key: {"response": openai_response, "tokens": reported_tokens, "validation": validation_report}
+                }
+                if extract
+                else {},
+            )
+        )
+
+    duplicates: Optional[Dict[str, Any]] = None
+    if near_duplicates:
+        reused = extraction_mode == "near_duplicate"
+        similarity.record_matches(near_duplicates, reused)
+        if reused and base is None:
+            tokens_saved = _estimate_tokens_fallback(all_extracted_text, system_prompt, openai_response)
+            document_store.record_savings(0, 0.0, tokens_saved)
+        duplicates = {
+            "matches": [match.as_dict() for match in near_duplicates],
+            "reused_from": duplicate_source.document if reused else None,
+        }
+    if signature is not None:
+        similarity.get_index().add(document_id, signature, file_name, tenant_key, batch_id=batch_id)
 
     metrics = {
         "textract_duration": textract_duration,
         "openai_duration": openai_duration,
         "total_text_lines": len(all_extracted_text),
-        "page_count": len(result.pages) if hasattr(result, "pages") else (len(image_paths) if image_paths else 1),
+        "page_count": page_count,
         "saved_images": image_paths,
         "openai_usage": usage,
         "openai_tokens": reported_tokens,
+        "openai_cached_tokens": usage.get("cached_tokens"),
         "openai_tokens_estimated": estimated_tokens,
         "openai_tokens_effective": effective_tokens,
         "tokens_to_consume": tokens_to_consume,
+        "content_sha256": content_hash,
+        "ocr_preprocess": preprocess_info,
+        "extraction_validation": validation_report,
+        "model_route": dict(route.as_dict(), escalated=escalated) if route is not None else None,
+        "incremental": incremental,
+        "near_duplicates": duplicates,
     }
 
     return openai_response, metrics, all_extracted_text
 
 
-def chat_with_document(extracted_text: List[Dict[str, Any]], question: str) -> str:
+CHAT_DOCUMENT_SYSTEM_PROMPT = (
+    "You are an assistant that answers questions about contract "
+    "documents. Use only the information provided in the document "
+    "text. If the answer is not in the document, say you don't know."
+)
+
+
+def document_chat_messages(extracted_text: List[Dict[str, Any]], question: str) -> List[Dict[str, str]]:
     formatted_text = "\n".join(
         [f"[Page {item.get('page', 1)}] {item['text']}" for item in extracted_text]
     )
-
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that answers questions about contract "
-                    "documents. Use only the information provided in the document "
-                    "text. If the answer is not in the document, say you don't know."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Here is the content of a contract document:\n\n"
-                    f"{formatted_text}\n\n"
-                    f"Answer this question about the document: {question}"
-                ),
-            },
-        ],
+    return _document_messages(
+        CHAT_DOCUMENT_SYSTEM_PROMPT,
+        f"Here is the content of a contract document:\n\n{formatted_text}",
+        f"Answer this question about the document: {question}",
     )
-    return response.choices[0].message.content
 
 
-def chat_with_database(data: pd.DataFrame, question: str) -> str:
-    data_str = data.to_string(index=False)
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that answers questions about contract "
-                    "databases. Use only the information provided in the Excel "
-                    "data. If the answer is not in the data, say you don't know. "
-                    "When appropriate, refer to specific rows or entries from the data."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Here is the content of a contract database:\n\n"
-                    f"{data_str}\n\n"
-                    f"Answer this question about the database: {question}"
-                ),
-            },
-        ],
-    )
+def chat_with_document(extracted_text: List[Dict[str, Any]], question: str) -> str:
+    response = _chat_completion("chat_document", document_chat_messages(extracted_text, question))
     return response.choices[0].message.content
 
 
+def chat_with_database(data: "pd.DataFrame", question: str) -> str:
+    """Pregunta sobre un DataFrame ya leído: se carga como tabla en memoria y se responde con SQL (ver ``tabular``)."""
+    import pandas as pd
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    digest.update("\x1f".join(map(str, data.columns)).encode("utf-8"))
+    table = tabular.table_for(digest.hexdigest(), lambda: data)
+    return chat_with_spreadsheet(table, question)["answer"]
+
+
 def _fetch_columns(table_name: str = "Contracts", schema: str = AZURE_SQL_SCHEMA) -> List[str]:
+    """
+    Columnas de la tabla con caché de SQL_COLUMNS_CACHE_TTL_SECONDS. Una entrada vencida se sigue
+    usando mientras se refresca en segundo plano, así la consulta del esquema no demora la generación de SQL.
+    """
+    if SQL_COLUMNS_CACHE_TTL <= 0:
+        return _query_columns(table_name, schema)
+    key = (schema, table_name)
+    with _columns_lock:
+        cached = _columns_cache.get(key)
+        stale = cached is not None and time.monotonic() - cached[0] > SQL_COLUMNS_CACHE_TTL
+        refresh = stale and key not in _columns_refreshing
+        if refresh:
+            _columns_refreshing.add(key)
+    telemetry.record_cache("sql_columns", cached is not None and not stale)
+    if cached is None:
+        cols = _query_columns(table_name, schema)
+        with _columns_lock:
+            _columns_cache[key] = (time.monotonic(), cols)
+        return cols
+    if refresh:
+        _background().submit(_refresh_columns, table_name, schema)
+    return cached[1]
+
+
+def _refresh_columns(table_name: str, schema: str) -> None:
+    key = (schema, table_name)
+    try:
+        cols = _query_columns(table_name, schema)
+        with _columns_lock:
+            _columns_cache[key] = (time.monotonic(), cols)
+    except Exception as exc:  # pragma: no cover - external service
+        print(f"No se pudieron refrescar las columnas de {schema}.{table_name}: {exc}")
+    finally:
+        with _columns_lock:
+            _columns_refreshing.discard(key)
+
+
+def _query_columns(table_name: str, schema: str) -> List[str]:
+    import pandas as pd
+
     conn_str = os.getenv("AZURE_SQL_CONNECTION_STRING")
     if not conn_str:
         raise HTTPException(status_code=500, detail="Missing AZURE_SQL_CONNECTION_STRING")
     try:
         _warmup_sql_connection(conn_str, context="contratos")
-        with pyodbc.connect(conn_str) as conn:
+        with telemetry.track("sql_query", query="columns"), _odbc().connect(conn_str) as conn:
             df_cols = pd.read_sql(
                 """
                 SELECT COLUMN_NAME
@@ -460,37 +935,69 @@ def _sanitize_sql(sql: str) -> str:
     return cleaned
 
 
-def _df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+def _df_to_records(df: "pd.DataFrame") -> List[Dict[str, Any]]:
     # Ensure Timestamps and other non-serializable types convert to ISO strings
     return json.loads(df.to_json(orient="records", date_format="iso"))
 
 
-def generate_sql_from_question(question: str, table_name: str = "Contracts") -> str:
-    cols = _fetch_columns(table_name)
+@dataclass
+class GeneratedSql:
+    sql: str
+    params: List[Any] = field(default_factory=list)
+    route: Optional[routing.Route] = None
+    template: Optional[sql_templates.Template] = None
+
+
+def generate_sql_from_question(
+    question: str,
+    table_name: str = "Contracts",
+    route: Optional[routing.Route] = None,
+    feedback: Optional[str] = None,
+    use_templates: bool = True,
+    columns: Optional[List[str]] = None,
+    dialect: str = "Azure SQL",
+) -> GeneratedSql:
+    """
+    Genera la consulta SELECT. Si la pregunta coincide con una plantilla aprendida se usa su SQL
+    parametrizado sin llamar al modelo; si no, el modelo chico la genera y, si no devuelve un SELECT,
+    se reintenta una vez con el tier grande. ``feedback`` describe un intento previo fallido.
+    ``columns`` describe una tabla que no es la de contratos (p. ej. una planilla): no usa plantillas.
+    """
+    if (
+        use_templates
+        and columns is None
+        and route is None
+        and feedback is None
+        and sql_templates.SQL_TEMPLATE_CACHE_ENABLED
+    ):
+        match = sql_templates.get_store().match(question, table_name)
+        if match:
+            return GeneratedSql(match.sql, match.params, template=match.template)
+
+    cols = columns if columns is not None else _fetch_columns(table_name)
     instruction = (
-        "You are a SQL assistant for Azure SQL. "
+        f"You are a SQL assistant for {dialect}. "
         f"Generate one SELECT statement on table {table_name} using these columns only: {', '.join(cols)}. "
         "Return ONLY the SQL. Never modify data. No updates/inserts/deletes. Prefer aggregated answers when possible."
     )
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": instruction},
-            {"role": "user", "content": question},
-        ],
-        max_tokens=300,
-        temperature=0.1,
-    )
-    raw_sql = response.choices[0].message.content or ""
-    sql = _sanitize_sql(raw_sql)
-
-    if not sql.lower().startswith("select"):
-        raise HTTPException(status_code=400, detail="Solo se permiten consultas SELECT.")
-
-    return sql
-
+    messages = [{"role": "system", "content": instruction}, {"role": "user", "content": question}]
+    if feedback:
+        messages.append({"role": "user", "content": feedback})
+    route = route or routing.choose("sql_generation", routing.estimate_tokens(messages))
+    while True:
+        response = _chat_completion("sql_generation", messages, route=route, max_tokens=300, temperature=0.1)
+        raw_sql = response.choices[0].message.content or ""
+        sql = _sanitize_sql(raw_sql)
+        if sql.lower().startswith("select"):
+            return GeneratedSql(sql, route=route)
+        route = routing.escalate(route, "invalid_sql")
+        if route is None:
+            raise HTTPException(status_code=400, detail="Solo se permiten consultas SELECT.")
+
+
+def run_sql_query(sql: str, params: Optional[List[Any]] = None, warmup: bool = True) -> "pd.DataFrame":
+    import pandas as pd
 
-def run_sql_query(sql: str) -> pd.DataFrame:
     conn_str = os.getenv("AZURE_SQL_CONNECTION_STRING")
     if not conn_str:
         raise HTTPException(status_code=500, detail="Missing AZURE_SQL_CONNECTION_STRING")
@@ -507,22 +1014,23 @@ def run_sql_query(sql: str) -> pd.DataFrame:
     sql = _coerce_payment_value(sql)
 
     try:
-        _warmup_sql_connection(conn_str, context="contratos")
-        with pyodbc.connect(conn_str) as conn:
-            df = pd.read_sql(sql, conn)
+        if warmup:
+            _warmup_sql_connection(conn_str, context="contratos")
+        with telemetry.track("sql_query", query="contracts"), _odbc().connect(conn_str) as conn:
+            df = pd.read_sql(sql, conn, params=params or None)
         return df
     except HTTPException:
         raise
     except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Error ejecutando SQL: {exc}")
+        raise SqlExecutionError(status_code=500, detail=f"Error ejecutando SQL: {exc}")
 
 
-def answer_from_dataframe(df: pd.DataFrame, question: str) -> str:
+def answer_from_dataframe(df: "pd.DataFrame", question: str) -> str:
     # Limit what we send to the model to a reasonable sample to keep responses fast.
     sample = _df_to_records(df.head(200))
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
+    response = _chat_completion(
+        "sql_answer",
+        [
             {
                 "role": "system",
                 "content": (
@@ -530,21 +1038,108 @@ def answer_from_dataframe(df: pd.DataFrame, question: str) -> str:
                     "Si falta información, dilo. Devuelve una respuesta breve y clara en español."
                 ),
             },
-            {
-                "role": "user",
-                "content": f"Pregunta: {question}\nDatos:\n{json.dumps(sample, ensure_ascii=False)}",
-            },
+            {"role": "user", "content": f"Datos:\n{json.dumps(sample, ensure_ascii=False)}"},
+            {"role": "user", "content": f"Pregunta: {question}"},
         ],
         temperature=0.2,
     )
     return response.choices[0].message.content
 
 
-def chat_with_database_sql(question: str, table_name: str = "Contracts") -> Dict[str, Any]:
-    sql = generate_sql_from_question(question, table_name)
-    df = run_sql_query(sql)
-    answer = answer_from_dataframe(df, question)
-    return {"answer": answer}
+def _regenerate_failed_sql(
+    question: str, table_name: str, generated: GeneratedSql, exc: SqlExecutionError, **schema: Any
+) -> GeneratedSql:
+    if generated.template is not None:
+        # Plantilla que ya no corre (p. ej. cambió el esquema): se descarta y se genera con el modelo.
+        sql_templates.get_store().discard(generated.template)
+        return generate_sql_from_question(question, table_name, use_templates=False)
+    # La consulta del tier chico no corrió: se regenera una vez con el tier grande y el error de la base.
+    larger_route = routing.escalate(generated.route, "sql_error") if generated.route else None
+    if larger_route is None:
+        raise exc
+    return generate_sql_from_question(
+        question,
+        table_name,
+        route=larger_route,
+        feedback=f"The previous query failed.\nSQL: {generated.sql}\nError: {exc.detail}\nReturn a corrected SELECT.",
+        **schema,
+    )
+
+
+def chat_with_database_sql(
+    question: str, table_name: str = "Contracts", language: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Genera y ejecuta la consulta y responde con el resultado. Los resultados vacíos, escalares, de una
+    fila o tablas chicas se redactan localmente (``answers.format_locally``); el LLM solo interviene
+    con resultados grandes o preguntas que piden interpretación.
+    """
+    conn_str = os.getenv("AZURE_SQL_CONNECTION_STRING")
+    # El warmup de la base corre mientras el modelo genera la consulta.
+    warmup = _background().submit(_warmup_sql_connection, conn_str, "contratos") if conn_str else None
+    generated = generate_sql_from_question(question, table_name)
+    if warmup is not None:
+        warmup.result()
+    try:
+        df = run_sql_query(generated.sql, generated.params, warmup=warmup is None)
+    except SqlExecutionError as exc:
+        generated = _regenerate_failed_sql(question, table_name, generated, exc)
+        df = run_sql_query(generated.sql, generated.params, warmup=False)
+    if generated.template is None and sql_templates.SQL_TEMPLATE_CACHE_ENABLED:
+        sql_templates.get_store().learn(question, generated.sql, table_name)
+    return _sql_result(question, generated, df, language)
+
+
+def _sql_result(question: str, generated: GeneratedSql, df: "pd.DataFrame", language: Optional[str]) -> Dict[str, Any]:
+    """Respuesta (local o del modelo) y resultado de una consulta ya ejecutada."""
+    columns = [str(column) for column in df.columns]
+    answer = answers.format_locally(columns, list(df.itertuples(index=False, name=None)), question, language)
+    answered_locally = answer is not None
+    if answer is None:
+        answer = answer_from_dataframe(df, question)
+    answers.LOCAL_ANSWERS.inc(
+        source="local" if answered_locally else "llm", shape=answers.result_shape(len(df), len(columns))
+    )
+    return {
+        "answer": answer,
+        "sql": generated.sql,
+        "sql_params": generated.params,
+        "sql_template": sql_templates.as_dict(generated.template) if generated.template else None,
+        "columns": columns,
+        "rows": _df_to_records(df.head(SQL_RESULT_MAX_ROWS)),
+        "row_count": len(df),
+        "answered_locally": answered_locally,
+    }
+
+
+def spreadsheet_table(upload: Any) -> tabular.Table:
+    """Tabla en memoria de la planilla subida; se lee el archivo solo si su hash no está en el caché."""
+    return tabular.table_for(upload.sha256, lambda: dataframe_from_file(upload), upload.filename)
+
+
+def run_table_query(table: tabular.Table, sql: str) -> "pd.DataFrame":
+    if not sql.lower().startswith("select"):
+        raise HTTPException(status_code=400, detail="Solo se permiten consultas SELECT.")
+    try:
+        with telemetry.track("sql_query", query="spreadsheet"):
+            return table.query(sql)
+    except sqlite3.Error as exc:
+        raise SqlExecutionError(status_code=500, detail=f"Error ejecutando SQL: {exc}")
+
+
+def chat_with_spreadsheet(table: tabular.Table, question: str, language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Igual que ``chat_with_database_sql`` pero sobre una planilla subida: el modelo genera la consulta a partir
+    del esquema de la tabla en memoria y solo ve el resultado, no la planilla.
+    """
+    schema = {"columns": table.describe(), "dialect": "SQLite"}
+    generated = generate_sql_from_question(question, table.name, **schema)
+    try:
+        df = run_table_query(table, generated.sql)
+    except SqlExecutionError as exc:
+        generated = _regenerate_failed_sql(question, table.name, generated, exc, **schema)
+        df = run_table_query(table, generated.sql)
+    return dict(_sql_result(question, generated, df, language), table=table.summary())
 
 
 # ---------- Auth & token consumption (Azure SQL auth DB) ----------
@@ -554,7 +1149,8 @@ def _connect_auth_db():
         raise HTTPException(status_code=500, detail="Missing AZURE_SQL_AUTH_CONNECTION_STRING")
     try:
         _warmup_sql_connection(AUTH_CONN_STR, context="autenticacion")
-        return pyodbc.connect(AUTH_CONN_STR)
+        with telemetry.track("sql_connect", db="autenticacion"):
+            return _odbc().connect(AUTH_CONN_STR)
     except HTTPException:
         raise
     except Exception as exc:
@@ -565,8 +1161,9 @@ def validate_login(access_id: str, poc_id: int = 1) -> Dict[str, Any]:
     cursor = conn.cursor()
     try:
         print(f"Validando acceso para access_id={access_id}, poc_id={poc_id}")
-        cursor.execute("{CALL ValidarAccesoPoc (?, ?)}", (access_id, poc_id))
-        row = cursor.fetchone()
+        with telemetry.track("sql_query", query="validar_acceso"):
+            cursor.execute("{CALL ValidarAccesoPoc (?, ?)}", (access_id, poc_id))
+            row = cursor.fetchone()
         if not row:
             raise HTTPException(status_code=401, detail="Usuario no encontrado o inactivo")
         acceso_activo = row[1]
@@ -600,8 +1197,9 @@ def consume_tokens(access_id: str, poc_id: int = 1, tokens: int = 1) -> Dict[str
     conn = _connect_auth_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("{CALL RegistrarConsumoPoc (?, ?, ?)}", (access_id, poc_id, tokens))
-        conn.commit()
+        with telemetry.track("sql_query", query="registrar_consumo"):
+            cursor.execute("{CALL RegistrarConsumoPoc (?, ?, ?)}", (access_id, poc_id, tokens))
+            conn.commit()
     except HTTPException as exc:
         conn.rollback()
         raise exc
@@ -621,15 +1219,19 @@ def consume_tokens(access_id: str, poc_id: int = 1, tokens: int = 1) -> Dict[str
     return validate_login(access_id, poc_id)
 
 
+CHART_PALETTE = ("#D7263D", "#3F88C5", "#F49D37", "#2EBD59", "#9552EA", "#FF6B6B", "#4ECDC4")
+CHART_TYPES = ("bar", "box", "timeline")
+
+
 class ChartUtil:
     def __init__(self):
-        self.client = openai_client
+        self.client = get_openai_client()
         self.chart_out_path = os.path.join("assets", "chart.png")
         os.makedirs(os.path.dirname(self.chart_out_path), exist_ok=True)
 
     def generate_chart(self, message: str) -> Tuple[Optional[str], str]:
         # Build a strict prompt so the model only returns executable matplotlib code.
-        palette = "#D7263D, #3F88C5, #F49D37, #2EBD59, #9552EA, #FF6B6B, #4ECDC4"
+        palette = ", ".join(CHART_PALETTE)
         ci_prompt = f"""
 You are a Python data analyst creating executive-style charts (dashboard look) in matplotlib.
 Steps you MUST follow:
@@ -644,14 +1246,23 @@ User request and data:
 {message}
 """
 
+        messages = [
+            {"role": "system", "content": "You are a Python data analyst who only returns matplotlib code."},
+            {"role": "user", "content": ci_prompt},
+        ]
+        route = routing.choose("chart", routing.estimate_tokens(messages))
+        while True:
+            path, detail = self._render_chart(messages, route)
+            if path:
+                return path, detail
+            # El código del tier chico no produjo figura: se reintenta una vez con el tier grande.
+            route = routing.escalate(route, "chart_failed")
+            if route is None:
+                return None, detail
+
+    def _render_chart(self, messages: List[Dict[str, Any]], route: routing.Route) -> Tuple[Optional[str], str]:
         try:
-            response = self.client.chat.completions.create(
-                model=CHART_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a Python data analyst who only returns matplotlib code."},
-                    {"role": "user", "content": ci_prompt},
-                ],
-            )
+            response = _chat_completion("chart", messages, route=route)
 
             raw_response = response.choices[0].message.content or ""
 
@@ -667,20 +1278,81 @@ User request and data:
             plt.show = lambda *args, **kwargs: None  # avoid blocking calls
 
             local_vars: Dict[str, Any] = {}
-            exec(code, {"plt": plt}, local_vars)
+            with telemetry.track("chart_render"):
+                exec(code, {"plt": plt}, local_vars)
 
-            fig = local_vars.get("fig")
+                fig = local_vars.get("fig")
+                if fig:
+                    fig.savefig(self.chart_out_path)
             if fig:
-                fig.savefig(self.chart_out_path)
                 return self.chart_out_path, "Chart generated successfully."
             return None, "No 'fig' object found in the generated code."
         except Exception as exc:  # pragma: no cover - external service
             return None, f"An unexpected error occurred during chart generation process: {exc}"
 
-        return None, "Could you please rephrase your query and try again?"
 
+def render_chart_spec(spec: Dict[str, Any]) -> str:
+    """
+    Dibuja localmente (sin modelo) una especificación de gráfico como las de ``comparison``: ``type`` (bar, box o
+    timeline), ``title``, ``x_label``, ``y_label``, ``categories`` y ``series`` (``name`` y ``values``, un valor por
+    categoría: número, lista de números o ``[inicio, fin]`` ISO). Devuelve el PNG en base64.
+    """
+    kind = spec.get("type")
+    categories = [str(c) for c in spec.get("categories") or []]
+    series = spec.get("series") or []
+    if kind not in CHART_TYPES:
+        raise ValueError(f"type debe ser uno de: {', '.join(CHART_TYPES)}")
+    if not categories or not series or any(len(s.get("values") or []) != len(categories) for s in series):
+        raise ValueError("Cada serie debe traer un valor por categoría")
+
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, max(4.5, 0.4 * len(categories)) if kind == "timeline" else 5.5))
+    ax = fig.subplots()
+    with telemetry.track("chart_render"):
+        if kind == "bar":
+            width = 0.8 / len(series)
+            for index, item in enumerate(series):
+                positions = [i + (index - (len(series) - 1) / 2) * width for i in range(len(categories))]
+                bars = ax.bar(positions, item["values"], width, label=item.get("name"), color=CHART_PALETTE[index % len(CHART_PALETTE)])
+                ax.bar_label(bars, fmt="%g", fontsize=8)
+            ax.set_xticks(range(len(categories)), categories, rotation=30, ha="right")
+        elif kind == "box":
+            plot = ax.boxplot(series[0]["values"], patch_artist=True)
+            for index, box in enumerate(plot["boxes"]):
+                box.set_facecolor(CHART_PALETTE[index % len(CHART_PALETTE)])
+                box.set_alpha(0.7)
+            ax.set_xticks(range(1, len(categories) + 1), categories, rotation=30, ha="right")
+        else:
+            import matplotlib.dates as mdates
+
+            ranges = [(datetime.fromisoformat(start), end and datetime.fromisoformat(end)) for start, end in series[0]["values"]]
+            # Sin vencimiento: la barra llega hasta la última fecha conocida y se marca con una flecha.
+            horizon = max([end for _, end in ranges if end] + [start for start, _ in ranges])
+            for index, (start, end) in enumerate(ranges):
+                stop = end or horizon
+                ax.barh(index, mdates.date2num(stop) - mdates.date2num(start), left=mdates.date2num(start), height=0.6,
+                        color=CHART_PALETTE[index % len(CHART_PALETTE)])
+                if end is None:
+                    ax.annotate("→", (mdates.date2num(stop), index), va="center")
+            ax.set_yticks(range(len(categories)), categories)
+            ax.invert_yaxis()
+            ax.xaxis_date()
+        ax.set_title(spec.get("title") or "")
+        ax.set_xlabel(spec.get("x_label") or "")
+        ax.set_ylabel(spec.get("y_label") or "")
+        ax.grid(axis="x" if kind == "timeline" else "y", alpha=0.3)
+        if kind == "bar" and len(series) > 1:
+            ax.legend()
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def dataframe_from_file(upload: UploadFile) -> "pd.DataFrame":
+    import pandas as pd
 
-def dataframe_from_file(upload: UploadFile) -> pd.DataFrame:
     contents = upload.file.read()
     upload.file.seek(0)
     if upload.content_type and "csv" in upload.content_type:
@@ -695,12 +1367,34 @@ def dataframe_from_file(upload: UploadFile) -> pd.DataFrame:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {exc}")
 
 
+def validate_results(
+    results: List[Dict[str, Any]], expected: Any, keys: Tuple[str, ...] = validation.DEFAULT_KEYS
+) -> Dict[str, Any]:
+    """
+    Matriz de coincidencias de resultados extraídos contra el maestro subido (CSV/Excel). ``expected`` es el
+    spool de la subida: su SHA-256 identifica la tabla ya preparada en el caché de ``validation``.
+    """
+    reference = validation.reference_table(expected.sha256, lambda: dataframe_from_file(expected), keys)
+    with telemetry.track("validation"):
+        matrix, summary = validation.validate_batch(results, reference)
+    return {"summary": summary, "columns": list(matrix.columns), "rows": _df_to_records(matrix)}
+
+
+def compare_documents(
+    documents: List[Any], keys: Tuple[str, ...] = validation.DEFAULT_KEYS, group_by: str = "Customer"
+) -> Dict[str, Any]:
+    """Reporte comparativo local de los contratos de varios resultados de /api/process (ver ``comparison``)."""
+    with telemetry.track("comparison"):
+        return comparison.compare(documents, keys, group_by)
+
+
 def upload_records_to_db(records: List[Dict[str, Any]]) -> Dict[str, Any]:
     if not UPLOAD_URL:
         raise HTTPException(status_code=500, detail="UPLOAD_URL is not configured")
 
     headers = {"Content-Type": "application/json"}
-    response = requests.post(UPLOAD_URL, json=records, headers=headers)
+    with telemetry.track("upload"):
+        response = _http().post(UPLOAD_URL, json=records, headers=headers)
     if response.status_code in [200, 202, 203]:
         return {"status": "success", "message": "Uploaded records to the database successfully!"}
     raise HTTPException(
@@ -713,6 +1407,8 @@ def build_csv_bytes(all_results: List[Dict[str, Any]]) -> bytes:
     if not all_results:
         return b""
 
+    import pandas as pd
+
     output = io.StringIO()
     fieldnames = sorted({key for item in all_results for key in item.keys()})
     writer = pd.DataFrame(all_results, columns=fieldnames)
@@ -728,22 +1424,20 @@ def encode_file_to_base64(path: str) -> str:
 def warmup_databases() -> Dict[str, Any]:
     """Despierta las bases de datos en segundo plano para acelerar el primer acceso."""
     result = {"auth_db": "not_configured", "contracts_db": "not_configured"}
-    
-    # Despertar BD de autenticación
-    if AUTH_CONN_STR:
-        try:
-            _warmup_sql_connection(AUTH_CONN_STR, context="autenticacion", retries=2, backoff=0.5)
-            result["auth_db"] = "ready"
-        except Exception:
-            result["auth_db"] = "warming_up"
-    
-    # Despertar BD de contratos
-    conn_str = os.getenv("AZURE_SQL_CONNECTION_STRING")
-    if conn_str:
+    targets = {
+        "auth_db": (AUTH_CONN_STR, "autenticacion"),
+        "contracts_db": (os.getenv("AZURE_SQL_CONNECTION_STRING"), "contratos"),
+    }
+    # Las dos bases se despiertan en paralelo: el warmup tarda lo que la más lenta, no la suma.
+    pending = {
+        name: _background().submit(_warmup_sql_connection, conn_str, context=context, retries=2, backoff=0.5)
+        for name, (conn_str, context) in targets.items()
+        if conn_str
+    }
+    for name, future in pending.items():
         try:
-            _warmup_sql_connection(conn_str, context="contratos", retries=2, backoff=0.5)
-            result["contracts_db"] = "ready"
+            future.result()
+            result[name] = "ready"
         except Exception:
-            result["contracts_db"] = "warming_up"
-    
+            result[name] = "warming_up"
     return result
@@ -0,0 +1,480 @@
+"""
+Índice MinHash/LSH sobre el texto OCR para detectar casi-duplicados (re-escaneos, copias firmadas).
+
+Cada documento queda con el tenant que lo subió (``admission.Tenant.key``) y una consulta solo devuelve
+documentos del mismo tenant: los nombres de archivo y batch ids de un cliente no se muestran a otro.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from . import telemetry
+
+if TYPE_CHECKING:  # pragma: no cover - solo para anotaciones
+    import numpy as np
+
+try:  # bloqueo entre procesos (varios workers comparten el índice)
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "true").lower() in ("1", "true", "yes")
+# Prefijo de los archivos del índice: <prefijo>.sig (firmas binarias) y <prefijo>.jsonl (metadatos).
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", os.path.join("document_store", "similarity_index"))
+SIMILARITY_MAX_DOCUMENTS = int(os.getenv("SIMILARITY_MAX_DOCUMENTS", "100000"))
+SIMILARITY_NUM_PERM = int(os.getenv("SIMILARITY_NUM_PERM", "128"))
+# 32 bandas de 4 filas: un par con Jaccard 0.7 comparte algún bucket con probabilidad > 0.999.
+SIMILARITY_BANDS = int(os.getenv("SIMILARITY_BANDS", "32"))
+# Jaccard estimado a partir del cual se marca un casi-duplicado, y a partir del cual se puede reutilizar.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("SIMILARITY_NEAR_DUPLICATE_THRESHOLD", "0.7"))
+REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.9"))
+SHINGLE_SIZE = 3
+MAX_MATCHES = 5
+
+NEAR_DUPLICATES = telemetry.counter(
+    "idp_near_duplicates_total", "Documentos marcados como casi-duplicados por alcance (batch/history) y reutilización."
+)
+QUERY_SECONDS = telemetry.histogram(
+    "idp_similarity_query_seconds",
+    "Latencia de consulta al índice de similitud.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SEED = 1729
+_SHINGLE_MULTIPLIERS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D)
+# Cada fila del .sig empieza con la clave del documento (2 uint32 del SHA-256 de su id): las filas se emparejan
+# con los metadatos por clave, no por posición, así un agregado perdido o duplicado no corre los demás.
+_KEY_WORDS = 2
+_FORMAT = 2
+
+
+@dataclass
+class Match:
+    document: str
+    file_name: str
+    similarity: float
+    batch_id: Optional[str] = None
+    same_batch: bool = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "document": self.document,
+            "file_name": self.file_name,
+            "similarity": round(self.similarity, 3),
+            "batch_id": self.batch_id,
+            "same_batch": self.same_batch,
+        }
+
+
+def _permutations(num_perm: int) -> "np.ndarray":
+    """Coeficientes (a impar, b) de 64 bits para hashing multiply-shift: h(x) = (a * x + b) >> 32."""
+    import numpy as np
+
+    # Semilla fija: las firmas persistidas solo son comparables si los coeficientes no cambian.
+    rng = np.random.RandomState(_SEED)
+    a = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64)
+    return np.stack([a, b])
+
+
+def shingles(text_items: List[Dict[str, Any]]) -> "np.ndarray":
+    """
+    Hashes de 32 bits de los 3-gramas de palabras del documento completo (sin saltos de línea ni
+    mayúsculas), así un re-escaneo que corta las líneas distinto produce casi los mismos shingles.
+    """
+    import numpy as np
+
+    words = _WORD.findall(" ".join(item["text"] for item in text_items).lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    if len(hashes) < SHINGLE_SIZE:
+        return np.unique(hashes)
+    windows = np.lib.stride_tricks.sliding_window_view(hashes, SHINGLE_SIZE)
+    multipliers = np.array(_SHINGLE_MULTIPLIERS, dtype=np.uint64)
+    return np.unique((windows * multipliers).sum(axis=1) & np.uint64(0xFFFFFFFF))
+
+
+def _document_key(document: str) -> List[int]:
+    digest = hashlib.sha256(document.encode("utf-8")).digest()
+    return [int.from_bytes(digest[i * 4:(i + 1) * 4], "little") for i in range(_KEY_WORDS)]
+
+
+class SimilarityIndex:
+    """
+    Firmas MinHash en una matriz numpy y claves LSH (una por banda) en un arreglo ordenado: la carga
+    masiva es un argsort y la consulta un searchsorted. Los agregados sueltos van a un dict pendiente que
+    se fusiona cada PENDING_MERGE claves. La persistencia es de solo agregado (una fila binaria por
+    documento, con la clave de su id, más una línea de metadatos) bajo un bloqueo de archivo, porque varios
+    workers escriben el mismo índice; se compacta al desalojar.
+    """
+
+    PENDING_MERGE = 4096
+
+    def __init__(
+        self,
+        path: str = SIMILARITY_INDEX_PATH,
+        num_perm: int = SIMILARITY_NUM_PERM,
+        bands: int = SIMILARITY_BANDS,
+        max_documents: int = SIMILARITY_MAX_DOCUMENTS,
+    ):
+        if num_perm % bands:
+            raise ValueError("SIMILARITY_NUM_PERM debe ser múltiplo de SIMILARITY_BANDS")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_documents = max_documents
+        self._perm = _permutations(num_perm)
+        self._band_multipliers = _permutations(self.rows)[0]
+        # Sumado a la clave de cada banda para que bandas distintas no compartan buckets.
+        self._band_offsets = _permutations(bands)[1]
+        self._lock = threading.Lock()
+        # (inodo del .sig, bytes leídos del .jsonl y del .sig) de la última lectura del disco.
+        self._disk: Optional[Tuple[int, int, int]] = None
+        self._reset()
+        if path:
+            self._load()
+
+    def _reset(self) -> None:
+        import numpy as np
+
+        self._signatures = np.empty((0, self.num_perm), dtype=np.uint32)
+        self._count = 0
+        self._meta: List[Optional[Dict[str, Any]]] = []
+        self._slots: Dict[str, int] = {}
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._key_slots = np.empty(0, dtype=np.int64)
+        self._pending: Dict[int, List[int]] = {}
+        self._pending_count = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def signature(self, hashes: "np.ndarray") -> Optional["np.ndarray"]:
+        import numpy as np
+
+        if not len(hashes):
+            return None
+        # El desborde de uint64 es el módulo 2**64 del esquema; operaciones in-place para no copiar la matriz.
+        values = self._perm[0][:, None] * hashes[None, :]
+        values += self._perm[1][:, None]
+        values >>= np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signatures: "np.ndarray") -> "np.ndarray":
+        """Una clave uint64 por banda (n, bands); el desborde de la suma es intencional."""
+        import numpy as np
+
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (banded * self._band_multipliers).sum(axis=2) + self._band_offsets
+
+    def query(
+        self,
+        signature: "np.ndarray",
+        tenant: str,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        exclude: Optional[str] = None,
+        batch_id: Optional[str] = None,
+        limit: int = MAX_MATCHES,
+    ) -> List[Match]:
+        """Casi-duplicados de ``signature`` entre los documentos de ``tenant``."""
+        import numpy as np
+
+        start = time.perf_counter()
+        self.refresh()
+        keys = self._band_keys(signature[None, :])[0]
+        with self._lock:
+            lo = np.searchsorted(self._keys, keys, side="left")
+            hi = np.searchsorted(self._keys, keys, side="right")
+            found = [self._key_slots[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+            found += [np.array(self._pending[key]) for key in keys.tolist() if key in self._pending]
+            slots = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+            meta = [self._meta[slot] for slot in slots.tolist()]
+            similarity = (self._signatures[slots] == signature).mean(axis=1) if len(slots) else np.empty(0)
+        matches = [
+            Match(m["id"], m["file_name"], float(s), m.get("batch_id"), bool(batch_id) and m.get("batch_id") == batch_id)
+            for m, s in zip(meta, similarity.tolist())
+            if m is not None and s >= threshold and m["id"] != exclude and m.get("tenant") == tenant
+        ]
+        # Primero los del mismo batch, después por similitud.
+        matches.sort(key=lambda m: (not m.same_batch, -m.similarity))
+        QUERY_SECONDS.observe(time.perf_counter() - start)
+        return matches[:limit]
+
+    def add(
+        self, document: str, signature: "np.ndarray", file_name: str, tenant: str, batch_id: Optional[str] = None
+    ) -> None:
+        meta = {"id": document, "file_name": file_name, "batch_id": batch_id, "tenant": tenant, "created": time.time()}
+        with self._lock:
+            self._insert(signature[None, :], [meta])
+            compact = len(self._slots) > self.max_documents
+            if compact:
+                self._evict()
+        if not self.path:
+            return
+        if compact:
+            self.save()
+        else:
+            self._append(signature, meta)
+
+    def add_many(self, documents: List[Dict[str, Any]], signatures: "np.ndarray") -> None:
+        """Carga masiva (metadatos con id/file_name/tenant/batch_id) sin persistir; ver ``save``."""
+        now = time.time()
+        with self._lock:
+            self._insert(signatures, [dict({"batch_id": None, "created": now}, **d) for d in documents])
+            if len(self._slots) > self.max_documents:
+                self._evict()
+
+    def _insert(self, signatures: "np.ndarray", metas: List[Dict[str, Any]]) -> None:
+        import numpy as np
+
+        needed = self._count + len(signatures)
+        if needed > len(self._signatures):
+            grown = np.empty((max(needed, 2 * len(self._signatures), 1024), self.num_perm), dtype=np.uint32)
+            grown[: self._count] = self._signatures[: self._count]
+            self._signatures = grown
+        first = self._count
+        self._signatures[first:needed] = signatures
+        self._count = needed
+        for slot, meta in enumerate(metas, start=first):
+            # Un documento que se vuelve a agregar deja su fila anterior como hueco (se ignora en consultas).
+            previous = self._slots.get(meta["id"])
+            if previous is not None:
+                self._meta[previous] = None
+            self._meta.append(meta)
+            self._slots[meta["id"]] = slot
+        keys = self._band_keys(signatures)
+        if len(signatures) * self.bands + self._pending_count < self.PENDING_MERGE:
+            for slot, row in enumerate(keys.tolist(), start=first):
+                for key in row:
+                    self._pending.setdefault(key, []).append(slot)
+            self._pending_count += len(signatures) * self.bands
+            return
+        new_keys = [keys.ravel()]
+        new_slots = [np.repeat(np.arange(first, needed, dtype=np.int64), self.bands)]
+        for key, slots in self._pending.items():
+            new_keys.append(np.full(len(slots), key, dtype=np.uint64))
+            new_slots.append(np.array(slots, dtype=np.int64))
+        all_keys = np.concatenate([self._keys, *new_keys])
+        all_slots = np.concatenate([self._key_slots, *new_slots])
+        order = np.argsort(all_keys, kind="stable")
+        self._keys, self._key_slots = all_keys[order], all_slots[order]
+        self._pending, self._pending_count = {}, 0
+
+    def _evict(self) -> None:
+        """Descarta el 10 % más antiguo por encima del máximo y reconstruye la matriz y las claves."""
+        keep = int(self.max_documents * 0.9)
+        live = sorted(self._slots.values(), key=lambda slot: self._meta[slot]["created"])[-keep:]
+        live.sort()
+        signatures = self._signatures[live].copy()
+        metas = [self._meta[slot] for slot in live]
+        self._reset()
+        self._insert(signatures, metas)
+
+    def _header(self) -> Dict[str, Any]:
+        return {"num_perm": self.num_perm, "bands": self.bands, "seed": _SEED, "format": _FORMAT}
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Bloqueo exclusivo entre procesos sobre ``<prefijo>.lock`` mientras se leen o escriben los archivos."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a+b") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            else:  # pragma: no cover - Windows
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:  # pragma: no cover - Windows
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _row(self, signature: "np.ndarray", document: str) -> bytes:
+        import numpy as np
+
+        return np.concatenate([np.array(_document_key(document), dtype=np.uint32), signature.astype(np.uint32)]).tobytes()
+
+    def _append(self, signature: "np.ndarray", meta: Dict[str, Any]) -> None:
+        row_bytes = (self.num_perm + _KEY_WORDS) * 4
+        with self._file_lock(), self._lock:
+            sig_path, meta_path = f"{self.path}.sig", f"{self.path}.jsonl"
+            # Un agregado interrumpido deja una fila o una línea a medias: se completan antes de seguir agregando.
+            if os.path.exists(sig_path) and os.path.getsize(sig_path) % row_bytes:
+                with open(sig_path, "r+b") as fh:
+                    fh.truncate(os.path.getsize(sig_path) // row_bytes * row_bytes)
+            new_file = not os.path.exists(meta_path)
+            broken_line = not new_file and _ends_without_newline(meta_path)
+            with open(meta_path, "a", encoding="utf-8") as fh:
+                if new_file:
+                    fh.write(json.dumps(self._header()) + "\n")
+                fh.write(("\n" if broken_line else "") + json.dumps(meta, ensure_ascii=False) + "\n")
+            with open(sig_path, "ab") as fh:
+                fh.write(self._row(signature, meta["id"]))
+
+    def refresh(self) -> None:
+        """
+        Incorpora lo que otros workers agregaron al índice desde la última lectura, así un casi-duplicado
+        procesado en otro worker (p. ej. del mismo batch) se encuentra. Si el .sig no cambió no lee nada.
+        """
+        if not self.path:
+            return
+        try:
+            stat = os.stat(f"{self.path}.sig")
+        except FileNotFoundError:
+            return
+        if self._disk is not None and self._disk[0] == stat.st_ino and self._disk[2] == stat.st_size:
+            return
+        with self._file_lock():
+            on_disk = self._read(self._disk)
+        if on_disk is None:
+            return
+        metas, signatures, disk = on_disk
+        with self._lock:
+            self._merge(metas, signatures)
+            if len(self._slots) > self.max_documents:
+                self._evict()
+            self._disk = disk
+
+    def save(self) -> None:
+        """
+        Reescribe los archivos solo con los documentos vigentes. Antes incorpora lo que otros procesos
+        agregaron desde la última lectura, para no perderlo al reescribir.
+        """
+        if not self.path:
+            return
+        import numpy as np
+
+        with self._file_lock():
+            on_disk = self._read()
+            with self._lock:
+                if on_disk is not None:
+                    self._merge(on_disk[0], on_disk[1])
+                if len(self._slots) > self.max_documents:
+                    self._evict()
+                live = sorted(self._slots.values())
+                metas = [self._meta[slot] for slot in live]
+                keys = np.array([_document_key(meta["id"]) for meta in metas], dtype=np.uint32).reshape(-1, _KEY_WORDS)
+                rows = np.concatenate([keys, self._signatures[live]], axis=1)
+            with open(f"{self.path}.jsonl.tmp", "w", encoding="utf-8") as fh:
+                fh.write(json.dumps(self._header()) + "\n")
+                fh.writelines(json.dumps(meta, ensure_ascii=False) + "\n" for meta in metas)
+            rows.tofile(f"{self.path}.sig.tmp")
+            os.replace(f"{self.path}.sig.tmp", f"{self.path}.sig")
+            os.replace(f"{self.path}.jsonl.tmp", f"{self.path}.jsonl")
+            disk = (
+                os.stat(f"{self.path}.sig").st_ino,
+                os.path.getsize(f"{self.path}.jsonl"),
+                os.path.getsize(f"{self.path}.sig"),
+            )
+        with self._lock:
+            self._disk = disk
+
+    def _merge(self, metas: List[Dict[str, Any]], signatures: "np.ndarray") -> None:
+        """Agrega los documentos leídos del disco que no están en memoria (se llama con ``_lock`` tomado)."""
+        new = [i for i, meta in enumerate(metas) if meta["id"] not in self._slots]
+        if new:
+            self._insert(signatures[new], [metas[i] for i in new])
+
+    def _read(
+        self, since: Optional[Tuple[int, int, int]] = None
+    ) -> Optional[Tuple[List[Dict[str, Any]], "np.ndarray", Tuple[int, int, int]]]:
+        """
+        Metadatos y firmas del disco emparejados por la clave del id (gana la última aparición de cada
+        documento), y hasta dónde se leyó. Con ``since`` (de una lectura anterior) solo se lee lo agregado
+        después, salvo que otro proceso haya reescrito los archivos. Las filas sin metadato, o al revés, y
+        lo que quedó a medias se descartan. None si no hay índice o no sirve.
+        """
+        import numpy as np
+
+        width = self.num_perm + _KEY_WORDS
+        try:
+            with open(f"{self.path}.sig", "rb") as fh:
+                inode = os.fstat(fh.fileno()).st_ino
+                if since is None or since[0] != inode:
+                    since = (inode, 0, 0)
+                fh.seek(since[2])
+                data = fh.read()
+            with open(f"{self.path}.jsonl", "rb") as fh:
+                fh.seek(since[1])
+                header = json.loads(fh.readline() or b"{}") if not since[1] else self._header()
+                meta_end = fh.tell()
+                metas: Dict[Tuple[int, ...], Dict[str, Any]] = {}
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break  # agregado en curso o interrumpido: se vuelve a leer la próxima vez
+                    meta_end += len(line)
+                    try:
+                        meta = json.loads(line)
+                    except ValueError:
+                        continue  # línea cortada por un agregado interrumpido
+                    metas[tuple(_document_key(meta["id"]))] = meta
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"No se pudo leer el índice de similitud {self.path}: {exc}")
+            return None
+        if header != self._header():
+            print(f"Se ignora el índice de similitud {self.path}: fue creado con otros parámetros")
+            return None
+        usable = len(data) // (width * 4) * width * 4
+        rows = np.frombuffer(data[:usable], dtype=np.uint32).reshape(-1, width)
+        latest: Dict[Tuple[int, ...], int] = {}
+        for index, key in enumerate(map(tuple, rows[:, :_KEY_WORDS].tolist())):
+            if key in metas:
+                latest[key] = index
+        order = sorted(latest.values())
+        keys = [tuple(row) for row in rows[order, :_KEY_WORDS].tolist()]
+        return [metas[key] for key in keys], rows[order, _KEY_WORDS:], (inode, meta_end, since[2] + usable)
+
+    def _load(self) -> None:
+        with self._file_lock():
+            on_disk = self._read()
+        if on_disk is None:
+            return
+        metas, signatures, self._disk = on_disk
+        self._insert(signatures, metas)
+        if len(self._slots) > self.max_documents:
+            self._evict()
+
+
+def _ends_without_newline(path: str) -> bool:
+    with open(path, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        if not fh.tell():
+            return False
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1) != b"\n"
+
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SimilarityIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
+
+
+def record_matches(matches: List[Match], reused: bool) -> None:
+    if matches:
+        scope = "batch" if matches[0].same_batch else "history"
+        NEAR_DUPLICATES.inc(scope=scope, reused="yes" if reused else "no")
@@ -0,0 +1,101 @@
+"""Single-flight: llamadas concurrentes idénticas (misma operación y contenido) comparten una sola ejecución."""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from . import telemetry
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+CALLS = telemetry.counter(
+    "idp_singleflight_calls_total",
+    "Llamadas por operación y rol: leader ejecuta el trabajo, coalesced reutiliza el resultado en curso.",
+)
+INFLIGHT = telemetry.gauge("idp_singleflight_inflight", "Ejecuciones compartidas en curso por operación.")
+
+
+def content_key(*parts: Any) -> str:
+    """Hash estable de los argumentos que determinan el resultado (JSON con claves ordenadas)."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Mientras una llamada con la misma clave está en curso, las siguientes esperan su resultado (o su
+    excepción) en lugar de repetir el trabajo. La clave se libera al terminar: no es un caché.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Tuple[str, str], "asyncio.Task[Any]"] = {}
+
+    async def run(
+        self,
+        operation: str,
+        key: str,
+        func: Callable[..., Any],
+        *args: Any,
+        cleanup: Optional[Callable[[], None]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Ejecuta ``func`` (corrutina o función bloqueante, que va al threadpool) una vez por clave en curso.
+        ``cleanup`` libera recursos propios de la llamada (p. ej. el spool de la subida): el líder lo
+        ejecuta cuando termina el trabajo compartido; un seguidor, de inmediato porque no los usa.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            try:
+                return await self._call(func, *args, **kwargs)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+        flight_key = (operation, key)
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            CALLS.inc(operation=operation, role="coalesced")
+            if cleanup is not None:
+                cleanup()
+        else:
+            CALLS.inc(operation=operation, role="leader")
+            # El trabajo corre en su propia tarea: si el cliente que lo inició se desconecta, sigue para los demás.
+            task = asyncio.ensure_future(self._call(func, *args, **kwargs))
+            self._inflight[flight_key] = task
+            INFLIGHT.inc(operation=operation)
+            task.add_done_callback(lambda done: self._finish(flight_key, done, cleanup))
+        return await asyncio.shield(task)
+
+    def _finish(
+        self, flight_key: Tuple[str, str], task: "asyncio.Task[Any]", cleanup: Optional[Callable[[], None]]
+    ) -> None:
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        INFLIGHT.dec(operation=flight_key[0])
+        if cleanup is not None:
+            cleanup()
+        if not task.cancelled():
+            task.exception()  # marca la excepción como leída aunque todos los clientes se hayan ido
+
+    @staticmethod
+    async def _call(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        return await run_in_threadpool(func, *args, **kwargs)
+
+
+_group = SingleFlight()
+
+
+async def run(
+    operation: str,
+    key: str,
+    func: Callable[..., Any],
+    *args: Any,
+    cleanup: Optional[Callable[[], None]] = None,
+    **kwargs: Any,
+) -> Any:
+    return await _group.run(operation, key, func, *args, cleanup=cleanup, **kwargs)
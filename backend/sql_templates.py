@@ -0,0 +1,405 @@
+"""Caché de plantillas pregunta→SQL con ranuras para los literales (se aprende de consultas que corrieron bien)."""
+
+import difflib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import telemetry
+
+SQL_TEMPLATE_CACHE_ENABLED = os.getenv("SQL_TEMPLATE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_TEMPLATE_CACHE_SIZE = int(os.getenv("SQL_TEMPLATE_CACHE_SIZE", "500"))
+SQL_TEMPLATE_MIN_SIMILARITY = float(os.getenv("SQL_TEMPLATE_MIN_SIMILARITY", "0.6"))
+# Alineación mínima entre la pregunta y el esqueleto (sin contar las ranuras) para usar la plantilla sin el modelo.
+SQL_TEMPLATE_MIN_ALIGNMENT = float(os.getenv("SQL_TEMPLATE_MIN_ALIGNMENT", "0.8"))
+# Valores de texto conocidos que se guardan por ranura (los de consultas generadas por el modelo que corrieron).
+SQL_TEMPLATE_MAX_SLOT_VALUES = int(os.getenv("SQL_TEMPLATE_MAX_SLOT_VALUES", "200"))
+SQL_TEMPLATE_STORE_PATH = os.getenv("SQL_TEMPLATE_STORE_PATH", "")
+MAX_CANDIDATES = 5
+# Los contadores de uso se persisten cada tantos aciertos (las plantillas nuevas, siempre).
+SAVE_EVERY_HITS = 20
+
+_TOKEN = re.compile(r"\d{4}-\d{2}-\d{2}|\d+(?:[.,]\d+)?%?|\w+|[^\w\s]", re.UNICODE)
+_SQL_STRING = re.compile(r"N?'((?:[^']|'')*)'")
+_SQL_NUMBER = re.compile(r"(?<![\w.'])\d+(?:\.\d+)?(?![\w.'])")
+# Números que son parte de un tipo (decimal(18,4), varchar(50)) y nunca vienen de la pregunta.
+_SQL_TYPE_ARGS = re.compile(r"\b(?:decimal|numeric|n?varchar|n?char|float)\s*\([^)]*\)", re.IGNORECASE)
+_KINDS = {
+    "date": re.compile(r"^\d{4}-\d{2}-\d{2}$"),
+    "year": re.compile(r"^(19|20)\d{2}$"),
+    "int": re.compile(r"^\d+$"),
+    "number": re.compile(r"^\d+(?:[.,]\d+)?%?$"),
+}
+# Diferencias entre la pregunta y la plantilla que no cambian la consulta.
+_IGNORABLE = {
+    "?", "¿", "!", "¡", ".", ",", ":", ";", '"', "'", "`",
+    "the", "a", "an", "please", "me", "el", "la", "los", "las", "un", "una", "por", "favor", "o", "os", "as", "um", "uma",
+}
+# Un valor de texto que los contiene es una lista o alternativa ("USD or COP"), no un solo literal.
+_CONNECTORS = {"or", "and", "y", "o", "e", "u", "ni", "nor", "ou"}
+
+
+@dataclass
+class Param:
+    slot: int
+    prefix: str = ""
+    suffix: str = ""
+    quoted: bool = True
+    # Años sumados al valor de la ranura: el límite superior de un rango anual ('2025-01-01' para "2024").
+    offset: int = 0
+
+
+@dataclass
+class Template:
+    table: str
+    skeleton: List[str]
+    sql: str
+    params: List[Param]
+    slot_kinds: List[str]
+    # Tokens de cada ranura al aprenderla: una ranura de texto no acepta un valor más largo.
+    slot_tokens: List[int] = field(default_factory=list)
+    # Valores (normalizados) que ya tomó cada ranura de texto: un valor desconocido vuelve al modelo.
+    slot_values: List[List[str]] = field(default_factory=list)
+    uses: int = 0
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> str:
+        return f"{self.table}:{' '.join(self.skeleton)}"
+
+
+@dataclass
+class TemplateMatch:
+    template: Template
+    sql: str
+    params: List[Any]
+    similarity: float
+
+
+def _normalize(token: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", token.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _tokenize(text: str) -> List[Tuple[str, int, int]]:
+    return [(_normalize(m.group()), m.start(), m.end()) for m in _TOKEN.finditer(text)]
+
+
+def _kind(value: str) -> str:
+    for kind, pattern in _KINDS.items():
+        if pattern.match(value):
+            return kind
+    return "text"
+
+
+def _kind_matches(kind: str, value: str) -> bool:
+    """Una ranura de texto no acepta un año o un número ("contracts in 2024" no es una región)."""
+    if kind == "text":
+        return _kind(value) == "text" and not any(ch.isdigit() for ch in value)
+    return bool(_KINDS[kind].match(value))
+
+
+def _is_word(token: str) -> bool:
+    return token not in _IGNORABLE and not token.startswith("<slot") and not any(ch.isdigit() for ch in token)
+
+
+def _ngrams(tokens: List[str]) -> set:
+    """Unigramas y bigramas de palabras; las ranuras y los valores cortan los bigramas."""
+    grams = {t for t in tokens if _is_word(t)}
+    grams |= {f"{a} {b}" for a, b in zip(tokens, tokens[1:]) if _is_word(a) and _is_word(b)}
+    return grams
+
+
+def _similarity(question_grams: set, template_grams: set) -> float:
+    """Fracción de los n-gramas fijos de la plantilla presentes en la pregunta."""
+    return len(question_grams & template_grams) / len(template_grams) if template_grams else 0.0
+
+
+def _sql_literals(sql: str) -> List[Tuple[int, int, str, bool]]:
+    """Literales de la consulta como (inicio, fin, valor, es_cadena), en orden de aparición."""
+    literals = [(m.start(), m.end(), m.group(1).replace("''", "'"), True) for m in _SQL_STRING.finditer(sql)]
+    masked = _SQL_STRING.sub(lambda m: " " * len(m.group()), sql)
+    masked = _SQL_TYPE_ARGS.sub(lambda m: " " * len(m.group()), masked)
+    literals += [(m.start(), m.end(), m.group(), False) for m in _SQL_NUMBER.finditer(masked)]
+    return sorted(literals)
+
+
+def _find_span(tokens: List[str], needle: List[str]) -> Optional[Tuple[int, int]]:
+    for start in range(len(tokens) - len(needle) + 1):
+        if tokens[start:start + len(needle)] == needle:
+            return start, start + len(needle)
+    return None
+
+
+def _bind_literal(
+    question: str, q_tokens: List[Tuple[str, int, int]], value: str
+) -> Optional[Tuple[Tuple[int, int], str, int]]:
+    """Tramo de la pregunta del que sale el literal, con su prefijo/sufijo ("prefijo\\0sufijo") y desfase de año."""
+    normalized = [t for t, _, _ in q_tokens]
+    core = value.strip("%")
+    offset = 0
+    span = _find_span(normalized, [t for t, _, _ in _tokenize(core)]) if core.strip() else None
+    if span is None and _KINDS["date"].match(value[:10]):
+        # Fechas armadas a partir de un año de la pregunta ('2024-01-01', '2024-12-31') y el límite exclusivo
+        # del año siguiente ('2025-01-01'); el año exacto tiene prioridad.
+        years = [(int(value[:4]) - int(token), index) for index, token in enumerate(normalized) if _kind(token) == "year"]
+        offset, index = min((y for y in years if y[0] in (0, 1)), default=(0, -1))
+        if index < 0:
+            return None
+        span, core = (index, index + 1), value[:4]
+    if span is None:
+        return None
+    original = question[q_tokens[span[0]][1]:q_tokens[span[1] - 1][2]]
+    position = _normalize(value).find(_normalize(core))
+    if position < 0 or len(_normalize(value)) != len(value):
+        return None
+    if not offset and _normalize(core) != _normalize(original):
+        return None
+    return span, value[:position] + "\0" + value[position + len(core):], offset
+
+
+def build_template(question: str, sql: str, table: str) -> Optional[Template]:
+    """
+    Convierte una consulta que corrió bien en plantilla: cada literal del SQL que aparece en la pregunta
+    (completo, o como parte, p. ej. '%Andina%' o '2024-01-01' para "2024") pasa a ser un parámetro.
+    Un año de la pregunta también liga el límite superior del rango ('2025-01-01' para "2024"). Devuelve None si
+    algún valor de la pregunta o algún número o fecha del SQL no quedó ligado a una ranura: una fecha fija en la
+    plantilla haría que la consulta cubra otro período cuando cambia el año.
+    """
+    q_tokens = _tokenize(question)
+    normalized = [t for t, _, _ in q_tokens]
+    spans: List[Tuple[int, int]] = []
+    bindings: List[Tuple[int, int, Tuple[int, int], str, bool, int]] = []
+
+    for start, end, value, quoted in _sql_literals(sql):
+        bound = _bind_literal(question, q_tokens, value)
+        if bound is not None and bound[0] not in spans and any(s[0] < bound[0][1] and bound[0][0] < s[1] for s in spans):
+            bound = None
+        if bound is None:
+            if not quoted or _KINDS["date"].match(value[:10]) or _kind(value.strip("%")) != "text":
+                return None
+            continue
+        span, wrap, offset = bound
+        if span not in spans:
+            spans.append(span)
+        bindings.append((start, end, span, wrap, quoted, offset))
+
+    covered = {i for s, e in spans for i in range(s, e)}
+    if any(any(ch.isdigit() for ch in token) and i not in covered for i, token in enumerate(normalized)):
+        return None
+
+    ordered = sorted(spans)
+    skeleton: List[str] = []
+    index = 0
+    while index < len(normalized):
+        span = next((s for s in ordered if s[0] == index), None)
+        if span:
+            skeleton.append(f"<slot{ordered.index(span)}>")
+            index = span[1]
+        else:
+            skeleton.append(normalized[index])
+            index += 1
+
+    params: List[Param] = []
+    parts: List[str] = []
+    cursor = 0
+    for start, end, span, wrap, quoted, offset in bindings:
+        prefix, suffix = wrap.split("\0")
+        parts.append(sql[cursor:start])
+        # SQL Server solo acepta TOP parametrizado entre paréntesis.
+        parts.append("(?)" if re.search(r"\bTOP\s*$", sql[:start], re.IGNORECASE) else "?")
+        cursor = end
+        params.append(Param(slot=ordered.index(span), prefix=prefix, suffix=suffix, quoted=quoted, offset=offset))
+    parts.append(sql[cursor:])
+    slot_texts = [question[q_tokens[s][1]:q_tokens[e - 1][2]] for s, e in ordered]
+    slot_kinds = [_kind(text) for text in slot_texts]
+    return Template(
+        table=table,
+        skeleton=skeleton,
+        sql="".join(parts),
+        params=params,
+        slot_kinds=slot_kinds,
+        slot_tokens=[e - s for s, e in ordered],
+        slot_values=[[_normalize(text)] if kind == "text" else [] for text, kind in zip(slot_texts, slot_kinds)],
+    )
+
+
+def _alignment(matcher: difflib.SequenceMatcher, template_fixed: int, question_fixed: int) -> float:
+    """Como ``ratio()``, pero sobre los tokens fijos: las ranuras y sus valores no cuentan."""
+    aligned = sum(block.size for block in matcher.get_matching_blocks())
+    return 2 * aligned / (template_fixed + question_fixed) if template_fixed + question_fixed else 0.0
+
+
+def _known_value(template: Template, slot: int, value: str) -> bool:
+    values = template.slot_values[slot] if slot < len(template.slot_values) else []
+    return _normalize(value) in values
+
+
+def _bind(template: Template, question: str) -> Optional[List[str]]:
+    """
+    Alinea la pregunta con el esqueleto; solo acepta diferencias en las ranuras o en palabras ignorables, con
+    una alineación de al menos ``SQL_TEMPLATE_MIN_ALIGNMENT``. Un valor de texto tiene que ser uno ya visto en
+    esa ranura: "contracts in total" no es una región, y eso solo lo sabe el modelo.
+    """
+    q_tokens = _tokenize(question)
+    normalized = [t for t, _, _ in q_tokens]
+    values: List[Optional[str]] = [None] * len(template.slot_kinds)
+    value_tokens = 0
+    matcher = difflib.SequenceMatcher(None, template.skeleton, normalized, autojunk=False)
+    for op, a1, a2, b1, b2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        template_side = [t for t in template.skeleton[a1:a2] if t not in _IGNORABLE]
+        while b1 < b2 and normalized[b1] in _IGNORABLE:
+            b1 += 1
+        while b2 > b1 and normalized[b2 - 1] in _IGNORABLE:
+            b2 -= 1
+        if not template_side and b1 == b2:
+            continue
+        if len(template_side) != 1 or not template_side[0].startswith("<slot") or b1 == b2:
+            return None
+        slot = int(template_side[0][5:-1])
+        value = question[q_tokens[b1][1]:q_tokens[b2 - 1][2]].strip()
+        if not _kind_matches(template.slot_kinds[slot], value):
+            return None
+        if template.slot_kinds[slot] == "text":
+            # Un valor de texto no puede crecer más allá de lo aprendido ni ser una lista ("USD or COP").
+            if template.slot_tokens and b2 - b1 > template.slot_tokens[slot]:
+                return None
+            if any(token in _CONNECTORS for token in normalized[b1:b2]):
+                return None
+            if not _known_value(template, slot, value):
+                return None
+        values[slot] = value
+        value_tokens += b2 - b1
+    if any(value is None for value in values):
+        return None
+    template_fixed = len(template.skeleton) - len(template.slot_kinds)
+    if _alignment(matcher, template_fixed, len(normalized) - value_tokens) < SQL_TEMPLATE_MIN_ALIGNMENT:
+        return None
+    return values  # type: ignore[return-value]
+
+
+def _param_value(param: Param, value: str) -> Any:
+    if param.offset:
+        value = str(int(value) + param.offset)
+    text = f"{param.prefix}{value}{param.suffix}"
+    if param.quoted:
+        return text
+    number = text.replace(",", ".")
+    return int(number) if number.isdigit() else float(number)
+
+
+class TemplateStore:
+    """Plantillas en memoria con desalojo LRU y persistencia opcional en JSON."""
+
+    def __init__(self, max_size: int = SQL_TEMPLATE_CACHE_SIZE, path: str = SQL_TEMPLATE_STORE_PATH):
+        self.max_size = max_size
+        self.path = path
+        self._templates: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved_hits = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def match(self, question: str, table: str) -> Optional[TemplateMatch]:
+        grams = _ngrams([t for t, _, _ in _tokenize(question)])
+        with self._lock:
+            candidates = [
+                (_similarity(grams, _ngrams(t.skeleton)), t) for t in self._templates.values() if t.table == table
+            ]
+        candidates = sorted((c for c in candidates if c[0] >= SQL_TEMPLATE_MIN_SIMILARITY), key=lambda c: -c[0])
+        for similarity, template in candidates[:MAX_CANDIDATES]:
+            values = _bind(template, question)
+            if values is None:
+                continue
+            try:
+                params = [_param_value(p, values[p.slot]) for p in template.params]
+            except ValueError:
+                continue
+            with self._lock:
+                template.uses += 1
+                template.last_used = time.time()
+                if template.key in self._templates:
+                    self._templates.move_to_end(template.key)
+                self._unsaved_hits += 1
+                flush = self._unsaved_hits >= SAVE_EVERY_HITS
+            if flush:
+                self.save()
+            telemetry.record_cache("sql_template", True)
+            return TemplateMatch(template, template.sql, params, similarity)
+        telemetry.record_cache("sql_template", False)
+        return None
+
+    def learn(self, question: str, sql: str, table: str) -> Optional[Template]:
+        template = build_template(question, sql, table)
+        if template is None:
+            return None
+        with self._lock:
+            previous = self._templates.pop(template.key, None)
+            if previous:
+                template.uses, template.created = previous.uses, previous.created
+                # La misma plantilla con otro valor ("Perú" después de "Colombia"): la ranura conoce los dos.
+                for slot, known in enumerate(previous.slot_values[: len(template.slot_values)]):
+                    merged = template.slot_values[slot] + [v for v in known if v not in template.slot_values[slot]]
+                    template.slot_values[slot] = merged[:SQL_TEMPLATE_MAX_SLOT_VALUES]
+            self._templates[template.key] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        self.save()
+        return template
+
+    def discard(self, template: Template) -> None:
+        with self._lock:
+            self._templates.pop(template.key, None)
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = [asdict(t) for t in self._templates.values()]
+            self._unsaved_hits = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as exc:
+            print(f"No se pudo leer el archivo de plantillas SQL {self.path}: {exc}")
+            return
+        for item in data[-self.max_size:]:
+            item["params"] = [Param(**p) for p in item["params"]]
+            template = Template(**item)
+            self._templates[template.key] = template
+
+
+_store: Optional[TemplateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> TemplateStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TemplateStore()
+    return _store
+
+
+def as_dict(template: Template) -> Dict[str, Any]:
+    return {"skeleton": " ".join(template.skeleton), "uses": template.uses}
@@ -0,0 +1,170 @@
+"""
+Planillas subidas (CSV/Excel) como tablas SQLite en memoria, para preguntarles con SQL en vez de mandar todo
+el contenido al modelo.
+
+Cada archivo se lee una sola vez: la tabla tipada (INTEGER/REAL/TEXT, fechas como texto ISO) queda cacheada
+por el SHA-256 del contenido, así las preguntas siguientes sobre la misma planilla (subida de nuevo o por
+``table_id``) no vuelven a parsearla. Al modelo solo le llegan el esquema, unos valores de ejemplo y el
+resultado de la consulta. Las consultas corren con un autorizador de SQLite que solo permite leer y con un
+tiempo máximo.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from . import telemetry
+
+if TYPE_CHECKING:  # pragma: no cover - solo para anotaciones
+    import pandas as pd
+
+TABULAR_TABLE_NAME = os.getenv("TABULAR_TABLE_NAME", "Spreadsheet")
+TABULAR_CACHE_SIZE = int(os.getenv("TABULAR_CACHE_SIZE", "8"))
+TABULAR_MAX_ROWS = int(os.getenv("TABULAR_MAX_ROWS", "1000000"))
+# Valores distintos por columna que se muestran al modelo junto al esquema.
+TABULAR_SAMPLE_VALUES = int(os.getenv("TABULAR_SAMPLE_VALUES", "3"))
+# Corta consultas generadas que no terminan (p. ej. un producto cartesiano de la tabla consigo misma).
+TABULAR_QUERY_TIMEOUT_SECONDS = float(os.getenv("TABULAR_QUERY_TIMEOUT_SECONDS", "10"))
+
+LOADED_ROWS = telemetry.counter("idp_tabular_rows_loaded_total", "Filas de planillas cargadas en tablas en memoria.")
+
+# Acciones del autorizador que una consulta de solo lectura necesita; todo lo demás (escrituras, PRAGMA,
+# ATTACH) se rechaza.
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+_PROGRESS_STEPS = 10_000
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(values: "pd.Series") -> Tuple[str, "pd.Series"]:
+    """Tipo de SQLite de la columna y sus valores listos para insertar (números de texto pasan a número)."""
+    import pandas as pd
+
+    if pd.api.types.is_bool_dtype(values):
+        return "INTEGER", values.astype("Int64")
+    if pd.api.types.is_integer_dtype(values):
+        return "INTEGER", values
+    if pd.api.types.is_float_dtype(values):
+        whole = values.dropna()
+        return ("INTEGER", values.astype("Int64")) if len(whole) and (whole % 1 == 0).all() else ("REAL", values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        dated = values.dropna()
+        with_time = len(dated) and (dated != dated.dt.normalize()).any()
+        return "TEXT", values.dt.strftime("%Y-%m-%d %H:%M:%S" if with_time else "%Y-%m-%d")
+    present = values.notna()
+    if present.any():
+        # Números guardados como texto (exportes de otros sistemas): si todos convierten, la columna es numérica.
+        numbers = pd.to_numeric(values.where(present).astype("string").str.strip(), errors="coerce")
+        if numbers[present].notna().all():
+            return _sql_type(numbers)
+    return "TEXT", values.map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v))
+
+
+class Table:
+    """Una planilla cargada en una base SQLite en memoria propia (una tabla ``TABULAR_TABLE_NAME``)."""
+
+    def __init__(self, content_hash: str, filename: str, columns: List[Tuple[str, str]], row_count: int,
+                 samples: Dict[str, List[Any]], conn: sqlite3.Connection) -> None:
+        self.content_hash = content_hash
+        self.filename = filename
+        self.name = TABULAR_TABLE_NAME
+        self.columns = columns
+        self.row_count = row_count
+        self.samples = samples
+        self.loaded_at = time.time()
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, content_hash: str, frame: "pd.DataFrame", filename: str = "") -> "Table":
+        import pandas as pd
+
+        if len(frame) > TABULAR_MAX_ROWS:
+            raise ValueError(f"La planilla tiene {len(frame)} filas; el máximo es {TABULAR_MAX_ROWS}")
+        names = [str(name).strip() or f"column_{i + 1}" for i, name in enumerate(frame.columns)]
+        if len(set(n.lower() for n in names)) != len(names):
+            raise ValueError("La planilla tiene columnas con el mismo nombre")
+        columns: List[Tuple[str, str]] = []
+        data: List[List[Any]] = []
+        samples: Dict[str, List[Any]] = {}
+        for name, (_, values) in zip(names, frame.items()):
+            sql_type, values = _sql_type(values)
+            column = values.to_numpy(dtype=object, na_value=None)
+            columns.append((name, sql_type))
+            data.append(column.tolist())
+            samples[name] = pd.unique(values.dropna())[:TABULAR_SAMPLE_VALUES].tolist()
+
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        definition = ", ".join(f"{quote(name)} {sql_type}" for name, sql_type in columns)
+        conn.execute(f"CREATE TABLE {quote(TABULAR_TABLE_NAME)} ({definition})")
+        if columns:
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(f"INSERT INTO {quote(TABULAR_TABLE_NAME)} VALUES ({placeholders})", zip(*data))
+        conn.commit()
+        conn.set_authorizer(lambda action, *_: sqlite3.SQLITE_OK if action in _READ_ACTIONS else sqlite3.SQLITE_DENY)
+        LOADED_ROWS.inc(len(frame))
+        return cls(content_hash, filename, columns, len(frame), samples, conn)
+
+    def describe(self) -> List[str]:
+        """Columnas con su tipo y valores de ejemplo, para el prompt que genera la consulta."""
+        described = []
+        for name, sql_type in self.columns:
+            examples = ", ".join(repr(value) for value in self.samples.get(name, []))
+            described.append(f"{quote(name)} {sql_type}" + (f" (e.g. {examples})" if examples else ""))
+        return described
+
+    def query(self, sql: str) -> "pd.DataFrame":
+        """Ejecuta una consulta de solo lectura; ``sqlite3.Error`` si falla, se rechaza o se pasa de tiempo."""
+        import pandas as pd
+
+        deadline = time.monotonic() + TABULAR_QUERY_TIMEOUT_SECONDS
+        with self._lock:
+            # Un valor distinto de cero desde el handler interrumpe la consulta.
+            self._conn.set_progress_handler(lambda: time.monotonic() > deadline, _PROGRESS_STEPS)
+            try:
+                cursor = self._conn.execute(sql)
+                rows = cursor.fetchall()
+            finally:
+                self._conn.set_progress_handler(None, 0)
+        return pd.DataFrame.from_records(rows, columns=[d[0] for d in cursor.description or ()])
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "table_id": self.content_hash,
+            "file_name": self.filename,
+            "table": self.name,
+            "row_count": self.row_count,
+            "columns": [{"name": name, "type": sql_type} for name, sql_type in self.columns],
+        }
+
+
+_tables: "OrderedDict[str, Table]" = OrderedDict()
+_tables_lock = threading.Lock()
+
+
+def cached(content_hash: str) -> Optional[Table]:
+    with _tables_lock:
+        table = _tables.get(content_hash)
+        if table is not None:
+            _tables.move_to_end(content_hash)
+    telemetry.record_cache("tabular_table", hit=table is not None)
+    return table
+
+
+def table_for(content_hash: str, load: Callable[[], "pd.DataFrame"], filename: str = "") -> Table:
+    """Tabla cacheada por hash del archivo; ``load()`` devuelve el DataFrame si no está."""
+    table = cached(content_hash)
+    if table is not None:
+        return table
+    with telemetry.track("tabular_load"):
+        table = Table.build(content_hash, load(), filename)
+    with _tables_lock:
+        _tables[content_hash] = table
+        while len(_tables) > TABULAR_CACHE_SIZE:
+            _tables.popitem(last=False)
+    return table
@@ -0,0 +1,233 @@
+"""Métricas en proceso (contadores, gauges e histogramas) con exposición en formato Prometheus."""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[idx] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        lines: List[str] = []
+        for key, row in items:
+            cumulative = 0.0
+            for idx, bound in enumerate(self.buckets):
+                cumulative += row[idx]
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {row[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {row[-1]}")
+        return lines
+
+
+_REGISTRY: Dict[str, _Metric] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _register(metric_cls, name: str, documentation: str, **kwargs):
+    with _REGISTRY_LOCK:
+        existing = _REGISTRY.get(name)
+        if existing is not None:
+            return existing
+        metric = metric_cls(name, documentation, **kwargs)
+        _REGISTRY[name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str) -> Counter:
+    return _register(Counter, name, documentation)
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    return _register(Gauge, name, documentation)
+
+
+def histogram(name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, documentation, buckets=buckets)
+
+
+STAGE_SECONDS = histogram("idp_stage_duration_seconds", "Duración de cada llamada externa por etapa.")
+STAGE_ERRORS = counter("idp_stage_errors_total", "Errores por etapa.")
+STAGE_INFLIGHT = gauge("idp_stage_inflight", "Llamadas externas en curso por etapa.")
+CACHE_LOOKUPS = counter("idp_cache_lookups_total", "Consultas a cachés locales por resultado (hit/miss).")
+OPENAI_TOKENS = counter("idp_openai_tokens_total", "Tokens reportados por OpenAI por punto de llamada y tipo.")
+HTTP_SECONDS = histogram("idp_http_request_duration_seconds", "Duración de las solicitudes HTTP por ruta.")
+HTTP_INFLIGHT = gauge("idp_http_requests_inflight", "Solicitudes HTTP en curso.")
+
+# Tiempos por etapa de la solicitud actual (alimenta el header Server-Timing).
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("idp_request_timings", default=None)
+
+
+@contextmanager
+def track(stage: str, **labels: object) -> Iterator[None]:
+    """Mide una llamada externa: histograma de duración, gauge de concurrencia y errores."""
+    all_labels = dict(labels, stage=stage)
+    STAGE_INFLIGHT.inc(**all_labels)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(**all_labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_INFLIGHT.dec(**all_labels)
+        STAGE_SECONDS.observe(elapsed, **all_labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_openai_usage(call_site: str, usage: object) -> None:
+    """Acumula los tokens de una respuesta de chat.completions por punto de llamada."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            OPENAI_TOKENS.inc(value, call_site=call_site, kind=kind)
+    cached = cached_prompt_tokens(usage)
+    if cached:
+        OPENAI_TOKENS.inc(cached, call_site=call_site, kind="cached_prompt_tokens")
+
+
+def cached_prompt_tokens(usage: object) -> int:
+    """Tokens del prompt servidos desde el caché de prefijos del proveedor (0 si no lo reporta)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def begin_request() -> object:
+    return _request_timings.set([])
+
+
+def end_request(token: object) -> List[Tuple[str, float]]:
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def stage_totals(timings: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Segundos acumulados por etapa, en el orden en que aparece cada una."""
+    totals: Dict[str, float] = {}
+    for stage, elapsed in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return totals
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Agrupa los tiempos por etapa en el formato del header Server-Timing (milisegundos)."""
+    parts = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in stage_totals(timings).items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render_prometheus() -> str:
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    lines: List[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
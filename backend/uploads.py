@@ -0,0 +1,112 @@
+"""Ingesta de archivos subidos: spool a disco, límites de tamaño y hash SHA-256 incremental."""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Por debajo de este tamaño el archivo se mantiene en memoria; por encima se escribe a disco.
+UPLOAD_SPOOL_THRESHOLD_BYTES = int(os.getenv("UPLOAD_SPOOL_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(100 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(110 * 1024 * 1024)))
+
+
+@dataclass
+class SpooledUpload:
+    file: BinaryIO
+    size: int
+    sha256: str
+    filename: str
+    content_type: str
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _too_large(limit: int, what: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"El {what} supera el tamaño máximo permitido ({limit // (1024 * 1024)} MB).",
+    )
+
+
+async def spool_upload(upload_file: UploadFile, max_bytes: int = MAX_UPLOAD_FILE_BYTES) -> SpooledUpload:
+    """
+    Copia el archivo subido por bloques a un SpooledTemporaryFile, calculando el SHA-256 en la misma pasada.
+    Rechaza con 413 en cuanto se supera ``max_bytes`` sin terminar de leer el archivo.
+    """
+    if upload_file.size is not None and upload_file.size > max_bytes:
+        raise _too_large(max_bytes, "archivo")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        await upload_file.seek(0)
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes, "archivo")
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return SpooledUpload(
+        file=spool,
+        size=size,
+        sha256=digest.hexdigest(),
+        filename=upload_file.filename or "",
+        content_type=upload_file.content_type or "",
+    )
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Middleware ASGI que rechaza con 413 los cuerpos que superan ``max_bytes``: de inmediato si el
+    Content-Length lo declara, o al superarse el límite mientras se recibe un cuerpo chunked.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            response = JSONResponse(
+                status_code=413, content={"detail": _too_large(self.max_bytes, "cuerpo de la solicitud").detail}
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-lanza las HTTPException producidas al leer el cuerpo.
+                    raise _too_large(self.max_bytes, "cuerpo de la solicitud")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,276 @@
+"""
+Validación en lote de los campos extraídos contra una tabla de valores esperados (maestro de contratos).
+
+Aplica las mismas reglas que ``preprocess_string``/``flexible_string_match`` y ``compare_dates`` de
+``services``, pero por columna: cada valor distinto se normaliza o se parsea una sola vez (los maestros
+repiten clientes, regiones y fechas) y las comparaciones son operaciones de NumPy sobre los códigos.
+La tabla esperada ya preparada se cachea por hash del archivo, así que validar varios lotes contra el
+mismo maestro solo paga la preparación la primera vez.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from . import telemetry
+
+if TYPE_CHECKING:  # pragma: no cover - solo para anotaciones
+    import numpy as np
+    import pandas as pd
+
+NON_ALNUM = re.compile(r"[^a-zA-Z0-9\s]")
+WHITESPACE = re.compile(r"\s+")
+# Las mismas clases, explícitas para texto ASCII: el ``\s`` de Python incluye \v y \x1c-\x1f, el de RE2 (el motor
+# de pyarrow) no. Así el resultado no depende del motor; el texto no ASCII pasa por las expresiones de Python.
+_ASCII_SPACE = r" \t\n\r\f\v\x1c-\x1f"
+_ASCII_NON_ALNUM = f"[^a-zA-Z0-9{_ASCII_SPACE}]"
+_ASCII_WHITESPACE = f"[{_ASCII_SPACE}]+"
+# Formatos que prueba ``compare_dates``, en orden: gana el primero con el que se parsean ambos valores.
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y")
+DATE_FIELDS = ("Effective Date", "Expiration Date")
+DEFAULT_KEYS = ("Contract Number",)
+VALIDATION_REFERENCE_CACHE_SIZE = int(os.getenv("VALIDATION_REFERENCE_CACHE_SIZE", "4"))
+
+VALIDATED_ROWS = telemetry.counter("idp_validation_rows_total", "Filas extraídas validadas por resultado del cruce.")
+
+
+def _unique_codes(values: "pd.Series") -> Tuple["np.ndarray", "pd.Series"]:
+    """Códigos por fila (-1 para vacíos) y valores distintos como Series de objetos."""
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+    return codes, pd.Series(uniques, dtype=object)
+
+
+def _take(values: "np.ndarray", codes: "np.ndarray", missing: Any) -> "np.ndarray":
+    import numpy as np
+
+    if not len(values):
+        return np.full(len(codes), missing, dtype=values.dtype)
+    out = values[np.maximum(codes, 0)]
+    out[codes < 0] = missing
+    return out
+
+
+def _string_dtype() -> Any:
+    """Strings de Arrow si pyarrow está instalado (regex en C++ sobre la columna), si no objetos de Python."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return object
+    return "string[pyarrow]"
+
+
+def normalize_strings(values: "pd.Series") -> "np.ndarray":
+    """``preprocess_string`` por columna: números tal cual, el resto sin símbolos, espacios colapsados y en minúscula."""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = _unique_codes(values)
+    text = np.array([str(v) for v in uniques], dtype=object)
+    normalized = text.copy()
+    numeric = np.fromiter((isinstance(v, (int, float)) for v in uniques), dtype=bool, count=len(uniques))
+    ascii_text = ~numeric & np.fromiter((t.isascii() for t in text), dtype=bool, count=len(text))
+    if ascii_text.any():
+        column = pd.Series(text[ascii_text], dtype=_string_dtype())
+        cleaned = (
+            column.str.replace(_ASCII_NON_ALNUM, "", regex=True)
+            .str.replace(_ASCII_WHITESPACE, " ", regex=True)
+            .str.strip(" ")
+            .str.lower()
+        )
+        normalized[ascii_text] = cleaned.to_numpy(dtype=object)
+    other = ~numeric & ~ascii_text
+    normalized[other] = [" ".join(NON_ALNUM.sub("", t).split()).lower() for t in text[other]]
+    return _take(normalized, codes, None)
+
+
+def parse_dates(values: "pd.Series") -> "np.ndarray":
+    """
+    Fechas de la columna con cada formato de ``DATE_FORMATS`` (matriz filas x formatos de datetime64, NaT si
+    no aplica). Se parsea una vez por valor distinto; las fechas que ya vienen tipadas (Excel) se toman en ISO.
+    """
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = _unique_codes(values)
+    text = uniques.map(lambda v: v.strftime("%Y-%m-%d") if isinstance(v, (date, datetime)) else str(v))
+    parsed = np.full((len(uniques), len(DATE_FORMATS)), np.datetime64("NaT"), dtype="datetime64[ns]")
+    for column, fmt in enumerate(DATE_FORMATS):
+        # %Y son exactamente 4 dígitos: el separador tiene que estar en la posición 4 (año al inicio) o en la
+        # quinta desde el final (año al final). Solo se parsean con cada formato los valores que pueden cumplirlo.
+        separator = fmt[2]
+        candidates = (text.str[4:5] == separator) if fmt.startswith("%Y") else (text.str[-5:-4] == separator)
+        candidates = candidates.to_numpy(dtype=bool)
+        if candidates.any():
+            parsed[candidates, column] = pd.to_datetime(
+                text[candidates], format=fmt, errors="coerce"
+            ).to_numpy(dtype="datetime64[ns]")
+    out = parsed[np.maximum(codes, 0)] if len(uniques) else np.empty((len(codes), len(DATE_FORMATS)), "datetime64[ns]")
+    out[codes < 0] = np.datetime64("NaT")
+    return out
+
+
+def compare_date_columns(left: "np.ndarray", right: "np.ndarray") -> "np.ndarray":
+    """``compare_dates`` fila a fila sobre dos matrices de ``parse_dates``."""
+    import numpy as np
+
+    result = np.zeros(len(left), dtype=bool)
+    decided = np.zeros(len(left), dtype=bool)
+    for column in range(len(DATE_FORMATS)):
+        both = ~np.isnat(left[:, column]) & ~np.isnat(right[:, column]) & ~decided
+        result[both] = left[both, column] == right[both, column]
+        decided |= both
+    return result
+
+
+def join_keys(frame: "pd.DataFrame", keys: Sequence[str]) -> "np.ndarray":
+    """Clave normalizada por fila (las ``keys`` unidas), None si falta alguna de sus partes."""
+    import numpy as np
+
+    parts = [normalize_strings(frame[key]) if key in frame else np.full(len(frame), None, dtype=object) for key in keys]
+    joined = parts[0].copy()
+    for part in parts[1:]:
+        joined = np.array(
+            [None if a is None or b is None else f"{a}\x1f{b}" for a, b in zip(joined, part)], dtype=object
+        )
+    return joined
+
+
+def flatten_results(results: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filas de contrato a partir de respuestas de /api/process (``openai_response.contracts``) o filas sueltas."""
+    rows: List[Dict[str, Any]] = []
+    for item in results:
+        response = item.get("openai_response") if isinstance(item.get("openai_response"), dict) else item
+        contracts = response.get("contracts")
+        if isinstance(contracts, list):
+            rows.extend(dict(c, **({"file_name": item["file_name"]} if "file_name" in item else {})) for c in contracts)
+        else:
+            rows.append(item)
+    return rows
+
+
+@dataclass
+class ReferenceTable:
+    """Tabla esperada preparada: clave normalizada por fila y cada campo ya normalizado o parseado."""
+
+    keys: Tuple[str, ...]
+    index: "pd.Index"
+    positions: "np.ndarray"
+    columns: Dict[str, "np.ndarray"]
+    rows: int
+    duplicate_keys: int
+
+    @classmethod
+    def build(cls, frame: "pd.DataFrame", keys: Sequence[str] = DEFAULT_KEYS) -> "ReferenceTable":
+        import numpy as np
+        import pandas as pd
+
+        missing = [key for key in keys if key not in frame.columns]
+        if missing:
+            raise ValueError(f"La tabla esperada no tiene las columnas clave: {', '.join(missing)}")
+        joined = pd.Series(join_keys(frame, keys), dtype=object)
+        valid = joined.notna().to_numpy()
+        # Ante claves repetidas se usa la primera fila, como si el maestro estuviera deduplicado.
+        first = valid & ~joined.duplicated().to_numpy()
+        columns = {
+            str(name): parse_dates(frame[name]) if name in DATE_FIELDS else normalize_strings(frame[name])
+            for name in frame.columns
+            if name not in keys
+        }
+        positions = np.flatnonzero(first)
+        return cls(
+            tuple(keys), pd.Index(joined.to_numpy()[first]), positions, columns, len(frame), int((valid & ~first).sum())
+        )
+
+    def lookup(self, joined: "np.ndarray") -> "np.ndarray":
+        """Fila del maestro para cada clave normalizada, -1 si no está."""
+        import numpy as np
+
+        found_at = self.index.get_indexer(joined)
+        return np.where(found_at >= 0, self.positions[np.maximum(found_at, 0)] if len(self.positions) else -1, -1)
+
+
+_references: "OrderedDict[Tuple[str, Tuple[str, ...]], ReferenceTable]" = OrderedDict()
+_references_lock = threading.Lock()
+
+
+def reference_table(
+    content_hash: str, load: Callable[[], "pd.DataFrame"], keys: Sequence[str] = DEFAULT_KEYS
+) -> ReferenceTable:
+    """Tabla esperada preparada y cacheada por hash del archivo; ``load()`` devuelve el DataFrame si no está."""
+    cache_key = (content_hash, tuple(keys))
+    with _references_lock:
+        cached = _references.get(cache_key)
+        if cached is not None:
+            _references.move_to_end(cache_key)
+    telemetry.record_cache("validation_reference", hit=cached is not None)
+    if cached is not None:
+        return cached
+    table = ReferenceTable.build(load(), keys)
+    with _references_lock:
+        _references[cache_key] = table
+        while len(_references) > VALIDATION_REFERENCE_CACHE_SIZE:
+            _references.popitem(last=False)
+    return table
+
+
+def validate_batch(
+    extracted: Union["pd.DataFrame", Sequence[Dict[str, Any]]],
+    expected: Union["pd.DataFrame", ReferenceTable],
+    keys: Sequence[str] = DEFAULT_KEYS,
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple["pd.DataFrame", Dict[str, Any]]:
+    """
+    Cruza las filas extraídas con la tabla esperada por ``keys`` (normalizadas) y devuelve la matriz de
+    coincidencias por campo (una fila por fila extraída, ``found`` si la clave existe en la tabla esperada)
+    y un resumen con la tasa de acierto por campo. Un valor vacío de cualquier lado cuenta como no coincidente.
+    """
+    import numpy as np
+    import pandas as pd
+
+    frame = extracted if isinstance(extracted, pd.DataFrame) else pd.DataFrame(flatten_results(extracted))
+    reference = expected if isinstance(expected, ReferenceTable) else ReferenceTable.build(expected, keys)
+    keys = reference.keys
+    if fields is None:
+        fields = [name for name in reference.columns if name in frame.columns]
+
+    positions = reference.lookup(join_keys(frame, keys))
+    found = positions >= 0
+    matrix = pd.DataFrame({key: frame[key] if key in frame else None for key in keys})
+    matrix["found"] = found
+    summary_fields: Dict[str, Dict[str, Any]] = {}
+    for name in fields:
+        expected_values = reference.columns.get(name)
+        if expected_values is None or name not in frame:
+            continue
+        if name in DATE_FIELDS:
+            left = parse_dates(frame[name])
+            right = expected_values[np.maximum(positions, 0)] if len(expected_values) else np.full_like(left, "NaT")
+            matches = compare_date_columns(left, right) & found
+        else:
+            left = normalize_strings(frame[name])
+            right = expected_values[np.maximum(positions, 0)] if len(expected_values) else left
+            matches = (left == right) & pd.notna(left) & pd.notna(right) & found
+        matrix[name] = matches
+        matched = int(matches.sum())
+        summary_fields[name] = {
+            "matched": matched,
+            "rate": round(matched / int(found.sum()), 4) if found.any() else 0.0,
+        }
+
+    VALIDATED_ROWS.inc(int(found.sum()), result="found")
+    VALIDATED_ROWS.inc(int((~found).sum()), result="not_found")
+    summary = {
+        "rows": len(frame),
+        "found": int(found.sum()),
+        "expected_rows": reference.rows,
+        "duplicate_expected_keys": reference.duplicate_keys,
+        "keys": list(keys),
+        "fields": summary_fields,
+    }
+    return matrix, summary
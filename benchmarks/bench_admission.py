@@ -0,0 +1,155 @@
+"""Reparto justo entre tenants: un batch grande de un usuario contra consultas sueltas de otros.
+
+Uso:
+    python -m benchmarks.bench_admission --batch 40 --light-tenants 3
+
+Un tenant sube ``--batch`` contratos a la vez a /api/process; poco después ``--light-tenants`` usuarios
+suben un contrato y hacen una pregunta a /api/chat/database cada uno. Compara la latencia de los usuarios
+livianos y el tiempo total del batch sin control de admisión, con los slots pero sin cuota por tenant (fifo)
+y con cuota y reparto justo. Además verifica que un tenant sin créditos suficientes recibe 402 sin que se
+llame a Document Intelligence; sale con código 1 si esa verificación falla.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = "Usuario_Batch"
+BROKE = "Usuario_Sin_Saldo"
+
+
+def _sample_pdf(tag: str) -> bytes:
+    return b"%PDF-1.4\n% contrato " + tag.encode("ascii") + b"\n" + bytes(range(256)) * 64
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _headers(access_id: str) -> Dict[str, str]:
+    return {"X-Access-Id": access_id, "X-Poc-Id": "1"}
+
+
+async def _scenario(app: Any, batch: int, light_tenants: int, delay: float) -> Dict[str, Any]:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def upload(access_id: str, tag: str) -> float:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/process",
+                headers=_headers(access_id),
+                files={"file": (f"{tag}.pdf", _sample_pdf(tag), "application/pdf")},
+            )
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        async def ask(access_id: str) -> float:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/chat/database",
+                headers=_headers(access_id),
+                json={"question": f"¿Cuántos contratos tiene la región de {access_id}?"},
+            )
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        async def light_user(index: int) -> List[float]:
+            await asyncio.sleep(delay)
+            access_id = f"Analista_{index}"
+            return list(await asyncio.gather(upload(access_id, f"analista-{index}"), ask(access_id)))
+
+        start = time.perf_counter()
+        heavy_task = asyncio.gather(*(upload(HEAVY, f"batch-{i}") for i in range(batch)))
+        light = await asyncio.gather(*(light_user(i) for i in range(light_tenants)))
+        heavy = await heavy_task
+        wall = time.perf_counter() - start
+    light_latencies = [value for pair in light for value in pair]
+    return {
+        "light_p50_ms": round(_percentile(light_latencies, 50) * 1000, 1),
+        "light_max_ms": round(max(light_latencies) * 1000, 1),
+        "batch_p50_ms": round(_percentile(list(heavy), 50) * 1000, 1),
+        "batch_wall_ms": round(wall * 1000, 1),
+    }
+
+
+async def _rejection(app: Any) -> int:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        response = await client.post(
+            "/api/process",
+            headers=_headers(BROKE),
+            files={"file": ("grande.pdf", _sample_pdf("sin-saldo"), "application/pdf")},
+        )
+    return response.status_code
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=40)
+    parser.add_argument("--light-tenants", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.05, help="Segundos entre el inicio del batch y los demás usuarios.")
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import admission
+    from backend.api import app
+
+    fakes = install_fakes(services, LatencyProfile(scale=args.latency_scale))
+    tenants = [HEAVY] + [f"Analista_{i}" for i in range(args.light_tenants)]
+    fakes.pyodbc._db.executemany("INSERT INTO Accesos VALUES (?, 1, 1, 1000000)", [(t,) for t in tenants])
+    fakes.pyodbc._db.execute("INSERT INTO Accesos VALUES (?, 1, 1, 1)", (BROKE,))
+    fakes.pyodbc._db.commit()
+
+    report: Dict[str, Any] = {"batch": args.batch, "light_tenants": args.light_tenants}
+    capacity = admission.ADMISSION_MAX_CONCURRENCY
+    # baseline: sin admisión; fifo: mismos slots sin cuota por tenant (orden de llegada); admission: completo.
+    modes = {
+        "baseline": None,
+        "fifo": admission.FairScheduler(capacity, capacity),
+        "admission": admission.FairScheduler(capacity, admission.ADMISSION_TENANT_CONCURRENCY),
+    }
+    for name, scheduler in modes.items():
+        admission.ADMISSION_ENABLED = scheduler is not None
+        if scheduler is not None:
+            admission._scheduler = scheduler
+        services.document_store._store = services.document_store.DocumentStore(tempfile.mkdtemp(prefix="idp-docs-"))
+        services._columns_cache.clear()
+        report[name] = asyncio.run(_scenario(app, args.batch, args.light_tenants, args.delay))
+
+    calls_before = fakes.document_client.calls
+    status = asyncio.run(_rejection(app))
+    report["insufficient_balance"] = {
+        "status": status,
+        "document_intelligence_calls": fakes.document_client.calls - calls_before,
+    }
+    passed = status == 402 and fakes.document_client.calls == calls_before
+    report["passed"] = passed
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""Compara la extracción interactiva con el modo bulk (Batch API) para un backfill de contratos.
+
+Uso:
+    python -m benchmarks.bench_bulk --documents 200 --concurrency 4
+
+Hace el OCR de ``--documents`` contratos con ``process_document(extract=False)`` y extrae:
+- interactive: ``process_with_openai`` con ``--concurrency`` llamadas en paralelo (el límite de rate de la
+  cuenta es lo que fija esa concurrencia en producción);
+- bulk: ``backend.bulk`` contra la Batch API falsa, interrumpiendo el job después del envío y
+  retomándolo desde disco, con ``--failure-rate`` de solicitudes fallidas que se reintentan.
+
+Reporta documentos/hora y costo por documento. Para el camino interactivo también reporta el techo que
+impone ``--tpm`` (tokens por minuto de la cuenta); la Batch API usa una cuota aparte de tokens encolados. El tiempo del batch es el que modela el fake
+(``LatencyProfile.batch_base`` + ``batch_per_request``); en la Batch API real el plazo es de hasta 24 h,
+así que la comparación de throughput vale para backfills donde la latencia por documento no importa.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _sample_pdf(index: int) -> bytes:
+    return b"%PDF-1.4\n% contrato archivado " + str(index).encode("ascii") + b"\n" + bytes(range(256)) * 64
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--tpm", type=int, default=200_000, help="Límite de tokens por minuto del camino interactivo.")
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import FakeOpenAI, LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import bulk, routing
+
+    latency = LatencyProfile(scale=args.latency_scale)
+    fakes = install_fakes(services, latency, pages=args.pages)
+    openai = FakeOpenAI(latency, prefix_cache=False, batch_failure_rate=args.failure_rate)
+    services.configure_clients(openai_client=openai)
+
+    async def ocr_all() -> List[Dict[str, Any]]:
+        documents = []
+        for i in range(args.documents):
+            data = _sample_pdf(i)
+            _, metrics, text = await services.process_document(
+                data, "application/pdf", f"archivo_{i}.pdf", content_hash=f"archivo-{i:05d}", extract=False
+            )
+            documents.append({"id": f"archivo-{i:05d}", "file_name": f"archivo_{i}.pdf", "text": text})
+        return documents
+
+    documents = asyncio.run(ocr_all())
+    system_prompt = services.SYSTEM_PROMPTS["English"]
+
+    # Interactivo
+    openai.calls.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda doc: services.process_with_openai(doc["text"], system_prompt), documents))
+    interactive_seconds = time.perf_counter() - start
+    interactive_cost = sum(
+        routing.estimate_cost(c["model"], c["prompt_tokens"], c["completion_tokens"], c["cached_tokens"])
+        for c in openai.calls
+    )
+    interactive_tokens = sum(c["prompt_tokens"] + c["completion_tokens"] for c in openai.calls)
+
+    # Bulk, con una interrupción después del envío
+    openai.calls.clear()
+    state_dir = tempfile.mkdtemp(prefix="idp-bulk-")
+    start = time.perf_counter()
+    job = bulk.BulkJob.open("backfill", base_dir=state_dir)
+    for doc in documents:
+        job.add_document(doc["id"], doc["file_name"], doc["text"], "English")
+    job.save()
+    bulk.run(job, client=openai, wait=False)
+    submitted_batches = len(job.batches)
+    job = bulk.BulkJob.open("backfill", base_dir=state_dir)
+    summary = bulk.run(job, client=openai, wait=True, poll_seconds=0.2)
+    bulk_seconds = time.perf_counter() - start
+
+    report = {
+        "documents": args.documents,
+        "interactive": {
+            "concurrency": args.concurrency,
+            "seconds": round(interactive_seconds, 2),
+            "documents_per_hour": round(args.documents / interactive_seconds * 3600, 1),
+            "documents_per_hour_at_tpm_limit": round(args.tpm * 60 / (interactive_tokens / args.documents), 1),
+            "tokens": interactive_tokens,
+            "cost_usd_per_document": round(interactive_cost / args.documents, 6),
+        },
+        "bulk": {
+            "seconds": round(bulk_seconds, 2),
+            "documents_per_hour": round(summary["status"].get("completed", 0) / bulk_seconds * 3600, 1),
+            "tokens": summary["tokens"],
+            "cost_usd_per_document": summary["cost_usd_per_document"],
+            "batches": len(job.batches),
+            "batches_before_resume": submitted_batches,
+            "status": summary["status"],
+            "retried_requests": sum(doc.attempts - 1 for doc in job.documents.values()),
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
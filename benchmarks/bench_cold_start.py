@@ -0,0 +1,135 @@
+"""Mide el arranque en frío del backend: ``python -X importtime`` y la primera solicitud.
+
+Uso:
+    python -m benchmarks.bench_cold_start --runs 5 --output benchmarks/results_cold_start.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from .harness import FAKE_ENV
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, sys, tempfile, time, types
+if os.environ.get("IDP_BENCH_STUB_PYODBC"):
+    sys.modules["pyodbc"] = types.ModuleType("pyodbc")
+sys.path.insert(0, os.environ["IDP_REPO_ROOT"])
+os.chdir(tempfile.mkdtemp(prefix="idp-cold-"))
+
+start = time.perf_counter()
+from backend import api, services
+import_s = time.perf_counter() - start
+heavy = sorted(m for m in ("pandas", "openai", "azure.ai.formrecognizer", "requests") if m in sys.modules)
+
+start = time.perf_counter()
+if hasattr(services, "get_openai_client"):
+    services.get_document_client()
+    services.get_openai_client()
+client_init_s = time.perf_counter() - start
+
+from fastapi.testclient import TestClient
+from benchmarks.fakes import LatencyProfile
+from benchmarks.harness import install_fakes
+
+client = TestClient(api.app)
+start = time.perf_counter()
+client.get("/api/status")
+first_status_s = time.perf_counter() - start
+
+install_fakes(services, LatencyProfile(scale=0))
+start = time.perf_counter()
+response = client.post(
+    "/api/process",
+    files={"file": ("contrato.pdf", b"%PDF-1.4 cold start", "application/pdf")},
+    data={"language": "Spanish"},
+)
+first_process_s = time.perf_counter() - start
+assert response.status_code == 200, response.text
+
+print(json.dumps({
+    "import_ms": import_s * 1000,
+    "client_init_ms": client_init_s * 1000,
+    "first_status_ms": first_status_s * 1000,
+    "first_process_ms": first_process_s * 1000,
+    "heavy_modules_loaded": heavy,
+}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    for key, value in FAKE_ENV.items():
+        env.setdefault(key, value)
+    env["IDP_REPO_ROOT"] = REPO_ROOT
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    probe = subprocess.run([sys.executable, "-c", "import pyodbc"], capture_output=True, env=env)
+    if probe.returncode != 0:
+        # Sin driver manager ODBC (libodbc) el import real falla; se usa un módulo vacío.
+        env["IDP_BENCH_STUB_PYODBC"] = "1"
+    return env
+
+
+WATCHED_MODULES = (
+    "backend.api", "backend.services", "fastapi", "pandas", "openai",
+    "azure.ai.formrecognizer", "pyodbc", "requests", "dotenv",
+)
+
+
+def importtime(env: Dict[str, str]) -> Dict[str, float]:
+    """Ejecuta ``python -X importtime`` y devuelve el tiempo acumulado (ms) de los módulos relevantes."""
+    stub = "import sys, types; sys.modules['pyodbc'] = types.ModuleType('pyodbc'); " if env.get("IDP_BENCH_STUB_PYODBC") else ""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", stub + "import backend.api"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=REPO_ROOT,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    cumulative: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.search(line)
+        if match and match.group(3) in WATCHED_MODULES:
+            cumulative[match.group(3)] = int(match.group(2)) / 1000
+    return {name: cumulative[name] for name in WATCHED_MODULES if name in cumulative}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    env = _child_env()
+    runs = []
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, env=env)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr[-2000:])
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    report: Dict[str, Any] = {"runs": args.runs, "pyodbc_stubbed": bool(env.get("IDP_BENCH_STUB_PYODBC"))}
+    for key in ("import_ms", "client_init_ms", "first_status_ms", "first_process_ms"):
+        report[f"{key}_median"] = round(statistics.median(run[key] for run in runs), 2)
+    report["heavy_modules_after_import"] = runs[-1]["heavy_modules_loaded"]
+    report["importtime"] = importtime(env)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
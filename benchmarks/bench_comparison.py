@@ -0,0 +1,197 @@
+"""Comparación local entre documentos procesados (``backend.comparison`` y /api/compare).
+
+Uso:
+    python -m benchmarks.bench_comparison --documents 300
+
+Genera resultados de /api/process sintéticos: cada documento trae un contrato con dos filas de pago (rebate en %
+y listing fee en moneda); parte de los contratos aparece en dos documentos, con cambios de formato (mayúsculas,
+puntuación, formato de fecha) que no deben contar como diferencia y, en algunos, otro valor de rebate. Mide el
+tiempo de ``comparison.compare`` y de /api/compare, dibuja los gráficos devueltos con /api/charts y sale con
+código 1 si las diferencias o los cruces de vigencia no coinciden con los sembrados, si hubo llamadas al modelo
+si comparar contratos sin la clave falla o si las versiones de un contrato repiten conflictos.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ["Huggies", "Scott", "Kleenex", "Kotex", "Poise", "Plenitud"]
+REGIONS = ["Andina", "Cono Sur", "Caribe", "Brasil", "México"]
+
+
+def _build(documents: int, seed: int) -> Tuple[List[Dict[str, Any]], Set[str], int]:
+    """Documentos, contratos con rebate cambiado entre versiones y cantidad de pares con vigencias cruzadas."""
+    rng = random.Random(seed)
+    customers = [f"Distribuidora {rng.choice(['Ríos', 'Andes', 'Pampa', 'Sierra'])} #{i} S.A." for i in range(max(documents // 8, 2))]
+    contracts: List[Dict[str, Any]] = []
+    for i in range(int(documents * 0.7)):
+        start = date(2022, 1, 1) + timedelta(days=rng.randint(0, 900))
+        contracts.append(
+            {
+                "number": f"CN-{500000 + i}",
+                "customer": rng.choice(customers),
+                "region": rng.choice(REGIONS),
+                "start": start,
+                "end": None if rng.random() < 0.1 else start + timedelta(days=rng.choice([180, 365, 730])),
+                "categories": rng.sample(CATEGORIES, rng.randint(1, 3)),
+                "rebate": rng.choice([2.0, 2.5, 3.0, 4.5, 5.0]),
+                "fee": rng.choice([500, 1200, 2500]),
+            }
+        )
+
+    def rows(contract: Dict[str, Any], variant: bool, rebate: float) -> List[Dict[str, Any]]:
+        customer = contract["customer"].upper().replace(".", "") if variant else contract["customer"]
+        start = contract["start"].strftime("%d/%m/%Y" if variant else "%Y-%m-%d")
+        end = contract["end"].strftime("%Y-%m-%d") if contract["end"] else None
+        base = {
+            "Contract Number": contract["number"].lower() if variant else contract["number"],
+            "Contract Type": "Commercial agreement",
+            "Customer": customer,
+            "Region": contract["region"],
+            "Effective Date": start,
+            "Expiration Date": end,
+            "Product Category": contract["categories"],
+            "Currency": "USD",
+        }
+        return [
+            dict(base, **{"Payment Type": "Rebate", "Payment Value": f"{rebate:g}%" if not variant else f"{rebate:.2f} %"}),
+            dict(base, **{"Payment Type": "Listing fee", "Payment Value": f"{contract['fee']:,}" if variant else contract["fee"]}),
+        ]
+
+    docs: List[Dict[str, Any]] = []
+    changed: Set[str] = set()
+    for i in range(documents):
+        if i < len(contracts):
+            contract, variant, rebate = contracts[i], False, contracts[i]["rebate"]
+        else:
+            contract, variant = rng.choice(contracts), True
+            rebate = contract["rebate"]
+            if rng.random() < 0.2:
+                rebate += 0.5
+                changed.add(contract["number"])
+        docs.append({"file_name": f"contrato_{i:04d}.pdf", "openai_response": {"contracts": rows(contract, variant, rebate)}})
+
+    overlaps = 0
+    far = date(9999, 12, 31)
+    for a_index, a in enumerate(contracts):
+        for b in contracts[a_index + 1 :]:
+            if a["customer"] == b["customer"] and a["start"] <= (b["end"] or far) and b["start"] <= (a["end"] or far):
+                overlaps += 1
+    return docs, changed, overlaps
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import comparison
+    from backend.api import app
+
+    fakes = install_fakes(services, LatencyProfile(scale=0))
+    documents, changed, expected_overlaps = _build(args.documents, args.seed)
+
+    comparison.compare(documents)  # primera llamada: imports de pandas fuera de la medición
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        report = comparison.compare(documents)
+        samples.append(time.perf_counter() - start)
+
+    async def over_http() -> Dict[str, Any]:
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = await client.post("/api/compare", json={"documents": documents})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+            charts = []
+            for spec in response.json()["charts"]:
+                start = time.perf_counter()
+                rendered = await client.post("/api/charts", json={"chart": spec})
+                charts.append(
+                    {
+                        "type": spec["type"],
+                        "status": rendered.status_code,
+                        "render_ms": round((time.perf_counter() - start) * 1000, 1),
+                        "png_bytes": len(rendered.json().get("image", "")) * 3 // 4,
+                    }
+                )
+            return {"p50_ms": round(statistics.median(latencies) * 1000, 2), "charts": charts}
+
+    http = asyncio.run(over_http())
+    rebate_diffs = {
+        entry["contract"].upper()
+        for entry in report["differences"]
+        if entry["field"] == "Payment Value" and entry.get("payment_type") == "Rebate"
+    }
+    problems = []
+    if rebate_diffs != changed:
+        problems.append(f"diferencias de rebate: {len(rebate_diffs)} encontradas, {len(changed)} sembradas")
+    if report["summary"]["differences"] != len(changed):
+        problems.append(f"diferencias totales: {report['summary']['differences']} (solo cambian {len(changed)} rebates)")
+    if report["summary"]["overlaps"] != expected_overlaps:
+        problems.append(f"vigencias cruzadas: {report['summary']['overlaps']}, esperadas {expected_overlaps}")
+    if fakes.openai_client.calls:
+        problems.append(f"{len(fakes.openai_client.calls)} llamadas al modelo")
+    if any(chart["status"] != 200 for chart in http["charts"]):
+        problems.append("algún gráfico no se pudo dibujar")
+    # Documentos cuyos contratos no traen la clave: sin diferencias, no un error.
+    for keyless in ([[{"Customer": "x"}]], [[{"Customer": "x", "Currency": "USD"}], [{"Customer": "y"}]]):
+        try:
+            comparison.compare(keyless, charts=False)
+        except Exception as exc:
+            problems.append(f"contratos sin clave: {type(exc).__name__}: {exc}")
+    # Dos versiones del mismo contrato (X1 y x-1, con otro rebate) contra otro contrato: una vigencia cruzada, un
+    # conflicto entre las versiones y uno solo contra el otro contrato.
+    versions = [
+        [{"Contract Number": number, "Customer": "Acme", "Effective Date": "2024-01-01",
+          "Expiration Date": "2024-12-31", "Payment Type": "Rebate", "Payment Value": value}]
+        for number, value in (("X1", "2%"), ("x-1", "2.5%"), ("X2", "3%"))
+    ]
+    versioned = comparison.compare(versions, charts=False)
+    kinds = sorted(conflict["kind"] for conflict in versioned["conflicts"])
+    if versioned["summary"]["overlaps"] != 1 or kinds != ["overlapping_terms", "same_contract"]:
+        problems.append(f"versiones de un contrato: {versioned['summary']['overlaps']} vigencias cruzadas, conflictos {kinds}")
+
+    result = {
+        "documents": args.documents,
+        "contract_rows": report["summary"]["rows"],
+        "summary": report["summary"],
+        "compare_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "api_compare_p50_ms": http["p50_ms"],
+        "charts": http["charts"],
+        "openai_calls": len(fakes.openai_client.calls),
+        "problems": problems,
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
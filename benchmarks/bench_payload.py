@@ -0,0 +1,124 @@
+"""Tamaño y costo de serialización de la respuesta de /api/process en un documento de 100 páginas.
+
+Uso:
+    python -m benchmarks.bench_payload --pages 100 --repeat 20
+
+Para ``extracted_text`` en formato ``lines`` (el de siempre) y ``columnar`` (``text_format=columnar``), y para
+cada codificación (identity, gzip y br si el paquete brotli está instalado) reporta los bytes enviados, el tiempo
+del servidor (jsonable_encoder + JSON + compresión, como lo hace FastAPI) y el del cliente (descompresión +
+``json.loads``, más la expansión a una línea por objeto en el formato columnar). Además hace las solicitudes
+reales contra la app y sale con código 1 si la negociación no devuelve la codificación pedida o el contenido
+decodificado no coincide.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _median_ms(func: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 2)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--lines-per-page", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from backend import payloads
+    from backend.api import app
+
+    install_fakes(services, LatencyProfile(scale=0), pages=args.pages, lines_per_page=args.lines_per_page)
+    pdf = b"%PDF-1.4\n% contrato largo\n" + bytes(range(256)) * 64
+
+    openai_response, metrics, extracted_text = asyncio.run(
+        services.process_document(pdf, "application/pdf", "largo.pdf", content_hash="largo")
+    )
+    encoders: Dict[str, Any] = {"identity": (lambda data: data, lambda data: data), "gzip": (
+        lambda data: payloads._Compressor("gzip").compress(data, final=True), gzip.decompress
+    )}
+    if payloads.brotli is not None:
+        encoders["br"] = (lambda data: payloads._Compressor("br").compress(data, final=True), payloads.brotli.decompress)
+
+    report: Dict[str, Any] = {"pages": args.pages, "lines": len(extracted_text), "formats": {}}
+    for text_format in payloads.TEXT_FORMATS:
+        body = {
+            "openai_response": openai_response,
+            "metrics": metrics,
+            "extracted_text": payloads.encode_text(extracted_text, text_format),
+            "file_name": "largo.pdf",
+            "language": "English",
+        }
+        rendered = JSONResponse(content=jsonable_encoder(body)).body
+        serialize_ms = _median_ms(lambda: JSONResponse(content=jsonable_encoder(body)).body, args.repeat)
+        expand = payloads.expand_lines if text_format == payloads.TEXT_FORMAT_COLUMNAR else (lambda value: value)
+        results: Dict[str, Any] = {}
+        for name, (compress, decompress) in encoders.items():
+            wire = compress(rendered)
+            results[name] = {
+                "bytes": len(wire),
+                "server_ms": round(serialize_ms + _median_ms(lambda: compress(rendered), args.repeat), 2),
+                "client_ms": _median_ms(lambda: expand(json.loads(decompress(wire))["extracted_text"]), args.repeat),
+            }
+        report["formats"][text_format] = results
+
+    async def negotiate() -> List[str]:
+        import httpx
+
+        problems = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for text_format in payloads.TEXT_FORMATS:
+                for name in encoders:
+                    response = await client.post(
+                        "/api/process",
+                        headers={"Accept-Encoding": name},
+                        files={"file": ("largo.pdf", pdf, "application/pdf")},
+                        data={"text_format": text_format},
+                    )
+                    received = response.headers.get("content-encoding", "identity")
+                    lines = payloads.expand_lines(response.json()["extracted_text"])
+                    if received != name or lines != extracted_text:
+                        problems.append(f"{text_format}/{name}: content-encoding={received}")
+        return problems
+
+    problems = asyncio.run(negotiate())
+    baseline = report["formats"][payloads.TEXT_FORMAT_LINES]["identity"]["bytes"]
+    best = min(r["bytes"] for results in report["formats"].values() for r in results.values())
+    report["reduction_vs_default"] = round(baseline / best, 1)
+    report["problems"] = problems
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""Mide el pre-procesamiento de imágenes previo al OCR sobre un corpus de escaneos.
+
+Uso:
+    python -m benchmarks.bench_preprocess --corpus ruta/a/escaneos
+    python -m benchmarks.bench_preprocess            # genera escaneos sintéticos
+
+Además del ahorro de bytes estima el ahorro de subida a Document Intelligence con ``--uplink-mbps``.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+
+
+def synthetic_corpus(count: int) -> List[Tuple[str, bytes]]:
+    """Páginas A4 a 600 dpi (PNG) y fotos de teléfono en color (JPEG), levemente inclinadas."""
+    import cv2
+    import numpy as np
+    from io import BytesIO
+
+    from PIL import Image
+
+    rng = random.Random(7)
+    corpus = []
+    for index in range(count):
+        photo = index % 2 == 1
+        width, height = (3024, 4032) if photo else (4960, 7016)
+        page = np.full((height, width, 3), 245 if photo else 255, dtype=np.uint8)
+        for row in range(40):
+            y = 300 + row * (height - 600) // 40
+            text = " ".join(rng.choice(["CONTRATO", "CLIENTE", "PAGO", "VIGENCIA", "2024-01-01", "4.5%"]) for _ in range(6))
+            cv2.putText(page, text, (250, y), cv2.FONT_HERSHEY_SIMPLEX, 3.0 if not photo else 2.0, (20, 20, 20), 6)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-3, 3), 1.0)
+        page = cv2.warpAffine(page, matrix, (width, height), borderValue=(255, 255, 255))
+        if photo:
+            noise = np.random.default_rng(index).normal(0, 6, page.shape)
+            page = np.clip(page + noise + [0, 8, 18], 0, 255).astype(np.uint8)
+        buffer = BytesIO()
+        image = Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB))
+        if photo:
+            image.save(buffer, format="JPEG", quality=92, dpi=(72, 72))
+            corpus.append((f"photo_{index}.jpg", buffer.getvalue()))
+        else:
+            image.save(buffer, format="PNG", dpi=(600, 600))
+            corpus.append((f"scan_{index}.png", buffer.getvalue()))
+    return corpus
+
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(EXTENSIONS):
+            with open(os.path.join(path, name), "rb") as fh:
+                corpus.append((name, fh.read()))
+    return corpus
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directorio con imágenes de muestra.")
+    parser.add_argument("--synthetic", type=int, default=6, help="Cantidad de imágenes sintéticas si no hay corpus.")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    from backend.preprocessing import preprocess_image
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    rows: List[Dict[str, object]] = []
+    for name, data in corpus:
+        start = time.perf_counter()
+        processed, info = preprocess_image(data)
+        elapsed = time.perf_counter() - start
+        saved = len(data) - len(processed)
+        rows.append(
+            {
+                "file": name,
+                "original_bytes": len(data),
+                "processed_bytes": len(processed),
+                "reduction_pct": round(saved / len(data) * 100, 1),
+                "preprocess_ms": round(elapsed * 1000, 1),
+                "upload_saved_ms": round(saved * 8 / (args.uplink_mbps * 1_000_000) * 1000, 1),
+                "deskew_degrees": info.get("deskew_degrees"),
+                "applied": info.get("applied"),
+            }
+        )
+
+    total_in = sum(r["original_bytes"] for r in rows)
+    total_out = sum(r["processed_bytes"] for r in rows)
+    report = {
+        "files": rows,
+        "summary": {
+            "files": len(rows),
+            "original_mb": round(total_in / 1e6, 2),
+            "processed_mb": round(total_out / 1e6, 2),
+            "reduction_pct": round((total_in - total_out) / total_in * 100, 1) if total_in else 0.0,
+            "median_preprocess_ms": statistics.median(r["preprocess_ms"] for r in rows) if rows else 0.0,
+            "median_upload_saved_ms": statistics.median(r["upload_saved_ms"] for r in rows) if rows else 0.0,
+            "uplink_mbps": args.uplink_mbps,
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
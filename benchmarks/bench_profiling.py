@@ -0,0 +1,136 @@
+"""Costo del perfilado bajo demanda y contenido de los perfiles.
+
+Uso:
+    python -m benchmarks.bench_profiling --requests 30
+
+Mide p50/p95 de /api/process y /api/chat/database con el perfilado desactivado, activado sin disparar y
+disparado en cada solicitud (header ``X-Profile``). Revisa que los perfiles guardados contengan los frames del
+backend (``process_document``, ``run_sql_query``) y que /api/debug/requests liste las solicitudes con su
+desglose por etapa; sale con código 1 si algo de eso falta.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "bench-token"
+
+
+def _scenarios() -> Dict[str, Any]:
+    return {
+        "process": (
+            "/api/process",
+            lambda i: {
+                "files": {"file": (f"c{i}.pdf", b"%PDF-1.4\n% perfil " + str(i).encode() + b"\n" + bytes(range(256)) * 64, "application/pdf")}
+            },
+            "process_document",
+            "document_intelligence",
+        ),
+        "chat_database": (
+            "/api/chat/database",
+            lambda i: {"json": {"question": f"¿Cuántos contratos hay en la región {i}?"}},
+            "run_sql_query",
+            "openai",
+        ),
+    }
+
+
+async def _run(app: Any, path: str, build: Any, first: int, requests: int, headers: Dict[str, str]) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    profile_ids: List[str] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for i in range(first, first + requests):  # contenido distinto en cada modo para no leer del caché
+            start = time.perf_counter()
+            response = await client.post(path, headers=headers, **build(i))
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            if "x-profile-id" in response.headers:
+                profile_ids.append(response.headers["x-profile-id"])
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        "profiles": profile_ids,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import profiling
+    from backend.api import app
+
+    install_fakes(services, LatencyProfile(scale=args.latency_scale))
+    profiling.PROFILING_TOKEN = TOKEN
+    profiling.PROFILING_SLOW_REQUEST_SECONDS = 0.0  # en el benchmark todas cuentan como lentas
+    modes = {
+        "disabled": (False, {}),
+        "enabled_idle": (True, {}),
+        "profiled": (True, {"X-Profile": TOKEN}),
+    }
+    report: Dict[str, Any] = {"requests": args.requests}
+    problems: List[str] = []
+
+    async def recent() -> List[Dict[str, Any]]:
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return (await client.get("/api/debug/requests", headers={"X-Profile": TOKEN})).json()["requests"]
+
+    for name, (path, build, expected_frame, expected_stage) in _scenarios().items():
+        results: Dict[str, Any] = {}
+        for index, (mode, (enabled, headers)) in enumerate(modes.items()):
+            profiling.PROFILING_ENABLED = enabled
+            result = asyncio.run(_run(app, path, build, index * args.requests, args.requests, headers))
+            profiles = result.pop("profiles")
+            if mode == "profiled":
+                with open(os.path.join(profiling.PROFILING_DIR, f"{profiles[-1]}.folded"), encoding="utf-8") as fh:
+                    folded = fh.read()
+                result["profiles_written"] = len(profiles)
+                result["stacks_in_last_profile"] = folded.count("\n")
+                if len(profiles) != args.requests or expected_frame not in folded:
+                    problems.append(f"{name}: perfil sin {expected_frame}")
+            elif profiles:
+                problems.append(f"{name}/{mode}: se perfiló sin pedirlo")
+            results[mode] = result
+        results["overhead_enabled_idle_pct"] = round(
+            (results["enabled_idle"]["p50_ms"] / results["disabled"]["p50_ms"] - 1) * 100, 1
+        )
+        results["overhead_profiled_pct"] = round((results["profiled"]["p50_ms"] / results["disabled"]["p50_ms"] - 1) * 100, 1)
+        example = next((r for r in asyncio.run(recent()) if r["route"] == path and r["profile"]), None)
+        if example is None or expected_stage not in example["stages_ms"]:
+            problems.append(f"{name}: debug/requests sin la etapa {expected_stage}")
+        results["recent_example"] = example
+        report[name] = results
+
+    report["problems"] = problems
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""Mide el aprovechamiento del caché de prompts en una sesión de chat sobre un mismo documento.
+
+Uso:
+    python -m benchmarks.bench_prompt_cache --pages 20 --questions 10
+
+Compara contra un fake que simula el caché de prefijos del proveedor:
+- question_first: la pregunta antes de los datos (layout previo de ``answer_from_dataframe``);
+- single_message: documento y pregunta en un único mensaje (layout previo del chat);
+- stable_prefix: instrucciones y documento como mensajes fijos, pregunta al final (actual).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "¿Quién es el cliente?",
+    "¿Cuál es el número de contrato?",
+    "¿Cuándo entra en vigencia?",
+    "¿Cuándo vence?",
+    "¿Qué tipo de pago se acordó?",
+    "¿Cuál es el valor del pago?",
+    "¿En qué moneda se paga?",
+    "¿Qué categorías de producto cubre?",
+    "¿Hay penalidades?",
+    "¿Qué región aplica?",
+]
+
+
+def legacy_messages(
+    services: Any, layout: str, extracted_text: List[Dict[str, Any]], question: str
+) -> List[Dict[str, str]]:
+    formatted_text = "\n".join(f"[Page {item.get('page', 1)}] {item['text']}" for item in extracted_text)
+    if layout == "question_first":
+        content = f"Question: {question}\nDocument:\n{formatted_text}"
+    else:
+        content = (
+            "Here is the content of a contract document:\n\n"
+            f"{formatted_text}\n\n"
+            f"Answer this question about the document: {question}"
+        )
+    return [
+        {"role": "system", "content": services.CHAT_DOCUMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def run_session(layout: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    fakes = install_fakes(services, LatencyProfile(scale=args.latency_scale), pages=args.pages)
+    result = fakes.document_client.begin_analyze_document("prebuilt-read", b"contrato-benchmark").result()
+    extracted_text = [
+        {"page": page.page_number, "text": line.content} for page in result.pages for line in page.lines
+    ]
+
+    rows = []
+    for question in (QUESTIONS * (args.questions // len(QUESTIONS) + 1))[: args.questions]:
+        if layout == "stable_prefix":
+            messages = services.document_chat_messages(extracted_text, question)
+        else:
+            messages = legacy_messages(services, layout, extracted_text, question)
+        start = time.perf_counter()
+        services._chat_completion("chat_document", messages)
+        elapsed = time.perf_counter() - start
+        call = fakes.openai_client.calls[-1]
+        rows.append(
+            {
+                "prompt_tokens": call["prompt_tokens"],
+                "cached_tokens": call["cached_tokens"],
+                "latency_ms": round(elapsed * 1000, 1),
+            }
+        )
+
+    prompt_total = sum(r["prompt_tokens"] for r in rows)
+    cached_total = sum(r["cached_tokens"] for r in rows)
+    return {
+        "questions": rows,
+        "summary": {
+            "prompt_tokens": prompt_total,
+            "cached_tokens": cached_total,
+            "cached_share_pct": round(cached_total / prompt_total * 100, 1) if prompt_total else 0.0,
+            "total_latency_ms": round(sum(r["latency_ms"] for r in rows), 1),
+            "mean_latency_after_first_ms": round(
+                sum(r["latency_ms"] for r in rows[1:]) / max(1, len(rows) - 1), 1
+            ),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    report = {layout: run_session(layout, args) for layout in ("question_first", "single_message", "stable_prefix")}
+    print(json.dumps({layout: data["summary"] for layout, data in report.items()}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""Mide el índice de casi-duplicados (MinHash/LSH) con 100k documentos.
+
+Uso:
+    python -m benchmarks.bench_similarity --documents 100000 --queries 1000
+
+Genera documentos sintéticos (texto OCR de ``--words`` palabras), construye el índice, lo persiste y lo
+vuelve a cargar, y consulta con re-escaneos simulados (palabras mal reconocidas, líneas cortadas distinto)
+y con documentos nuevos. Reporta tiempos de construcción, guardado, carga, firma y consulta (p50/p99),
+recall de los casi-duplicados y falsos positivos. Verifica además que otro tenant no vea esos documentos y que
+un segundo proceso con el mismo índice encuentre lo que el primero agregó después de cargarlo (sale con código 1
+si no).
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TENANT = "bench:1"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    return ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def as_lines(words: List[str], rng: random.Random) -> List[Dict[str, Any]]:
+    lines, position = [], 0
+    while position < len(words):
+        width = rng.randint(6, 12)
+        lines.append({"text": " ".join(words[position : position + width]), "confidence": 0.98})
+        position += width
+    return lines
+
+
+def rescan(words: List[str], rng: random.Random, vocabulary: List[str], noise: float) -> List[str]:
+    """Copia con una fracción de palabras mal reconocidas y una línea de firma al final."""
+    copy = [rng.choice(vocabulary) if rng.random() < noise else word for word in words]
+    return copy + ["firmado", "digitalmente", "por", "el", "cliente"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    import numpy as np
+
+    from backend import similarity
+
+    rng = random.Random(7)
+    vocabulary = make_vocabulary(rng, 20_000)
+    path = os.path.join(tempfile.mkdtemp(prefix="idp-similarity-"), "index")
+    index = similarity.SimilarityIndex(path=path, max_documents=args.documents + args.queries)
+
+    documents = [[rng.choice(vocabulary) for _ in range(args.words)] for _ in range(args.documents)]
+
+    start = time.perf_counter()
+    signatures = np.stack([index.signature(similarity.shingles(as_lines(words, rng))) for words in documents])
+    signature_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.add_many(
+        [{"id": f"doc-{i}", "file_name": f"doc-{i}.pdf", "tenant": TENANT} for i in range(len(documents))], signatures
+    )
+    insert_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.save()
+    save_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index = similarity.SimilarityIndex(path=path, max_documents=args.documents + args.queries)
+    load_seconds = time.perf_counter() - start
+
+    # Firma de un contrato de tamaño real (20 páginas ~ 8000 palabras).
+    contract = as_lines([rng.choice(vocabulary) for _ in range(8000)], rng)
+    contract_timings = []
+    for _ in range(20):
+        start = time.perf_counter()
+        index.signature(similarity.shingles(contract))
+        contract_timings.append(time.perf_counter() - start)
+
+    duplicate_timings, fresh_timings = [], []
+    found, false_positives, similarities = 0, 0, []
+    for query in range(args.queries):
+        target = rng.randrange(args.documents)
+        signature = index.signature(similarity.shingles(as_lines(rescan(documents[target], rng, vocabulary, args.noise), rng)))
+        start = time.perf_counter()
+        matches = index.query(signature, TENANT)
+        duplicate_timings.append(time.perf_counter() - start)
+        hit = next((m for m in matches if m.document == f"doc-{target}"), None)
+        if hit is not None:
+            found += 1
+            similarities.append(hit.similarity)
+
+        signature = index.signature(similarity.shingles(as_lines([rng.choice(vocabulary) for _ in range(args.words)], rng)))
+        start = time.perf_counter()
+        matches = index.query(signature, TENANT)
+        fresh_timings.append(time.perf_counter() - start)
+        false_positives += bool(matches)
+
+    # Aislamiento por tenant y agregados de otro worker (un segundo índice sobre los mismos archivos).
+    probe = index.signature(similarity.shingles(as_lines(documents[0], rng)))
+    other_tenant_matches = len(index.query(probe, "otro:1"))
+    worker = similarity.SimilarityIndex(path=path, max_documents=args.documents + args.queries)
+    added = index.signature(similarity.shingles(as_lines([rng.choice(vocabulary) for _ in range(args.words)], rng)))
+    index.add("added-later", added, "added-later.pdf", TENANT)
+    cross_worker_found = any(m.document == "added-later" for m in worker.query(added, TENANT))
+    problems = []
+    if other_tenant_matches:
+        problems.append(f"otro tenant vio {other_tenant_matches} documentos")
+    if not cross_worker_found:
+        problems.append("un worker no encontró el documento agregado por otro")
+
+    report = {
+        "documents": len(index),
+        "signature_ms_per_document": round(signature_seconds / args.documents * 1000, 3),
+        "signature_ms_contract_8000_words": round(percentile(contract_timings, 50) * 1000, 2),
+        "build_seconds": round(signature_seconds + insert_seconds, 2),
+        "insert_seconds": round(insert_seconds, 2),
+        "save_seconds": round(save_seconds, 2),
+        "load_seconds": round(load_seconds, 2),
+        "index_bytes": os.path.getsize(f"{path}.sig") + os.path.getsize(f"{path}.jsonl"),
+        "query_near_duplicate_us": {
+            "p50": round(percentile(duplicate_timings, 50) * 1e6, 1),
+            "p99": round(percentile(duplicate_timings, 99) * 1e6, 1),
+        },
+        "query_new_document_us": {
+            "p50": round(percentile(fresh_timings, 50) * 1e6, 1),
+            "p99": round(percentile(fresh_timings, 99) * 1e6, 1),
+        },
+        "near_duplicate_recall": round(found / args.queries, 4),
+        "near_duplicate_mean_similarity": round(sum(similarities) / len(similarities), 3) if similarities else None,
+        "false_positive_rate": round(false_positives / args.queries, 4),
+        "other_tenant_matches": other_tenant_matches,
+        "cross_worker_found": cross_worker_found,
+        "problems": problems,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
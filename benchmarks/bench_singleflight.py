@@ -0,0 +1,120 @@
+"""Prueba de concurrencia del single-flight: N solicitudes idénticas simultáneas, una sola llamada al backend.
+
+Uso:
+    python -m benchmarks.bench_singleflight --clients 20
+
+Para /api/warmup, /api/process (mismo archivo) y /api/chat/database (misma pregunta) lanza ``--clients``
+solicitudes a la vez contra la app con fakes, con y sin single-flight, y cuenta las llamadas que llegan a
+Document Intelligence, OpenAI y SQL. Sale con código 1 si con single-flight alguna operación hizo más de
+una llamada al backend o alguna solicitud falló.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_PDF = b"%PDF-1.4\n% documento repetido\n" + bytes(range(256)) * 64
+
+
+def _scenarios() -> Dict[str, Dict[str, Any]]:
+    return {
+        "warmup": {"method": "GET", "path": "/api/warmup", "kwargs": {}},
+        "process": {
+            "method": "POST",
+            "path": "/api/process",
+            "kwargs": {"files": {"file": ("contrato.pdf", SAMPLE_PDF, "application/pdf")}, "data": {"language": "English"}},
+        },
+        "chat_database": {
+            "method": "POST",
+            "path": "/api/chat/database",
+            "kwargs": {"json": {"question": "¿Cuántos contratos hay por región?"}},
+        },
+    }
+
+
+def _reset_state(services: Any) -> None:
+    """Cachés y almacenes vacíos, para que cada corrida haga el trabajo completo."""
+    services.document_store._store = services.document_store.DocumentStore(tempfile.mkdtemp(prefix="idp-docs-"))
+    services.similarity._index = services.similarity.SimilarityIndex(path="")
+    services.sql_templates._store = services.sql_templates.TemplateStore(path="")
+    services._columns_cache.clear()
+
+
+async def _burst(app: Any, scenario: Dict[str, Any], clients: int) -> Dict[str, Any]:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(client.request(scenario["method"], scenario["path"], **scenario["kwargs"]) for _ in range(clients))
+        )
+        wall = time.perf_counter() - start
+    bodies = {json.dumps(r.json(), sort_keys=True) for r in responses if r.status_code < 400}
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "errors": sum(1 for r in responses if r.status_code >= 400),
+        "distinct_responses": len(bodies),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import singleflight
+    from backend.api import app
+
+    fakes = install_fakes(services, LatencyProfile(scale=args.latency_scale))
+    report: Dict[str, Any] = {"clients": args.clients}
+    failures: List[str] = []
+    for name, scenario in _scenarios().items():
+        for enabled in (False, True):
+            singleflight.SINGLEFLIGHT_ENABLED = enabled
+            _reset_state(services)
+            before = {
+                "document_intelligence": fakes.document_client.calls,
+                "openai": len(fakes.openai_client.calls),
+                "sql_connects": fakes.pyodbc.connects,
+            }
+            leaders = singleflight.CALLS.value(operation=name, role="leader")
+            result = asyncio.run(_burst(app, scenario, args.clients))
+            result["backend_calls"] = {
+                "document_intelligence": fakes.document_client.calls - before["document_intelligence"],
+                "openai": len(fakes.openai_client.calls) - before["openai"],
+                "sql_connects": fakes.pyodbc.connects - before["sql_connects"],
+            }
+            result["executions"] = int(singleflight.CALLS.value(operation=name, role="leader") - leaders) if enabled else args.clients
+            report.setdefault(name, {})["singleflight" if enabled else "baseline"] = result
+            if enabled and (result["executions"] != 1 or result["errors"] or result["distinct_responses"] != 1):
+                failures.append(name)
+
+    report["passed"] = not failures
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if failures:
+        print(f"Single-flight no coalesció: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+"""Preguntas sobre una planilla subida: prompt con ``DataFrame.to_string`` contra la tabla en memoria con SQL.
+
+Uso:
+    python -m benchmarks.bench_spreadsheet --rows 20000 --questions 5
+
+Genera un export de contratos en CSV y le hace ``--questions`` preguntas de dos formas: como lo hacía
+``chat_with_database`` (releer el archivo en cada pregunta y mandar ``to_string`` completo en el prompt) y con
+/api/chat/spreadsheet (la primera pregunta sube el archivo, las siguientes usan ``table_id``; una más lo vuelve a
+subir para medir el caché por hash). Informa latencia y tokens de prompt por pregunta y sale con código 1 si el
+resultado de la consulta no coincide con el de pandas, si la planilla se cargó más de una vez o si los tokens
+no bajan.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGIONS = ["LATAM Norte", "LATAM Sur", "Cono Sur", "Andina", "Caribe", "Brasil", "México", "Centroamérica"]
+PAYMENT_TYPES = ["Rebate", "Off-invoice discount", "Volume bonus", "Display fee", "Listing fee"]
+# Ventana de contexto de referencia para informar si el prompt con to_string siquiera entra.
+CONTEXT_TOKENS = 128_000
+# Prompt de la versión anterior de ``chat_with_database``.
+LEGACY_SYSTEM_PROMPT = (
+    "You are an assistant that answers questions about contract "
+    "databases. Use only the information provided in the Excel "
+    "data. If the answer is not in the data, say you don't know. "
+    "When appropriate, refer to specific rows or entries from the data."
+)
+SQL = 'SELECT "Region", ROUND(SUM("Payment Value"), 2) AS total FROM Spreadsheet GROUP BY "Region" ORDER BY "Region"'
+
+
+def _csv(rows: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    lines = ["Contract Number,Customer,Region,Effective Date,Payment Type,Payment Value,Currency"]
+    for i in range(rows):
+        lines.append(
+            ",".join(
+                [
+                    f"CN-{400000 + i}",
+                    f"Distribuidora {rng.choice(['Ríos', 'Andes', 'Pampa', 'Sierra'])} #{rng.randint(1, 800)}",
+                    rng.choice(REGIONS),
+                    f"{rng.randint(2019, 2026)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    rng.choice(PAYMENT_TYPES),
+                    f"{rng.choice([1.5, 2.0, 2.5, 3.0, 4.5, 5.0, 7.5, 1200, 2500])}",
+                    "USD",
+                ]
+            )
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _tokens(fakes: Any, since: int) -> int:
+    return sum(call["prompt_tokens"] for call in fakes.openai_client.calls[since:])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    from benchmarks.fakes import LatencyProfile
+    from benchmarks.harness import install_fakes, load_services
+
+    services = load_services()
+    from backend import tabular
+    from backend.api import app
+
+    fakes = install_fakes(services, LatencyProfile(scale=args.latency_scale))
+    fakes.openai_client.sql = SQL
+    content = _csv(args.rows, args.seed)
+    questions = [f"¿Cuál es el total de Payment Value por región? ({i})" for i in range(args.questions)]
+
+    # Antes: cada pregunta relee el archivo y manda la planilla entera como texto.
+    legacy_latencies, legacy_tokens = [], []
+    for question in questions:
+        since = len(fakes.openai_client.calls)
+        start = time.perf_counter()
+        upload = UploadFile(io.BytesIO(content), filename="export.csv", headers=Headers({"content-type": "text/csv"}))
+        data = services.dataframe_from_file(upload)
+        services._chat_completion(
+            "chat_database",
+            services._document_messages(
+                LEGACY_SYSTEM_PROMPT,
+                f"Here is the content of a contract database:\n\n{data.to_string(index=False)}",
+                f"Answer this question about the database: {question}",
+            ),
+        )
+        legacy_latencies.append(time.perf_counter() - start)
+        legacy_tokens.append(_tokens(fakes, since))
+
+    async def over_http() -> List[Dict[str, Any]]:
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        results: List[Dict[str, Any]] = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            table_id = None
+            for index, question in enumerate([*questions, questions[0]]):
+                since = len(fakes.openai_client.calls)
+                # La primera y la última suben el archivo (la última debe salir del caché por hash).
+                upload = index == 0 or index == len(questions)
+                start = time.perf_counter()
+                response = await client.post(
+                    "/api/chat/spreadsheet",
+                    data={"question": question, **({} if upload else {"table_id": table_id})},
+                    files={"file": ("export.csv", content, "text/csv")} if upload else None,
+                )
+                elapsed = time.perf_counter() - start
+                response.raise_for_status()
+                body = response.json()
+                table_id = body["table"]["table_id"]
+                results.append({"upload": upload, "seconds": elapsed, "tokens": _tokens(fakes, since), "body": body})
+        return results
+
+    loaded_before = tabular.LOADED_ROWS.value()
+    results = asyncio.run(over_http())
+    body = results[-1]["body"]
+
+    frame = services.dataframe_from_file(
+        UploadFile(io.BytesIO(content), filename="export.csv", headers=Headers({"content-type": "text/csv"}))
+    )
+    expected = frame.groupby("Region")["Payment Value"].sum().round(2).sort_index()
+    got = {row["Region"]: row["total"] for row in body["rows"]}
+    problems = []
+    if got != {region: float(total) for region, total in expected.items()}:
+        problems.append("el resultado de la consulta no coincide con pandas")
+    rows_loaded = int(tabular.LOADED_ROWS.value() - loaded_before)
+    if rows_loaded != args.rows:
+        problems.append(f"se cargaron {rows_loaded} filas para una planilla de {args.rows} (debería leerse una vez)")
+    new_tokens = [r["tokens"] for r in results]
+    if max(new_tokens) >= min(legacy_tokens):
+        problems.append("los tokens de prompt no bajaron")
+
+    report = {
+        "rows": args.rows,
+        "csv_bytes": len(content),
+        "questions": args.questions,
+        "to_string": {
+            "p50_ms": round(statistics.median(legacy_latencies) * 1000, 1),
+            "prompt_tokens_per_question": round(statistics.mean(legacy_tokens)),
+            "fits_context": max(legacy_tokens) <= CONTEXT_TOKENS,
+        },
+        "tabular": {
+            "first_question_ms": round(results[0]["seconds"] * 1000, 1),
+            "cached_p50_ms": round(statistics.median(r["seconds"] for r in results[1:-1]) * 1000, 1)
+            if len(results) > 2
+            else None,
+            "reupload_ms": round(results[-1]["seconds"] * 1000, 1),
+            "prompt_tokens_per_question": round(statistics.mean(new_tokens)),
+            "answered_locally": body["answered_locally"],
+            "sql": body["sql"],
+            "rows_loaded": rows_loaded,
+            "table": {k: v for k, v in body["table"].items() if k != "table_id"},
+        },
+        "problems": problems,
+    }
+    report["token_reduction_x"] = round(
+        report["to_string"]["prompt_tokens_per_question"] / max(1, report["tabular"]["prompt_tokens_per_question"]), 1
+    )
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+"""Validación en lote contra un maestro de contratos: helpers escalares contra ``backend.validation``.
+
+Uso:
+    python -m benchmarks.bench_validation --expected-rows 50000 --extracted-rows 5000
+
+Genera un maestro sintético (clientes, regiones y fechas repetidos, como en uno real) y un lote de filas
+extraídas con variaciones de mayúsculas, puntuación, formato de fecha y contratos inexistentes. Valida el lote
+con ``flexible_string_match``/``compare_dates`` fila por fila (cruce por diccionario de número de contrato) y con
+``validate_batch``, en frío (preparando el maestro) y en caliente (maestro cacheado). Sale con código 1 si las
+dos matrices de coincidencias difieren.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIELDS = ["Customer", "Region", "Effective Date", "Expiration Date", "Payment Type", "Payment Value", "Currency"]
+REGIONS = ["LATAM Norte", "LATAM Sur", "Cono Sur", "Andina", "Caribe", "Brasil", "México", "Centroamérica"]
+PAYMENT_TYPES = ["Rebate", "Off-invoice discount", "Volume bonus", "Display fee", "Listing fee"]
+CURRENCIES = ["USD", "ARS", "BRL", "MXN", "COP", "CLP"]
+DATE_STYLES = ["{y:04d}-{m:02d}-{d:02d}", "{d:02d}/{m:02d}/{y:04d}", "{y:04d}/{m:02d}/{d:02d}", "{d:02d}-{m:02d}-{y:04d}"]
+
+
+def _date(rng: random.Random, style: str) -> str:
+    return style.format(y=rng.randint(2018, 2027), m=rng.randint(1, 12), d=rng.randint(1, 28))
+
+
+def _restyle(value: str, style: str) -> str:
+    """La misma fecha en otro formato (compare_dates solo la reconoce si ambos lados comparten formato)."""
+    for source in DATE_STYLES:
+        try:
+            from datetime import datetime
+
+            parsed = datetime.strptime(value, source.replace("{y:04d}", "%Y").replace("{m:02d}", "%m").replace("{d:02d}", "%d"))
+        except ValueError:
+            continue
+        return style.format(y=parsed.year, m=parsed.month, d=parsed.day)
+    return value
+
+
+def _build(expected_rows: int, extracted_rows: int, seed: int):
+    rng = random.Random(seed)
+    customers = [f"Distribuidora {rng.choice(['Ríos', 'Andes', 'Pampa', 'Sierra'])} #{i} S.A." for i in range(800)]
+    expected: List[Dict[str, Any]] = []
+    for i in range(expected_rows):
+        style = rng.choice(DATE_STYLES)
+        expected.append(
+            {
+                "Contract Number": f"CN-{400000 + i}",
+                "Customer": rng.choice(customers),
+                "Region": rng.choice(REGIONS),
+                "Effective Date": _date(rng, style),
+                "Expiration Date": _date(rng, style),
+                "Payment Type": rng.choice(PAYMENT_TYPES),
+                "Payment Value": rng.choice([1.5, 2.0, 2.5, 3.0, 4.5, 5.0, 7.5]),
+                "Currency": rng.choice(CURRENCIES),
+            }
+        )
+    extracted: List[Dict[str, Any]] = []
+    for _ in range(extracted_rows):
+        row = dict(rng.choice(expected))
+        roll = rng.random()
+        if roll < 0.05:
+            row["Contract Number"] = f"CN-{900000 + rng.randint(0, 99999)}"  # no está en el maestro
+        elif roll < 0.25:
+            row["Contract Number"] = row["Contract Number"].replace("-", " ").lower()
+        if rng.random() < 0.3:
+            row["Customer"] = row["Customer"].upper().replace(".", "")
+        if rng.random() < 0.1:
+            row["Customer"] = rng.choice(customers)
+        if rng.random() < 0.2:
+            row["Effective Date"] = _restyle(row["Effective Date"], rng.choice(DATE_STYLES))
+        if rng.random() < 0.1:
+            row["Payment Value"] = f"{row['Payment Value']}%"
+        extracted.append(row)
+    return expected, extracted
+
+
+def _scalar(services: Any, expected: List[Dict[str, Any]], extracted: List[Dict[str, Any]]) -> List[List[bool]]:
+    index: Dict[str, Dict[str, Any]] = {}
+    for row in expected:
+        index.setdefault(services.preprocess_string(row["Contract Number"]), row)
+    matrix = []
+    for row in extracted:
+        reference = index.get(services.preprocess_string(row["Contract Number"]))
+        result = [reference is not None]
+        for name in FIELDS:
+            if reference is None:
+                result.append(False)
+            elif name in ("Effective Date", "Expiration Date"):
+                result.append(services.compare_dates(row[name], reference[name]))
+            else:
+                result.append(services.flexible_string_match(row[name], reference[name]))
+        matrix.append(result)
+    return matrix
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--expected-rows", type=int, default=50_000)
+    parser.add_argument("--extracted-rows", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+    from benchmarks.harness import load_services
+
+    services = load_services()
+    import pandas as pd
+    from backend import validation
+
+    expected, extracted = _build(args.expected_rows, args.extracted_rows, args.seed)
+    expected_frame = pd.DataFrame(expected)
+
+    start = time.perf_counter()
+    scalar = _scalar(services, expected, extracted)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = validation.reference_table("bench", lambda: expected_frame)
+    matrix, summary = validation.validate_batch(extracted, reference)
+    cold_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = validation.reference_table("bench", lambda: expected_frame)
+    matrix, summary = validation.validate_batch(extracted, reference)
+    warm_seconds = time.perf_counter() - start
+
+    vectorized = matrix[["found"] + FIELDS].astype(bool).values.tolist()
+    mismatches = sum(1 for a, b in zip(scalar, vectorized) if a != b)
+    report = {
+        "expected_rows": args.expected_rows,
+        "extracted_rows": args.extracted_rows,
+        "scalar_seconds": round(scalar_seconds, 3),
+        "batch_cold_seconds": round(cold_seconds, 3),
+        "batch_warm_seconds": round(warm_seconds, 3),
+        "speedup_cold": round(scalar_seconds / cold_seconds, 1),
+        "speedup_warm": round(scalar_seconds / warm_seconds, 1),
+        "mismatched_rows": mismatches,
+        "summary": summary,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
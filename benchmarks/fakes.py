@@ -0,0 +1,557 @@
+"""Clientes falsos, deterministas y con latencia configurable para medir el backend sin red.
+
+Reemplazan a Document Intelligence, OpenAI (chat.completions y Batch API), pyodbc (respaldado por SQLite)
+y los endpoints HTTP de carga y Microsoft Graph que usa ``backend.services``.
+"""
+
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+WORDS = (
+    "contrato cliente acuerdo pago descuento vigencia region categoria producto exhibicion "
+    "incentivo penalidad cláusula trimestral objetivo volumen bonificación moneda plazo "
+    "renovación confidencialidad exclusividad distribuidor"
+).split()
+
+
+@dataclass
+class LatencyProfile:
+    """Latencias simuladas (segundos). ``scale`` multiplica todas; 0 mide solo el overhead local."""
+
+    di_base: float = 0.25
+    di_per_page: float = 0.05
+    openai_base: float = 0.35
+    openai_per_1k_prompt_tokens: float = 0.02
+    openai_per_1k_completion_tokens: float = 0.6
+    # Los tokens servidos desde el caché de prefijos cuestan esta fracción del tiempo de un token nuevo.
+    openai_cached_prompt_factor: float = 0.1
+    # Batch API: tiempo desde la creación hasta que el batch completo queda listo.
+    batch_base: float = 20.0
+    batch_per_request: float = 0.02
+    sql_connect: float = 0.02
+    sql_query: float = 0.01
+    http: float = 0.05
+    scale: float = 1.0
+
+    def sleep(self, seconds: float) -> None:
+        if self.scale > 0 and seconds > 0:
+            time.sleep(seconds * self.scale)
+
+
+def _seed_for(data: Any) -> int:
+    digest = hashlib.sha256(data if isinstance(data, (bytes, bytearray)) else str(data).encode("utf-8"))
+    return int.from_bytes(digest.digest()[:8], "big")
+
+
+# ---------- Document Intelligence ----------
+
+
+class _FakePoller:
+    def __init__(self, result: Any, delay: float, latency: LatencyProfile):
+        self._result = result
+        self._delay = delay
+        self._latency = latency
+
+    def result(self) -> Any:
+        self._latency.sleep(self._delay)
+        return self._result
+
+
+class FakeDocumentClient:
+    """Imita ``DocumentAnalysisClient.begin_analyze_document`` con texto generado a partir del documento."""
+
+    def __init__(self, latency: LatencyProfile, pages: int = 3, lines_per_page: int = 40):
+        self.latency = latency
+        self.pages = pages
+        self.lines_per_page = lines_per_page
+        self.calls = 0
+        self.pages_analyzed = 0
+        self._lock = threading.Lock()
+
+    def begin_analyze_document(self, model_id: str, document: Any, **kwargs: Any) -> _FakePoller:
+        with self._lock:
+            self.calls += 1
+        if hasattr(document, "read"):
+            document = document.read()
+        wanted = _parse_page_ranges(kwargs["pages"]) if kwargs.get("pages") else None
+        pages = self._pdf_pages(document, wanted)
+        if pages is None:
+            rng = random.Random(_seed_for(document))
+            pages = []
+            for page_number in range(1, self.pages + 1):
+                lines = [
+                    SimpleNamespace(content=" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))))
+                    for _ in range(self.lines_per_page)
+                ]
+                lines[0] = SimpleNamespace(content=f"CONTRATO N° CT-{rng.randint(1000, 9999)} - Página {page_number}")
+                pages.append(SimpleNamespace(page_number=page_number, lines=lines))
+            if wanted:
+                pages = [page for page in pages if page.page_number in wanted]
+        with self._lock:
+            self.pages_analyzed += len(pages)
+        result = SimpleNamespace(pages=pages, content="\n".join(l.content for p in pages for l in p.lines))
+        delay = self.latency.di_base + self.latency.di_per_page * len(pages)
+        return _FakePoller(result, delay, self.latency)
+
+    @staticmethod
+    def _pdf_pages(document: bytes, wanted: Optional[set]) -> Optional[List[Any]]:
+        """Si el documento es un PDF real con texto embebido (y pypdf está disponible), usa ese texto."""
+        if not document.startswith(b"%PDF") or b"%%EOF" not in document[-2048:]:
+            return None
+        try:
+            from io import BytesIO
+
+            from pypdf import PdfReader
+
+            reader = PdfReader(BytesIO(document))
+            return [
+                SimpleNamespace(
+                    page_number=number,
+                    lines=[SimpleNamespace(content=line) for line in (page.extract_text() or "").splitlines() if line],
+                )
+                for number, page in enumerate(reader.pages, start=1)
+                if wanted is None or number in wanted
+            ]
+        except Exception:
+            return None
+
+
+def _parse_page_ranges(spec: str) -> set:
+    pages = set()
+    for part in spec.split(","):
+        start, _, end = part.strip().partition("-")
+        pages.update(range(int(start), int(end or start) + 1))
+    return pages
+
+
+# ---------- OpenAI ----------
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _sample_contract(seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        "contracts": [
+            {
+                "Contract": "Colombia (Inversiones Ríos Gallego)",
+                "Contract Number": f"CT-{rng.randint(1000, 9999)}",
+                "Contract Type": "Development Plan Agreement",
+                "Customer": rng.choice(["Inversiones Ríos Gallego", "Distribuidora Andina", "Mercados del Sur"]),
+                "Region": rng.choice(["Antioquia", "Cundinamarca", "Valle"]),
+                "Effective Date": "2024-01-01",
+                "Expiration Date": "2024-12-31",
+                "Contract Terms": "12 months, automatic renewal",
+                "Promo Tactic": ["Endcap display"],
+                "Product Category": [rng.choice(["Beverages", "Snacks", "Dairy"])],
+                "Payment Type": "Volume rebate",
+                "Payment Value": f"{rng.randint(1, 9)}.5%",
+                "Currency": "COP",
+                "Incentives Details": ["Quarterly rebate on target achievement"],
+                "Promotion Display": "Shelf space",
+                "Payment Structure": "Quarterly",
+                "Penalties": "None",
+                "Legal Aspects": ["Anti-corruption clause"],
+            }
+        ]
+    }
+
+
+CHART_CODE = """import matplotlib.pyplot as plt
+fig, ax = plt.subplots(figsize=(6, 4))
+ax.bar(["A", "B", "C"], [3, 5, 2], color=["#D7263D", "#3F88C5", "#F49D37"])
+ax.set_title("Fake chart")
+"""
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def create(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+        return self._owner._complete(model, messages, **kwargs)
+
+
+class _PrefixCache:
+    """
+    Simula el caché automático de prompts de OpenAI: prefijos de al menos 1024 tokens, en bloques de
+    128, idénticos byte a byte desde el primer mensaje y por modelo.
+    """
+
+    MIN_TOKENS = 1024
+    BLOCK_TOKENS = 128
+
+    def __init__(self):
+        self._prefixes: set = set()
+
+    def lookup_and_store(self, model: str, messages: List[Dict[str, Any]]) -> int:
+        serialized = "".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in messages)
+        digest = hashlib.sha256(model.encode("utf-8"))
+        cached = 0
+        consumed = 0
+        block_chars = self.BLOCK_TOKENS * 4
+        for boundary in range(self.MIN_TOKENS * 4, len(serialized) + 1, block_chars):
+            digest.update(serialized[consumed:boundary].encode("utf-8"))
+            consumed = boundary
+            key = digest.hexdigest()
+            if key in self._prefixes:
+                cached = boundary // 4
+            self._prefixes.add(key)
+        return cached
+
+
+class _FakeFiles:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+        self._files: Dict[str, bytes] = {}
+
+    def create(self, file: Any, purpose: str) -> Any:
+        data = file.read() if hasattr(file, "read") else file
+        with self._owner._lock:
+            file_id = f"file-{len(self._files) + 1:06d}"
+            self._files[file_id] = data if isinstance(data, bytes) else str(data).encode("utf-8")
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(self._files[file_id]))
+
+    def content(self, file_id: str) -> Any:
+        data = self._files[file_id]
+        return SimpleNamespace(content=data, text=data.decode("utf-8"))
+
+
+class _FakeBatches:
+    """
+    Imita la Batch API: el batch queda ``in_progress`` hasta cumplir ``batch_base + batch_per_request * n``
+    (escalado) desde su creación y en ese momento se resuelven todas las solicitudes con el mismo generador
+    de respuestas que chat.completions. ``failure_rate`` hace fallar solicitudes de forma determinista.
+    """
+
+    def __init__(self, owner: "FakeOpenAI", failure_rate: float = 0.0):
+        self._owner = owner
+        self.failure_rate = failure_rate
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._attempts: Dict[str, int] = {}
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str, metadata: Any = None) -> Any:
+        lines = [json.loads(raw) for raw in self._owner.files.content(input_file_id).text.splitlines() if raw.strip()]
+        latency = self._owner.latency
+        with self._owner._lock:
+            batch_id = f"batch_{len(self._batches) + 1:06d}"
+            self._batches[batch_id] = {
+                "lines": lines,
+                "ready_at": time.monotonic()
+                + max(0.0, latency.batch_base + latency.batch_per_request * len(lines)) * latency.scale,
+                "status": "validating",
+                "output_file_id": None,
+                "error_file_id": None,
+            }
+        return SimpleNamespace(id=batch_id, status="validating", endpoint=endpoint, metadata=metadata)
+
+    def retrieve(self, batch_id: str) -> Any:
+        batch = self._batches[batch_id]
+        if batch["status"] != "completed":
+            if time.monotonic() < batch["ready_at"]:
+                batch["status"] = "in_progress"
+            else:
+                self._resolve(batch)
+        return SimpleNamespace(
+            id=batch_id,
+            status=batch["status"],
+            output_file_id=batch["output_file_id"],
+            error_file_id=batch["error_file_id"],
+            request_counts=SimpleNamespace(total=len(batch["lines"])),
+        )
+
+    def _resolve(self, batch: Dict[str, Any]) -> None:
+        outputs, errors = [], []
+        for line in batch["lines"]:
+            custom_id = line["custom_id"]
+            self._attempts[custom_id] = self._attempts.get(custom_id, 0) + 1
+            seed = _seed_for(f"{custom_id}:{self._attempts[custom_id]}") % 10_000
+            if seed < self.failure_rate * 10_000:
+                errors.append(
+                    {
+                        "id": f"req_{custom_id}",
+                        "custom_id": custom_id,
+                        "response": {"status_code": 500, "body": {"error": {"message": "Simulated failure"}}},
+                        "error": None,
+                    }
+                )
+                continue
+            body = line["body"]
+            options = {k: v for k, v in body.items() if k not in ("model", "messages")}
+            response = self._owner._complete(body["model"], body["messages"], _batch=True, **options)
+            usage = response.usage
+            outputs.append(
+                {
+                    "id": f"req_{custom_id}",
+                    "custom_id": custom_id,
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "model": body["model"],
+                            "choices": [
+                                {"index": 0, "message": {"role": "assistant", "content": response.choices[0].message.content}}
+                            ],
+                            "usage": {
+                                "prompt_tokens": usage.prompt_tokens,
+                                "completion_tokens": usage.completion_tokens,
+                                "total_tokens": usage.total_tokens,
+                            },
+                        },
+                    },
+                    "error": None,
+                }
+            )
+        files = self._owner.files
+        if outputs:
+            batch["output_file_id"] = files.create("\n".join(json.dumps(o) for o in outputs).encode("utf-8"), "batch_output").id
+        if errors:
+            batch["error_file_id"] = files.create("\n".join(json.dumps(e) for e in errors).encode("utf-8"), "batch_output").id
+        batch["status"] = "completed"
+
+
+class FakeOpenAI:
+    """
+    Imita ``client.chat.completions.create`` devolviendo respuestas plausibles según el punto de llamada,
+    y ``client.files``/``client.batches`` de la Batch API.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyProfile,
+        sql: str = "SELECT COUNT(*) AS total FROM Contracts",
+        prefix_cache: bool = True,
+        batch_failure_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.sql = sql
+        self.calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._prefix_cache = _PrefixCache() if prefix_cache else None
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self.files = _FakeFiles(self)
+        self.batches = _FakeBatches(self, failure_rate=batch_failure_rate)
+
+    def _respond(self, messages: List[Dict[str, Any]], **kwargs: Any) -> str:
+        system = str(messages[0].get("content", "")) if messages else ""
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        if kwargs.get("response_format", {}).get("type") == "json_object":
+            return json.dumps(_sample_contract(_seed_for(prompt)), ensure_ascii=False)
+        if "SQL assistant" in system:
+            return self.sql
+        if "matplotlib" in system:
+            return f"```python\n{CHART_CODE}```"
+        return "Respuesta simulada basada en el contenido provisto."
+
+    def _complete(self, model: str, messages: List[Dict[str, Any]], _batch: bool = False, **kwargs: Any) -> Any:
+        prompt_text = "\n".join(str(m.get("content", "")) for m in messages)
+        content = self._respond(messages, **kwargs)
+        prompt_tokens = _estimate_tokens(prompt_text)
+        completion_tokens = _estimate_tokens(content)
+        with self._lock:
+            cached_tokens = self._prefix_cache.lookup_and_store(model, messages) if self._prefix_cache and not _batch else 0
+            cached_tokens = min(cached_tokens, prompt_tokens)
+            self.calls.append(
+                {
+                    "model": model,
+                    "prompt_tokens": prompt_tokens,
+                    "cached_tokens": cached_tokens,
+                    "completion_tokens": completion_tokens,
+                    "batch": _batch,
+                }
+            )
+        uncached_tokens = prompt_tokens - cached_tokens
+        if not _batch:
+            self._sleep_for(uncached_tokens, cached_tokens, completion_tokens)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage, model=model)
+
+    def _sleep_for(self, uncached_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+        self.latency.sleep(
+            self.latency.openai_base
+            + self.latency.openai_per_1k_prompt_tokens
+            * (uncached_tokens + cached_tokens * self.latency.openai_cached_prompt_factor)
+            / 1000
+            + self.latency.openai_per_1k_completion_tokens * completion_tokens / 1000
+        )
+
+
+# ---------- pyodbc (SQLite) ----------
+
+_COLUMNS_QUERY = re.compile(r"INFORMATION_SCHEMA\.COLUMNS", re.IGNORECASE)
+_CALL = re.compile(r"^\{CALL\s+(\w+)\s*\(", re.IGNORECASE)
+
+
+def _seed_database(conn: sqlite3.Connection, rows: int) -> None:
+    rng = random.Random(42)
+    conn.execute(
+        "CREATE TABLE Contracts (ContractNumber TEXT, Customer TEXT, Region TEXT, ProductCategory TEXT, "
+        "EffectiveDate TEXT, ExpirationDate TEXT, PaymentType TEXT, PaymentValue TEXT, Currency TEXT)"
+    )
+    customers = ["Inversiones Ríos Gallego", "Distribuidora Andina", "Mercados del Sur", "Almacenes Norte"]
+    conn.executemany(
+        "INSERT INTO Contracts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                f"CT-{1000 + i}",
+                rng.choice(customers),
+                rng.choice(["Antioquia", "Cundinamarca", "Valle"]),
+                rng.choice(["Beverages", "Snacks", "Dairy"]),
+                f"{rng.choice([2023, 2024, 2025])}-{rng.randint(1, 12):02d}-01",
+                f"{rng.choice([2025, 2026])}-{rng.randint(1, 12):02d}-28",
+                rng.choice(["Volume rebate", "Display fee"]),
+                f"{rng.uniform(1, 10):.2f}",
+                "COP",
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.execute("CREATE TABLE Accesos (AccessId TEXT, PocId INTEGER, Activo INTEGER, Tokens INTEGER)")
+    conn.execute("INSERT INTO Accesos VALUES ('Usuario_IDP', 1, 1, 1000000)")
+    conn.commit()
+
+
+class FakeCursor:
+    def __init__(self, owner: "FakeConnection"):
+        self._owner = owner
+        self._cursor = owner._db.cursor()
+        self.description = None
+
+    def execute(self, sql: str, *params: Any) -> "FakeCursor":
+        args = params[0] if len(params) == 1 and isinstance(params[0], (list, tuple)) else params
+        latency = self._owner._latency
+        latency.sleep(latency.sql_query)
+        with self._owner._lock:
+            if _COLUMNS_QUERY.search(sql):
+                table = args[0] if args else "Contracts"
+                self._cursor.execute(
+                    "SELECT name AS COLUMN_NAME FROM pragma_table_info(?) ORDER BY cid", (table,)
+                )
+            elif _CALL.match(sql):
+                self._call(_CALL.match(sql).group(1), list(args))
+            else:
+                self._cursor.execute(sql, list(args))
+            self.description = self._cursor.description
+        return self
+
+    def _call(self, name: str, args: List[Any]) -> None:
+        if name == "ValidarAccesoPoc":
+            self._cursor.execute(
+                "SELECT AccessId, Activo, Tokens FROM Accesos WHERE AccessId = ? AND PocId = ?", args[:2]
+            )
+        elif name == "RegistrarConsumoPoc":
+            self._cursor.execute(
+                "UPDATE Accesos SET Tokens = Tokens - ? WHERE AccessId = ? AND PocId = ?",
+                (args[2], args[0], args[1]),
+            )
+        else:
+            raise sqlite3.OperationalError(f"Procedimiento desconocido: {name}")
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._cursor.fetchone()
+
+    def fetchall(self) -> List[tuple]:
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        return self._cursor.fetchmany(size)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class FakeConnection:
+    def __init__(self, db: sqlite3.Connection, lock: threading.Lock, latency: LatencyProfile):
+        self._db = db
+        self._lock = lock
+        self._latency = latency
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        with self._lock:
+            self._db.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._db.rollback()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FakeConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Igual que pyodbc: el context manager confirma la transacción, no cierra la conexión.
+        if exc_type is None:
+            self.commit()
+
+
+class FakePyodbc:
+    """Sustituto del módulo ``pyodbc`` con una base SQLite en memoria compartida entre hilos."""
+
+    Error = sqlite3.Error
+
+    def __init__(self, latency: LatencyProfile, rows: int = 500):
+        self.latency = latency
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        _seed_database(self._db, rows)
+
+    def connect(self, conn_str: str, timeout: int = 0, **kwargs: Any) -> FakeConnection:
+        with self._lock:
+            self.connects += 1
+        self.latency.sleep(self.latency.sql_connect)
+        return FakeConnection(self._db, self._lock, self.latency)
+
+
+# ---------- requests (upload endpoint y Microsoft Graph) ----------
+
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, payload: Optional[Dict[str, Any]] = None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = json.dumps(self._payload)
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeRequests:
+    """Sustituto de ``requests`` para el endpoint de carga y Microsoft Graph (token + sendMail)."""
+
+    def __init__(self, latency: LatencyProfile):
+        self.latency = latency
+        self.posts: List[str] = []
+
+    def post(self, url: str, **kwargs: Any) -> FakeResponse:
+        self.posts.append(url)
+        self.latency.sleep(self.latency.http)
+        if "oauth2" in url:
+            return FakeResponse(200, {"access_token": "fake-token", "expires_in": 3600})
+        if "sendMail" in url:
+            return FakeResponse(202)
+        return FakeResponse(200, {"status": "ok"})
@@ -0,0 +1,82 @@
+"""Utilidades comunes: carga de ``backend.services`` sin red, inyección de fakes y estadísticas."""
+
+import importlib
+import os
+import statistics
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from .fakes import FakeDocumentClient, FakeOpenAI, FakePyodbc, FakeRequests, LatencyProfile
+
+FAKE_ENV = {
+    "AZURE_ENDPOINT": "https://fake.cognitiveservices.azure.com/",
+    "AZURE_KEY": "fake-key",
+    "OPENAI_API_KEY": "fake-key",
+    "AZURE_SQL_CONNECTION_STRING": "fake://contracts",
+    "AZURE_SQL_AUTH_CONNECTION_STRING": "fake://auth",
+    "UPLOAD_URL": "http://fake.local/upload",
+    "AZURE_AD_CLIENT_ID": "fake-client",
+    "AZURE_AD_CLIENT_SECRET": "fake-secret",
+    "AZURE_AD_TENANT_ID": "fake-tenant",
+    "MAIL_SENDER": "bench@example.com",
+}
+
+
+@dataclass
+class Fakes:
+    latency: LatencyProfile
+    document_client: FakeDocumentClient
+    openai_client: FakeOpenAI
+    pyodbc: FakePyodbc
+    requests: FakeRequests
+
+
+def load_services():
+    """Importa ``backend.services`` con credenciales falsas (nunca sobrescribe variables ya definidas)."""
+    for key, value in FAKE_ENV.items():
+        os.environ.setdefault(key, value)
+    return importlib.import_module("backend.services")
+
+
+def install_fakes(
+    services: Any, latency: LatencyProfile, pages: int = 3, lines_per_page: int = 40, prefix_cache: bool = True
+) -> Fakes:
+    """Reemplaza los clientes externos de ``services`` por fakes deterministas."""
+    fakes = Fakes(
+        latency=latency,
+        document_client=FakeDocumentClient(latency, pages=pages, lines_per_page=lines_per_page),
+        openai_client=FakeOpenAI(latency, prefix_cache=prefix_cache),
+        pyodbc=FakePyodbc(latency),
+        requests=FakeRequests(latency),
+    )
+    services.configure_clients(
+        document_client=fakes.document_client,
+        openai_client=fakes.openai_client,
+        odbc=fakes.pyodbc,
+        http=fakes.requests,
+    )
+    services.AUTH_CONN_STR = os.environ["AZURE_SQL_AUTH_CONNECTION_STRING"]
+    services.UPLOAD_URL = os.environ["UPLOAD_URL"]
+    return fakes
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], wall_time: float) -> Dict[str, float]:
+    """Resume latencias (segundos) en milisegundos y calcula el throughput sobre el tiempo total."""
+    return {
+        "requests": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time > 0 else 0.0,
+    }
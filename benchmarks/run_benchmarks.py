@@ -0,0 +1,190 @@
+"""Benchmarks end-to-end del API con servicios externos simulados.
+
+Uso:
+    python -m benchmarks.run_benchmarks --output benchmarks/results.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .fakes import LatencyProfile
+from .harness import install_fakes, load_services, summarize
+
+SAMPLE_RESULTS = [
+    {"Contract Number": f"CT-{1000 + i}", "Customer": "Distribuidora Andina", "Payment Value": "4.5%"}
+    for i in range(50)
+]
+
+
+def _sample_pdf(index: int) -> bytes:
+    return b"%PDF-1.4\n% documento de prueba " + str(index).encode("ascii") + b"\n" + bytes(range(256)) * 64
+
+
+def _scenarios(extracted_text: List[Dict[str, Any]]) -> Dict[str, Tuple[str, str, Callable[[int], Dict[str, Any]]]]:
+    """Nombre -> (método, ruta, constructor de kwargs para el cliente HTTP)."""
+    return {
+        "process": (
+            "POST",
+            "/api/process",
+            lambda i: {
+                "files": {"file": (f"contrato_{i}.pdf", _sample_pdf(i), "application/pdf")},
+                "data": {"language": "Spanish"},
+            },
+        ),
+        "chat_document": (
+            "POST",
+            "/api/chat/document",
+            lambda i: {"json": {"extracted_text": extracted_text, "question": f"¿Cuál es la vigencia? ({i})"}},
+        ),
+        "chat_database": (
+            "POST",
+            "/api/chat/database",
+            lambda i: {"json": {"question": f"¿Cuántos contratos hay? ({i})"}},
+        ),
+        "charts": ("POST", "/api/charts", lambda i: {"json": {"prompt": "Contrato A 3%, Contrato B 5%, Contrato C 2%"}}),
+        "auth_consume": (
+            "POST",
+            "/api/auth/consume",
+            lambda i: {"json": {"access_id": "Usuario_IDP", "poc_id": 1, "tokens": 1}},
+        ),
+        "download_json": ("POST", "/api/download/json", lambda i: {"json": {"data": {"results": SAMPLE_RESULTS}}}),
+        "download_csv": ("POST", "/api/download/csv", lambda i: {"json": {"results": SAMPLE_RESULTS}}),
+    }
+
+
+def run_sequential(app: Any, scenarios: Dict[str, Any], iterations: int) -> Dict[str, Dict[str, float]]:
+    from fastapi.testclient import TestClient
+
+    results: Dict[str, Dict[str, float]] = {}
+    with TestClient(app) as client:
+        for name, (method, path, build) in scenarios.items():
+            latencies: List[float] = []
+            wall_start = time.perf_counter()
+            for i in range(iterations):
+                start = time.perf_counter()
+                response = client.request(method, path, **build(i))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+            results[name] = summarize(latencies, time.perf_counter() - wall_start)
+    return results
+
+
+async def _load(app: Any, method: str, path: str, build: Callable[[int], Dict[str, Any]], total: int, concurrency: int):
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method, path, **build(i))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        wall = time.perf_counter() - wall_start
+    summary = summarize(latencies, wall)
+    summary["concurrency"] = concurrency
+    summary["errors"] = errors
+    return summary
+
+
+def run_load(app: Any, scenarios: Dict[str, Any], names: List[str], total: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        method, path, build = scenarios[name]
+        results[f"load_{name}"] = asyncio.run(_load(app, method, path, build, total, concurrency))
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Tabla de diferencias (p50/p95/throughput) entre dos resultados."""
+    lines = [f"{'benchmark':<24}{'metric':<16}{'baseline':>12}{'current':>12}{'delta':>10}"]
+    for name, stats in current.get("benchmarks", {}).items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "throughput_rps"):
+            old, new = base.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            delta = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"{name:<24}{metric:<16}{old:>12.2f}{new:>12.2f}{delta:>10}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="Solicitudes secuenciales por escenario.")
+    parser.add_argument("--requests", type=int, default=40, help="Solicitudes totales por escenario de carga.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="Multiplicador de latencias simuladas.")
+    parser.add_argument("--pages", type=int, default=3, help="Páginas por documento simulado.")
+    parser.add_argument("--only", nargs="*", help="Limitar a estos escenarios.")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados.")
+    parser.add_argument("--compare", help="Archivo JSON de referencia para comparar.")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, repo_root)
+    # Los servicios escriben artefactos relativos (assets/chart.png, processed_images/).
+    os.chdir(tempfile.mkdtemp(prefix="idp-bench-"))
+
+    services = load_services()
+    latency = LatencyProfile(scale=args.latency_scale)
+    fakes = install_fakes(services, latency, pages=args.pages)
+    from backend.api import app
+
+    extracted = [{"text": f"Línea {i} del contrato", "confidence": 0.98, "page": 1 + i // 40} for i in range(120)]
+    scenarios = _scenarios(extracted)
+    if args.only:
+        scenarios = {name: spec for name, spec in scenarios.items() if name in args.only}
+
+    benchmarks = run_sequential(app, scenarios, args.iterations)
+    load_names = [name for name in ("process", "chat_database", "chat_document") if name in scenarios]
+    benchmarks.update(run_load(app, scenarios, load_names, args.requests, args.concurrency))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "latency_scale": args.latency_scale,
+            "iterations": args.iterations,
+            "pages": args.pages,
+            "openai_calls": len(fakes.openai_client.calls),
+            "di_calls": fakes.document_client.calls,
+            "sql_connects": fakes.pyodbc.connects,
+        },
+        "benchmarks": benchmarks,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if output:
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as fh:
+            print("\n".join(compare(report, json.load(fh))))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -13,3 +13,16 @@ export const formClient = axios.create({
   baseURL,
   headers: { 'Content-Type': 'multipart/form-data' },
 })
+
+// Identidad del usuario para la cuota y el reparto justo del backend (headers X-Access-Id / X-Poc-Id).
+export const setIdentity = (identity: { accessId: string; pocId: number } | null) => {
+  for (const client of [apiClient, formClient]) {
+    if (identity) {
+      client.defaults.headers.common['X-Access-Id'] = identity.accessId
+      client.defaults.headers.common['X-Poc-Id'] = String(identity.pocId)
+    } else {
+      delete client.defaults.headers.common['X-Access-Id']
+      delete client.defaults.headers.common['X-Poc-Id']
+    }
+  }
+}
@@ -1,5 +1,5 @@
 import { apiClient, formClient } from './client'
-import { ProcessedDocument } from '../types'
+import { ChartSpec, CompactExtractedText, ComparisonReport, ExtractedLine, ProcessedDocument } from '../types'
 
 export const warmupDatabases = async () => {
   try {
@@ -26,9 +26,26 @@ export const consumeTokens = async (accessId: string, tokens = 1, pocId = 1) =>
   return data
 }
 
+export const expandExtractedText = (compact: CompactExtractedText): ExtractedLine[] => {
+  const lines: ExtractedLine[] = []
+  compact.pages.forEach((page, i) => {
+    for (let index = compact.page_offsets[i]; index < compact.page_offsets[i + 1]; index++) {
+      const confidence = Array.isArray(compact.confidence) ? compact.confidence[index] : compact.confidence
+      lines.push({ text: compact.text[index], confidence, page })
+    }
+  })
+  return lines
+}
+
 export const processDocument = async (
   file: File,
-  options: { language?: string; customPrompt?: string }
+  options: {
+    language?: string
+    customPrompt?: string
+    reuseNearDuplicates?: boolean
+    batchId?: string
+    compactText?: boolean
+  }
 ): Promise<ProcessedDocument> => {
   const formData = new FormData()
   formData.append('file', file)
@@ -38,9 +55,22 @@ export const processDocument = async (
   if (options.customPrompt) {
     formData.append('custom_prompt', options.customPrompt)
   }
+  if (options.reuseNearDuplicates) {
+    formData.append('reuse_near_duplicates', 'true')
+  }
+  if (options.batchId) {
+    formData.append('batch_id', options.batchId)
+  }
 
-  const { data } = await formClient.post<ProcessedDocument>('/process', formData)
-  return data
+  if (options.compactText) {
+    formData.append('text_format', 'columnar')
+  }
+
+  const { data } = await formClient.post<
+    Omit<ProcessedDocument, 'extracted_text'> & { extracted_text: ExtractedLine[] | CompactExtractedText }
+  >('/process', formData)
+  const extracted = data.extracted_text
+  return { ...data, extracted_text: Array.isArray(extracted) ? extracted : expandExtractedText(extracted) }
 }
 
 export const chatWithDocument = async (
@@ -55,7 +85,71 @@ export const chatWithDocument = async (
 }
 
 export const chatWithDatabase = async (question: string) => {
-  const { data } = await apiClient.post<{ answer: string }>('/chat/database', { question })
+  const { data } = await apiClient.post<{
+    answer: string
+    sql?: string
+    columns?: string[]
+    rows?: Record<string, unknown>[]
+    row_count?: number
+    answered_locally?: boolean
+  }>('/chat/database', { question })
+  return data
+}
+
+export const chatWithSpreadsheet = async (
+  question: string,
+  source: { file?: File; tableId?: string },
+  language?: string
+) => {
+  const formData = new FormData()
+  formData.append('question', question)
+  if (source.file) {
+    formData.append('file', source.file)
+  } else if (source.tableId) {
+    formData.append('table_id', source.tableId)
+  }
+  if (language) {
+    formData.append('language', language)
+  }
+
+  const { data } = await formClient.post<{
+    answer: string
+    sql: string
+    columns: string[]
+    rows: Record<string, unknown>[]
+    row_count: number
+    answered_locally: boolean
+    table: {
+      table_id: string
+      file_name: string
+      table: string
+      row_count: number
+      columns: { name: string; type: string }[]
+    }
+  }>('/chat/spreadsheet', formData)
+  return data
+}
+
+export const validateResults = async (expected: File, results: unknown[], keys?: string[]) => {
+  const formData = new FormData()
+  formData.append('expected', expected)
+  formData.append('results', JSON.stringify(results))
+  if (keys?.length) {
+    formData.append('keys', keys.join(','))
+  }
+
+  const { data } = await formClient.post<{
+    summary: {
+      rows: number
+      found: number
+      expected_rows: number
+      duplicate_expected_keys: number
+      keys: string[]
+      fields: Record<string, { matched: number; rate: number }>
+    }
+    columns: string[]
+    rows: Record<string, unknown>[]
+  }>('/validate', formData)
   return data
 }
 
@@ -66,6 +160,23 @@ export const generateChart = async (prompt: string) => {
   return data
 }
 
+export const renderChart = async (chart: ChartSpec) => {
+  const { data } = await apiClient.post<{ image: string; description: string }>('/charts', { chart })
+  return data
+}
+
+export const compareDocuments = async (
+  documents: Pick<ProcessedDocument, 'openai_response' | 'file_name'>[],
+  options: { keys?: string[]; groupBy?: string } = {}
+) => {
+  const { data } = await apiClient.post<ComparisonReport>('/compare', {
+    documents: documents.map(({ openai_response, file_name }) => ({ openai_response, file_name })),
+    keys: options.keys,
+    group_by: options.groupBy,
+  })
+  return data
+}
+
 export const downloadJson = async (payload: any) => {
   const { data } = await apiClient.post('/download/json', { data: payload }, { responseType: 'blob' })
   return data
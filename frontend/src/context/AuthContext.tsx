@@ -1,6 +1,7 @@
 import { createContext, useContext, useMemo, useState, ReactNode } from 'react'
 import type { AxiosError } from 'axios'
 import { authLogin, consumeTokens } from '../api/contracts'
+import { setIdentity } from '../api/client'
 
 type User = { name: string; accessId: string; pocId: number; tokens: number }
 
@@ -22,6 +23,7 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
   const login = async ({ accessId }: { accessId: string }) => {
     try {
       const data = await authLogin(accessId)
+      setIdentity({ accessId: data.access_id, pocId: data.poc_id })
       setUser({
         name: accessId,
         accessId: data.access_id,
@@ -57,7 +59,10 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
     )
   }
 
-  const logout = () => setUser(null)
+  const logout = () => {
+    setIdentity(null)
+    setUser(null)
+  }
 
   const value = useMemo(
     () => ({
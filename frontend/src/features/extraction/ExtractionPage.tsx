@@ -17,7 +17,11 @@ export function ExtractionPage() {
     mutationFn: async () => {
       if (!file) throw new Error('Selecciona un archivo')
       if (tokensRemaining <= 0) throw new Error('Sin creditos disponibles')
-      const result = await processDocument(file, { language: undefined, customPrompt: customPrompt || undefined })
+      const result = await processDocument(file, {
+        language: undefined,
+        customPrompt: customPrompt || undefined,
+        compactText: true,
+      })
       const backendTokens = Number(result.metrics?.tokens_to_consume || 0)
       const usageTokens = Math.ceil(Number(result.metrics?.openai_tokens || 0) / 1000)
       const tokensToConsume = Math.max(1, backendTokens || usageTokens || 1)
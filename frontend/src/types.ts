@@ -4,6 +4,15 @@ export interface ExtractedLine {
   page?: number
 }
 
+// extracted_text con text_format=columnar: lineas de pages[i] = text[page_offsets[i]..page_offsets[i + 1]].
+export interface CompactExtractedText {
+  format: 'columnar'
+  pages: number[]
+  page_offsets: number[]
+  text: string[]
+  confidence: number | number[]
+}
+
 export interface Metrics {
   textract_duration: number
   openai_duration: number
@@ -17,6 +26,10 @@ export interface Metrics {
   }
   openai_tokens?: number
   tokens_to_consume?: number
+  near_duplicates?: {
+    matches: { document: string; file_name: string; similarity: number; batch_id?: string | null; same_batch: boolean }[]
+    reused_from: string | null
+  } | null
 }
 
 export interface ProcessedDocument {
@@ -31,3 +44,38 @@ export interface ChatMessage {
   role: 'user' | 'assistant'
   content: string
 }
+
+// Grafico ya estructurado: /api/charts lo dibuja sin modelo.
+export interface ChartSpec {
+  type: 'bar' | 'box' | 'timeline'
+  title: string
+  x_label?: string
+  y_label?: string
+  categories: string[]
+  series: { name: string; values: (number | number[] | [string, string | null])[] }[]
+}
+
+export interface ComparisonReport {
+  summary: {
+    documents: number
+    contracts: number
+    rows: number
+    keys: string[]
+    group_by: string
+    contracts_in_several_documents: number
+    differences: number
+    overlaps: number
+    conflicts: number
+    max_rows: number
+  }
+  differences: {
+    contract: string
+    field: string
+    payment_type?: string | null
+    values: { document: string; value: unknown }[]
+  }[]
+  overlaps: Record<string, unknown>[]
+  distribution: Record<string, unknown>[]
+  conflicts: ({ kind: 'same_contract' | 'overlapping_terms' } & Record<string, unknown>)[]
+  charts?: ChartSpec[]
+}